@@ -0,0 +1,143 @@
+"""Benchmark memory and throughput of OrderAggregate against ORM order graphs.
+
+Builds a batch of synthetic orders (lines, refunds, transactions with fees)
+twice, as transient ORM ``Order`` graphs and as ``OrderAggregate`` rows as
+``load_order_aggregates`` would, measures the memory each batch holds with
+``tracemalloc`` and times profit calculation over both. No database needed.
+
+Run from ``apps/api``::
+
+    python -m benchmarks.order_aggregate --orders 100000 --lines 3
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from src.db.models import Order, OrderLine, RefundLine, Transaction, TransactionFee
+from src.services.order_aggregate import OrderAggregate
+from src.services.profit_calculator import ProfitCalculator
+from src.services.settings_cache import ShopProfitSettings
+
+GATEWAYS = ('shopify_payments', 'paypal', 'manual')
+
+
+def build_rows(order_count: int, line_count: int) -> list:
+    """Build plain per-order tuples shared by both representations."""
+    now = datetime.now(timezone.utc)
+    rows = []
+    for index in range(order_count):
+        lines = [
+            (str(index * 100 + line), 1 + line % 2, Decimal('7.50') if (index + line) % 10 else None)
+            for line in range(line_count)
+        ]
+        refunds = [(lines[0][0], 1, Decimal('12.00'))] if index % 8 == 0 else []
+        transactions = [
+            (GATEWAYS[index % len(GATEWAYS)], 'Visa', 'success', Decimal('1.25') if index % 2 else None)
+        ]
+        rows.append((
+            uuid.uuid4(), now, 'USD', 'EUR' if index % 5 == 0 else 'USD',
+            Decimal('25.00') * line_count, lines, refunds, transactions,
+        ))
+    return rows
+
+
+def build_orm_graphs(rows: list) -> list:
+    """Build transient ORM order graphs."""
+    orders = []
+    for order_id, processed_at, currency, presentment, total, lines, refunds, transactions in rows:
+        order = Order(
+            id=order_id, processed_at=processed_at, currency=currency,
+            presentment_currency=presentment, current_total_price=total
+        )
+        order.lines = [
+            OrderLine(line_id=line_id, quantity=quantity, effective_unit_cost=unit_cost)
+            for line_id, quantity, unit_cost in lines
+        ]
+        order.refunds = [
+            RefundLine(line_id=line_id, refunded_quantity=quantity, refunded_amount=amount)
+            for line_id, quantity, amount in refunds
+        ]
+        order.transactions = []
+        for gateway, card_brand, status, fee in transactions:
+            transaction = Transaction(gateway=gateway, card_brand=card_brand, status=status)
+            transaction.fees = [TransactionFee(fee_amount=fee, estimated=False)] if fee else []
+            order.transactions.append(transaction)
+        orders.append(order)
+    return orders
+
+
+def build_aggregates(rows: list) -> list:
+    """Build aggregates the way load_order_aggregates does."""
+    aggregates = []
+    for order_id, processed_at, currency, presentment, total, lines, refunds, transactions in rows:
+        aggregate = OrderAggregate(order_id, processed_at, currency, presentment, total)
+        for line_id, quantity, unit_cost in lines:
+            aggregate.lines.append((line_id, quantity, unit_cost))
+        for line_id, quantity, amount in refunds:
+            aggregate.add_refund(line_id, quantity, amount)
+        for gateway, card_brand, status, fee in transactions:
+            aggregate.add_transaction(gateway, card_brand, status, fee or Decimal('0'), False)
+        aggregates.append(aggregate)
+    return aggregates
+
+
+def measure(label: str, build, calculate, rows: list) -> list:
+    """Print retained memory, build time and calculation throughput."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    batch = build(rows)
+    build_seconds = time.perf_counter() - started
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    results = [calculate(item) for item in batch]
+    calculate_seconds = time.perf_counter() - started
+
+    print(f"{label}:")
+    print(f"  memory:     {retained / 2 ** 20:.1f} MiB ({retained / len(rows):.0f} bytes/order)")
+    print(f"  build:      {build_seconds:.3f}s")
+    print(f"  calculate:  {calculate_seconds:.3f}s ({len(rows) / calculate_seconds:.0f} orders/sec)")
+    return results
+
+
+def run(order_count: int, line_count: int, skip_orm: bool) -> None:
+    """Measure both representations for one batch."""
+    calculator = ProfitCalculator()
+    shop_settings = ShopProfitSettings(uuid.uuid4(), None)
+    rows = build_rows(order_count, line_count)
+    print(f"orders: {order_count}, lines/order: {line_count}")
+
+    aggregate_results = measure(
+        "OrderAggregate", build_aggregates,
+        lambda aggregate: calculator._calculate_aggregate_profit(aggregate, shop_settings), rows
+    )
+    if skip_orm:
+        return
+
+    orm_results = measure(
+        "ORM graphs", build_orm_graphs,
+        lambda order: calculator._calculate_profit(order, shop_settings), rows
+    )
+    mismatches = sum(1 for a, b in zip(aggregate_results, orm_results) if a != b)
+    print(f"mismatches: {mismatches}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark OrderAggregate memory and throughput.")
+    parser.add_argument("--orders", type=int, default=100000, help="Orders per batch")
+    parser.add_argument("--lines", type=int, default=3, help="Lines per order")
+    parser.add_argument("--skip-orm", action="store_true", help="Only measure aggregates")
+    args = parser.parse_args()
+
+    run(args.orders, args.lines, args.skip_orm)
+
+
+if __name__ == "__main__":
+    main()
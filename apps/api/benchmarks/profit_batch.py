@@ -0,0 +1,84 @@
+"""Benchmark batched profit calculation against the per-order loop.
+
+Computes profit for every order a shop processed in the last N days, once
+with ``calculate_order_profit`` per order and once with
+``calculate_orders_profit``, checks the results match and prints timings.
+
+Run from ``apps/api``::
+
+    python -m benchmarks.profit_batch --shop example.myshopify.com --days 30
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from src.db.database import AsyncSessionLocal, engine
+from src.db.models import Order, Shop
+from src.services.profit_calculator import ProfitCalculator
+
+
+async def run(shop_domain: str, days: int) -> None:
+    """Time both approaches for one shop and period."""
+    calculator = ProfitCalculator()
+    end = datetime.now(timezone.utc)
+    date_range = {'start': end - timedelta(days=days), 'end': end}
+
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Shop).where(Shop.shop_domain == shop_domain))
+            shop = result.scalar_one()
+            result = await db.execute(
+                select(Order).where(
+                    Order.shop_id == shop.id,
+                    Order.processed_at >= date_range['start'],
+                    Order.processed_at <= date_range['end']
+                )
+            )
+            orders = result.scalars().all()
+
+        if not orders:
+            print("No orders in range")
+            return
+
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            per_order = {
+                order.id: await calculator.calculate_order_profit(db, order)
+                for order in orders
+            }
+            loop_seconds = time.perf_counter() - started
+
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            columns = await calculator.calculate_orders_profit(db, shop.id, date_range=date_range)
+            batch_seconds = time.perf_counter() - started
+
+        mismatches = sum(
+            1 for index, order_id in enumerate(columns.order_ids)
+            if columns.row(index) != per_order.get(order_id)
+        )
+
+        print(f"orders:          {len(orders)}")
+        print(f"per-order loop:  {loop_seconds:.3f}s ({len(orders) / loop_seconds:.1f} orders/sec)")
+        print(f"batched:         {batch_seconds:.3f}s ({len(columns) / batch_seconds:.1f} orders/sec)")
+        print(f"speedup:         {loop_seconds / batch_seconds:.1f}x")
+        print(f"mismatches:      {mismatches}")
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark batched profit calculation.")
+    parser.add_argument("--shop", required=True, help="Shop domain")
+    parser.add_argument("--days", type=int, default=30, help="Days of orders to include")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.shop, args.days))
+
+
+if __name__ == "__main__":
+    main()
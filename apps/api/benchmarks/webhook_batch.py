@@ -0,0 +1,165 @@
+"""Benchmark queued webhook throughput against micro-batch size.
+
+Enqueues synthetic order deliveries for a throwaway shop, drains them with a
+worker pool at each batch size and prints events/sec. Needs a database with
+the schema created (``init_db``).
+
+Run from ``apps/api``::
+
+    python -m benchmarks.webhook_batch --events 2000 --batch-sizes 1,10,50,100,250
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import delete
+
+from src.config.settings import get_settings
+from src.db.database import AsyncSessionLocal, engine
+from src.db.models import InventoryItemCostSnapshot, Shop, WebhookQueueItem
+from src.webhooks.queue import get_partition, get_queue_depth
+from src.webhooks.coalescer import get_coalesce_key
+from src.webhooks.worker import WebhookWorkerPool
+
+settings = get_settings()
+
+INVENTORY_ITEMS = 50
+
+
+def build_order_payload(order_id: int, line_count: int) -> dict:
+    """Build a minimal orders/create payload."""
+    now = datetime.now(timezone.utc).isoformat()
+    line_items = [
+        {
+            'id': order_id * 100 + index,
+            'product_id': index,
+            'variant_id': index,
+            'inventory_item_id': (order_id + index) % INVENTORY_ITEMS,
+            'quantity': 1,
+            'price_set': {'shop_money': {'amount': '25.00', 'currency_code': 'USD'}},
+        }
+        for index in range(line_count)
+    ]
+    return {
+        'id': order_id,
+        'order_number': order_id,
+        'created_at': now,
+        'updated_at': now,
+        'processed_at': now,
+        'currency': 'USD',
+        'total_price': str(Decimal('25.00') * line_count),
+        'financial_status': 'paid',
+        'line_items': line_items,
+        'transactions': [
+            {
+                'id': order_id,
+                'order_id': order_id,
+                'gateway': 'shopify_payments',
+                'status': 'success',
+                'amount': str(Decimal('25.00') * line_count),
+                'currency': 'USD',
+                'processed_at': now,
+            }
+        ],
+    }
+
+
+async def create_shop() -> Shop:
+    """Create a throwaway shop with cost snapshots for every inventory item."""
+    async with AsyncSessionLocal() as db:
+        shop = Shop(
+            shop_domain=f"bench-{uuid.uuid4().hex[:12]}.myshopify.com",
+            access_token="bench",
+            scopes=[],
+        )
+        db.add(shop)
+        await db.flush()
+        effective_date = datetime.now(timezone.utc) - timedelta(days=365)
+        db.add_all([
+            InventoryItemCostSnapshot(
+                shop_id=shop.id,
+                inventory_item_id=str(item_id),
+                effective_date=effective_date,
+                unit_cost=Decimal('10.00'),
+                currency='USD',
+                source='csv',
+            )
+            for item_id in range(INVENTORY_ITEMS)
+        ])
+        await db.commit()
+        return shop
+
+
+async def enqueue_orders(shop: Shop, first_order_id: int, count: int, line_count: int) -> None:
+    """Enqueue ``count`` orders/create deliveries directly into the queue."""
+    received_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    async with AsyncSessionLocal() as db:
+        for order_id in range(first_order_id, first_order_id + count):
+            body = json.dumps(build_order_payload(order_id, line_count)).encode('utf-8')
+            db.add(WebhookQueueItem(
+                topic="orders/create",
+                shop_domain=shop.shop_domain,
+                coalesce_key=get_coalesce_key("orders/create", str(order_id)),
+                partition=get_partition(shop.shop_domain, str(order_id)),
+                headers={'x-shopify-webhook-id': uuid.uuid4().hex},
+                body=body,
+                received_at=received_at,
+                available_at=received_at,
+            ))
+        await db.commit()
+
+
+async def drain(batch_size: int) -> float:
+    """Drain the queue with a worker pool, returning elapsed seconds."""
+    pool = WebhookWorkerPool(batch_size=batch_size, flush_interval_ms=0, poll_interval_ms=50)
+    started = time.perf_counter()
+    task = asyncio.create_task(pool.run())
+    try:
+        while True:
+            async with AsyncSessionLocal() as db:
+                if await get_queue_depth(db) == 0:
+                    break
+            await asyncio.sleep(0.05)
+    finally:
+        pool.stop()
+        await task
+    return time.perf_counter() - started
+
+
+async def run(events: int, batch_sizes: list, line_count: int) -> None:
+    """Run the benchmark for each batch size and print a table."""
+    # Measure raw throughput, not the debounce window
+    settings.webhook_coalesce_window_ms = 0
+
+    shop = await create_shop()
+    print(f"{'batch_size':>10} {'events':>8} {'seconds':>9} {'events/sec':>11}")
+    try:
+        for index, batch_size in enumerate(batch_sizes):
+            await enqueue_orders(shop, index * events + 1, events, line_count)
+            elapsed = await drain(batch_size)
+            print(f"{batch_size:>10} {events:>8} {elapsed:>9.2f} {events / elapsed:>11.1f}")
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Shop).where(Shop.id == shop.id))
+            await db.commit()
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark webhook micro-batching.")
+    parser.add_argument("--events", type=int, default=2000, help="Deliveries per batch size")
+    parser.add_argument("--batch-sizes", default="1,10,50,100,250", help="Comma-separated batch sizes")
+    parser.add_argument("--lines", type=int, default=3, help="Line items per order")
+    args = parser.parse_args()
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    asyncio.run(run(args.events, batch_sizes, args.lines))
+
+
+if __name__ == "__main__":
+    main()
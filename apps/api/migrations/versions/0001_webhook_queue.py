@@ -0,0 +1,44 @@
+"""Add the durable webhook ingest queue
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created by init_db already have the table
+    if sa.inspect(op.get_bind()).has_table('webhook_queue'):
+        return
+
+    op.create_table(
+        'webhook_queue',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True,
+                  server_default=sa.text('gen_random_uuid()')),
+        sa.Column('topic', sa.String(100), nullable=False),
+        sa.Column('shop_domain', sa.String(255), nullable=False),
+        sa.Column('headers', postgresql.JSONB(), nullable=False, server_default='{}'),
+        sa.Column('body', sa.LargeBinary(), nullable=False),
+        sa.Column('received_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('available_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.Text(), nullable=True),
+    )
+    op.create_index('idx_webhook_queue_available_at', 'webhook_queue', ['available_at'])
+    op.create_index('idx_webhook_queue_shop_domain', 'webhook_queue', ['shop_domain'])
+
+
+def downgrade() -> None:
+    op.drop_table('webhook_queue')
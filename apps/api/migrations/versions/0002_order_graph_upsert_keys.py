@@ -0,0 +1,65 @@
+"""Add the natural keys the order graph upserts conflict on
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# (table, constraint, key columns)
+UPSERT_KEYS = (
+    ('order_lines', 'uq_order_lines_order_line', ('order_id', 'line_id')),
+    ('refund_lines', 'uq_refund_lines_order_refund_line', ('order_id', 'refund_line_id')),
+    ('transactions', 'uq_transactions_order_transaction', ('order_id', 'shop_transaction_id')),
+    ('transaction_fees', 'uq_transaction_fees_transaction', ('transaction_id',)),
+)
+
+
+def _constraint_exists(connection, name: str) -> bool:
+    return connection.execute(
+        sa.text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": name}
+    ).first() is not None
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    # Shopify ids of refund lines and transactions; existing rows stay NULL,
+    # which never conflicts
+    op.execute("ALTER TABLE refund_lines ADD COLUMN IF NOT EXISTS refund_line_id VARCHAR(50)")
+    op.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS shop_transaction_id VARCHAR(50)")
+
+    for table, constraint, columns in UPSERT_KEYS:
+        # Databases created by init_db already have the constraint
+        if _constraint_exists(connection, constraint):
+            continue
+
+        # Earlier processing inserted a fresh copy of the graph on every
+        # delivery; keep the newest row per key
+        key = ", ".join(columns)
+        not_null = " AND ".join(f"{column} IS NOT NULL" for column in columns)
+        op.execute(
+            f"DELETE FROM {table} WHERE id IN ("
+            f"SELECT id FROM ("
+            f"SELECT id, row_number() OVER (PARTITION BY {key} ORDER BY created_at DESC, id DESC) AS copy "
+            f"FROM {table} WHERE {not_null}"
+            f") copies WHERE copy > 1"
+            f")"
+        )
+        op.create_unique_constraint(constraint, table, list(columns))
+
+
+def downgrade() -> None:
+    for table, constraint, _ in reversed(UPSERT_KEYS):
+        op.drop_constraint(constraint, table, type_='unique')
+    op.drop_column('transactions', 'shop_transaction_id')
+    op.drop_column('refund_lines', 'refund_line_id')
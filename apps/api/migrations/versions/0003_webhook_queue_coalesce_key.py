@@ -0,0 +1,31 @@
+"""Key queued webhooks by (shop, order) for coalescing
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # IF [NOT] EXISTS: databases created by init_db are already in this shape
+    op.execute("ALTER TABLE webhook_queue ADD COLUMN IF NOT EXISTS coalesce_key VARCHAR(50)")
+    op.execute("DROP INDEX IF EXISTS idx_webhook_queue_shop_domain")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_webhook_queue_shop_coalesce_key "
+        "ON webhook_queue (shop_domain, coalesce_key)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_webhook_queue_shop_coalesce_key', table_name='webhook_queue')
+    op.create_index('idx_webhook_queue_shop_domain', 'webhook_queue', ['shop_domain'])
+    op.drop_column('webhook_queue', 'coalesce_key')
@@ -0,0 +1,25 @@
+"""Store Shopify's updated_at on orders as the row version
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # IF NOT EXISTS: databases created by init_db already have the column.
+    # Existing orders stay NULL, which any delivery may overwrite.
+    op.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS shop_updated_at TIMESTAMPTZ")
+
+
+def downgrade() -> None:
+    op.drop_column('orders', 'shop_updated_at')
@@ -0,0 +1,32 @@
+"""Assign queued webhooks to worker partitions
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # IF [NOT] EXISTS: databases created by init_db are already in this shape.
+    # Items queued before the upgrade land in partition 0.
+    op.execute("ALTER TABLE webhook_queue ADD COLUMN IF NOT EXISTS partition INTEGER NOT NULL DEFAULT 0")
+    op.execute("DROP INDEX IF EXISTS idx_webhook_queue_available_at")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_webhook_queue_partition_available_at "
+        "ON webhook_queue (partition, available_at)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_webhook_queue_partition_available_at', table_name='webhook_queue')
+    op.create_index('idx_webhook_queue_available_at', 'webhook_queue', ['available_at'])
+    op.drop_column('webhook_queue', 'partition')
@@ -0,0 +1,25 @@
+"""Keep compressed webhook payloads for replay
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # IF NOT EXISTS: databases created by init_db already have the column.
+    # Events received before the upgrade have no payload and are not replayable.
+    op.execute("ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS payload BYTEA")
+
+
+def downgrade() -> None:
+    op.drop_column('webhook_events', 'payload')
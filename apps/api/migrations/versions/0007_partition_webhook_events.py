@@ -0,0 +1,132 @@
+"""Range-partition webhook_events by received_at
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 00:00:00
+
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+# Matches db/partitions.py; the worker creates later partitions
+PARTITIONS_AHEAD_DAYS = 7
+
+COLUMN_LIST = (
+    "id, shop_id, topic, shop_resource_id, received_at, processed_at, "
+    "dedup_key, status, error, payload"
+)
+
+
+def _relkind(connection) -> str:
+    return connection.execute(
+        sa.text("SELECT relkind::text FROM pg_class WHERE relname = 'webhook_events' AND relkind IN ('r', 'p')")
+    ).scalar()
+
+
+def _create_webhook_events(partitioned: bool) -> None:
+    columns = [
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False,
+                  server_default=sa.text('gen_random_uuid()')),
+        sa.Column('shop_id', postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('shops.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('topic', sa.String(100), nullable=False),
+        sa.Column('shop_resource_id', sa.String(50), nullable=False),
+        sa.Column('received_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('dedup_key', sa.String(255), nullable=False),
+        sa.Column('status', postgresql.ENUM(name='webhook_status_enum', create_type=False),
+                  nullable=False, server_default='pending'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('payload', sa.LargeBinary(), nullable=True),
+    ]
+    if partitioned:
+        # The partition key must be part of every unique constraint, so the
+        # primary key widens to (id, received_at) and dedup_key is no longer
+        # unique; the advisory lock in the webhook handler takes its place
+        op.create_table(
+            'webhook_events', *columns,
+            sa.PrimaryKeyConstraint('id', 'received_at'),
+            postgresql_partition_by='RANGE (received_at)'
+        )
+    else:
+        op.create_table(
+            'webhook_events', *columns,
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('dedup_key', name='webhook_events_dedup_key_key')
+        )
+    op.create_index('idx_webhook_events_shop_status', 'webhook_events', ['shop_id', 'status'])
+    op.create_index('idx_webhook_events_dedup_key', 'webhook_events', ['dedup_key'])
+    op.create_index('idx_webhook_events_received_at', 'webhook_events', ['received_at'])
+
+
+def _rename_legacy_table() -> None:
+    # Index and constraint names are schema-wide, so free them up for the new table
+    op.rename_table('webhook_events', 'webhook_events_legacy')
+    op.execute("ALTER TABLE webhook_events_legacy RENAME CONSTRAINT webhook_events_pkey TO webhook_events_legacy_pkey")
+    op.execute("ALTER TABLE webhook_events_legacy DROP CONSTRAINT IF EXISTS webhook_events_dedup_key_key")
+    for index in ('idx_webhook_events_shop_status', 'idx_webhook_events_dedup_key', 'idx_webhook_events_received_at'):
+        op.drop_index(index, table_name='webhook_events_legacy')
+
+
+def _create_partition(day: date) -> None:
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS webhook_events_p{day:%Y%m%d} PARTITION OF webhook_events "
+        f"FOR VALUES FROM ('{day.isoformat()} 00:00:00+00') "
+        f"TO ('{(day + timedelta(days=1)).isoformat()} 00:00:00+00')"
+    )
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    # Databases created by init_db already have the partitioned table
+    if _relkind(connection) == 'p':
+        return
+
+    # Copy and swap: rows cannot be moved into a partitioned table in place.
+    # The copy holds an exclusive lock on the old table, so stop ingest (or
+    # expect webhook requests to wait) while this runs.
+    _rename_legacy_table()
+    _create_webhook_events(partitioned=True)
+
+    legacy_days = connection.execute(sa.text(
+        "SELECT DISTINCT (received_at AT TIME ZONE 'UTC')::date FROM webhook_events_legacy"
+    )).scalars().all()
+    today = datetime.now(timezone.utc).date()
+    upcoming_days = [today + timedelta(days=offset) for offset in range(-1, PARTITIONS_AHEAD_DAYS + 1)]
+    for day in sorted(set(legacy_days) | set(upcoming_days)):
+        _create_partition(day)
+
+    op.execute(
+        f"INSERT INTO webhook_events ({COLUMN_LIST}) "
+        f"SELECT {COLUMN_LIST} FROM webhook_events_legacy"
+    )
+    op.drop_table('webhook_events_legacy')
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if _relkind(connection) != 'p':
+        return
+
+    _rename_legacy_table()
+    _create_webhook_events(partitioned=False)
+
+    # dedup_key becomes unique again; keep the first delivery of each key
+    op.execute(
+        f"INSERT INTO webhook_events ({COLUMN_LIST}) "
+        f"SELECT DISTINCT ON (dedup_key) {COLUMN_LIST} FROM webhook_events_legacy "
+        f"ORDER BY dedup_key, received_at, id"
+    )
+    # Dropping the parent drops its partitions
+    op.drop_table('webhook_events_legacy')
@@ -0,0 +1,59 @@
+"""Store each order's last profit breakdown for delta rollups
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created by init_db already have the table
+    if sa.inspect(op.get_bind()).has_table('order_profit'):
+        return
+
+    op.create_table(
+        'order_profit',
+        sa.Column('order_id', postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('orders.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('shop_id', postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('shops.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('date', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('net_revenue', sa.Numeric(12, 2), nullable=False, server_default='0'),
+        sa.Column('cogs', sa.Numeric(12, 2), nullable=False, server_default='0'),
+        sa.Column('fees', sa.Numeric(12, 2), nullable=False, server_default='0'),
+        sa.Column('shipping_cost', sa.Numeric(12, 2), nullable=False, server_default='0'),
+        sa.Column('ad_spend', sa.Numeric(12, 2), nullable=False, server_default='0'),
+        sa.Column('net_profit', sa.Numeric(12, 2), nullable=False, server_default='0'),
+        sa.Column('margin_pct', sa.Numeric(12, 2), nullable=False, server_default='0'),
+        sa.Column('flags', postgresql.JSONB(), nullable=False, server_default='{}'),
+        sa.Column('calculated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index('idx_order_profit_shop_date', 'order_profit', ['shop_id', 'date'])
+
+    # Rollups now hold the sum of order_profit rows, and storing an order
+    # applies new minus old. Totals written before this revision have no
+    # rows to subtract, so clear the order-derived components (keeping the
+    # ad spend). Rebuild them once this has run, per shop or for every shop:
+    #
+    #     python -m src.services.rollup_rebuild [--shop example.myshopify.com]
+    op.execute(
+        "UPDATE rollups_daily SET "
+        "net_revenue = 0, cogs = 0, fees = 0, shipping_cost = 0, margin_pct = 0, "
+        "net_profit = -(SELECT coalesce(sum(value::numeric), 0) FROM jsonb_each_text(ad_spend)), "
+        "updated_at = now()"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('order_profit')
@@ -0,0 +1,66 @@
+"""Add normalized money columns alongside the JSONB price sets
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+# (table, JSONB money set column, shop amount column, presentment amount column)
+MONEY_COLUMNS = (
+    ('order_lines', 'price_set', 'price', 'presentment_price'),
+    ('refund_lines', 'refunded_amount_set', 'refunded_amount', 'presentment_refunded_amount'),
+    ('transactions', 'amount_set', 'amount', 'presentment_amount'),
+    ('transaction_fees', 'fee_amount_set', 'fee_amount', 'presentment_fee_amount'),
+)
+
+# Rows updated per backfill statement and commit, to keep each UPDATE small
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    for table, money_set, shop_column, presentment_column in MONEY_COLUMNS:
+        # IF NOT EXISTS: databases created by init_db already have the columns
+        op.execute(
+            f"ALTER TABLE {table} "
+            f"ADD COLUMN IF NOT EXISTS {shop_column} NUMERIC(10, 2), "
+            f"ADD COLUMN IF NOT EXISTS {presentment_column} NUMERIC(10, 2)"
+        )
+
+        # Same fallbacks as utils.currency.extract_money_amounts
+        shop_amount = f"({money_set}->'shop_money'->>'amount')::numeric"
+        presentment_amount = f"({money_set}->'presentment_money'->>'amount')::numeric"
+        backfill = sa.text(
+            f"UPDATE {table} SET "
+            f"{shop_column} = COALESCE({shop_amount}, {presentment_amount}, 0), "
+            f"{presentment_column} = COALESCE({presentment_amount}, {shop_amount}, 0) "
+            f"WHERE id IN ("
+            f"SELECT id FROM {table} WHERE {shop_column} IS NULL LIMIT {BACKFILL_BATCH_SIZE}"
+            f")"
+        )
+        # Commit each batch on its own, so a large table is never held
+        # locked or rewritten in one long transaction; the columns are added
+        # (and committed) first, and a rerun picks up where this stopped
+        with op.get_context().autocommit_block():
+            while connection.execute(backfill).rowcount:
+                pass
+
+        op.alter_column(table, shop_column, nullable=False)
+        op.alter_column(table, presentment_column, nullable=False)
+
+
+def downgrade() -> None:
+    for table, _, shop_column, presentment_column in MONEY_COLUMNS:
+        op.drop_column(table, presentment_column)
+        op.drop_column(table, shop_column)
@@ -0,0 +1,25 @@
+"""Add card brand to transactions for fee rule matching
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # IF NOT EXISTS: databases created by init_db already have the column.
+    # Existing rows stay NULL until their transactions are re-delivered.
+    op.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS card_brand VARCHAR(50)")
+
+
+def downgrade() -> None:
+    op.drop_column('transactions', 'card_brand')
@@ -4,12 +4,12 @@ from typing import Optional
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from jose import JWTError, jwt
 
 from ..config.settings import get_settings
 from ..db.models import Shop
 from ..db.database import get_db
+from ..services.shop_cache import shop_cache
 
 settings = get_settings()
 security = HTTPBearer()
@@ -41,9 +41,8 @@ async def get_current_shop(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Get shop from database
-    result = await db.execute(select(Shop).where(Shop.id == shop_id))
-    shop = result.scalar_one_or_none()
+    # Get shop (cached; this runs on every dashboard request)
+    shop = await shop_cache.get_by_id(db, shop_id)
     
     if shop is None:
         raise HTTPException(
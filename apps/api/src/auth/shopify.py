@@ -9,7 +9,7 @@ from typing import Optional
 import httpx
 from fastapi import HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import func, select
 
 from ..config.settings import get_settings
 from ..db.models import Shop
@@ -159,6 +159,7 @@ class ShopifyAuth:
             )
             db.add(shop)
         
+        # Committing invalidates the cached shop in every process
         await db.commit()
         await db.refresh(shop)
         
@@ -33,6 +33,7 @@ class Settings(BaseSettings):
     database_max_overflow: int = 20
     database_pool_timeout: int = 30
     database_pool_recycle: int = 3600
+    database_dashboard_reserved_connections: int = 5  # never used by webhook routes
     
     # Redis
     redis_url: str = Field(..., description="Redis URL")
@@ -116,6 +117,41 @@ class Settings(BaseSettings):
     worker_max_retries: int = 3
     worker_retry_delay: int = 60  # seconds
     
+    # Cost imports and re-costing
+    cost_import_chunk_size: int = 5000
+    cost_recost_batch_size: int = 500
+    cost_recost_progress_ttl_seconds: int = 86400
+    
+    # Ad spend allocation
+    ad_spend_allocation_rule: str = "revenue"  # revenue | orders | contribution
+    
+    # Caches
+    shop_cache_ttl_seconds: int = 300
+    shop_cache_max_size: int = 10000
+    settings_cache_ttl_seconds: int = 3600
+    cost_cache_ttl_seconds: int = 3600
+    cost_cache_max_shops: int = 1000
+    scenario_snapshot_ttl_seconds: int = 300
+    scenario_snapshot_max_entries: int = 32
+    
+    # Webhook ingest
+    webhook_ingest_mode: str = "inline"  # inline | queue
+    webhook_queue_poll_interval_ms: int = 500
+    webhook_queue_lease_seconds: int = 300
+    webhook_coalesce_window_ms: int = 2000  # queue mode only; 0 disables debounce
+    webhook_partitions: int = 16
+    webhook_partition_key: str = "shop"  # shop | order
+    webhook_dedup_cache_size: int = 10000
+    webhook_dedup_ttl_seconds: int = 86400
+    webhook_batch_size: int = 100  # queue items per micro-batch; 1 disables batching
+    webhook_batch_flush_ms: int = 50  # max wait to fill a batch
+    webhook_replay_parallelism: int = 8
+    webhook_events_retention_days: int = 30
+    webhook_events_partitions_ahead_days: int = 7
+    webhook_max_inflight: int = 0  # 0 = pool size + overflow - dashboard reserve
+    webhook_overload_action: str = "reject"  # reject (503) | queue (needs the worker)
+    webhook_retry_after_seconds: int = 5
+    
     @property
     def database_url_sync(self) -> str:
         """Get synchronous database URL for Alembic."""
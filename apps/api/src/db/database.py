@@ -39,9 +39,13 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
 async def init_db() -> None:
     """Initialize database tables."""
     from .models import Base
+    from .partitions import maintain_webhook_event_partitions
     
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    
+    async with AsyncSessionLocal() as session:
+        await maintain_webhook_event_partitions(session)
 
 
 async def close_db() -> None:
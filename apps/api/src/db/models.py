@@ -13,6 +13,7 @@ from sqlalchemy import (
     Index,
     Integer,
     JSON,
+    LargeBinary,
     Numeric,
     String,
     Text,
@@ -96,6 +97,7 @@ class Order(Base):
     financial_status = Column(String(50), nullable=False)
     fulfillment_status = Column(String(50), nullable=True)
     customer_id = Column(String(50), nullable=True)
+    shop_updated_at = Column(DateTime(timezone=True), nullable=True)  # Shopify updated_at, used as the row version
     flags = Column(JSONB, nullable=False, default={})
     created_at_db = Column(DateTime(timezone=True), nullable=False, default=func.now())
     updated_at = Column(DateTime(timezone=True), nullable=False, default=func.now(), onupdate=func.now())
@@ -128,6 +130,8 @@ class OrderLine(Base):
     inventory_item_id = Column(String(50), nullable=False)
     quantity = Column(Integer, nullable=False)
     price_set = Column(JSONB, nullable=False)
+    price = Column(Numeric(10, 2), nullable=False)  # price_set shop money
+    presentment_price = Column(Numeric(10, 2), nullable=False)  # price_set presentment money
     discount_allocations = Column(JSONB, nullable=False, default=[])
     presentment_currency = Column(String(3), nullable=False)
     shop_currency = Column(String(3), nullable=False)
@@ -140,6 +144,7 @@ class OrderLine(Base):
     order = relationship("Order", back_populates="lines")
     
     __table_args__ = (
+        UniqueConstraint("order_id", "line_id", name="uq_order_lines_order_line"),
         Index("idx_order_lines_shop_order", "shop_id", "order_id"),
         Index("idx_order_lines_shop_variant", "shop_id", "variant_id"),
         Index("idx_order_lines_inventory_item", "inventory_item_id"),
@@ -155,8 +160,11 @@ class RefundLine(Base):
     shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), nullable=False)
     order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
     line_id = Column(String(50), nullable=False)
+    refund_line_id = Column(String(50), nullable=True)
     refunded_quantity = Column(Integer, nullable=False)
     refunded_amount_set = Column(JSONB, nullable=False)
+    refunded_amount = Column(Numeric(10, 2), nullable=False)  # refunded_amount_set shop money
+    presentment_refunded_amount = Column(Numeric(10, 2), nullable=False)  # refunded_amount_set presentment money
     created_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
     
     # Relationships
@@ -164,6 +172,7 @@ class RefundLine(Base):
     order = relationship("Order", back_populates="refunds")
     
     __table_args__ = (
+        UniqueConstraint("order_id", "refund_line_id", name="uq_refund_lines_order_refund_line"),
         Index("idx_refund_lines_shop_order", "shop_id", "order_id"),
     )
 
@@ -176,9 +185,13 @@ class Transaction(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=func.gen_random_uuid())
     shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), nullable=False)
     order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    shop_transaction_id = Column(String(50), nullable=True)
     gateway = Column(String(100), nullable=False)
+    card_brand = Column(String(50), nullable=True)  # payment_details.credit_card_company
     status = Column(Enum("pending", "failure", "success", "error", name="transaction_status_enum"), nullable=False)
     amount_set = Column(JSONB, nullable=False)
+    amount = Column(Numeric(10, 2), nullable=False)  # amount_set shop money
+    presentment_amount = Column(Numeric(10, 2), nullable=False)  # amount_set presentment money
     processed_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
     
@@ -188,6 +201,7 @@ class Transaction(Base):
     fees = relationship("TransactionFee", back_populates="transaction", cascade="all, delete-orphan")
     
     __table_args__ = (
+        UniqueConstraint("order_id", "shop_transaction_id", name="uq_transactions_order_transaction"),
         Index("idx_transactions_shop_order", "shop_id", "order_id"),
     )
 
@@ -201,6 +215,8 @@ class TransactionFee(Base):
     shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), nullable=False)
     transaction_id = Column(UUID(as_uuid=True), ForeignKey("transactions.id", ondelete="CASCADE"), nullable=False)
     fee_amount_set = Column(JSONB, nullable=False)
+    fee_amount = Column(Numeric(10, 2), nullable=False)  # fee_amount_set shop money
+    presentment_fee_amount = Column(Numeric(10, 2), nullable=False)  # fee_amount_set presentment money
     currency = Column(String(3), nullable=False)
     presentment_currency = Column(String(3), nullable=False)
     estimated = Column(Boolean, nullable=False, default=False)
@@ -211,6 +227,7 @@ class TransactionFee(Base):
     transaction = relationship("Transaction", back_populates="fees")
     
     __table_args__ = (
+        UniqueConstraint("transaction_id", name="uq_transaction_fees_transaction"),
         Index("idx_transaction_fees_shop_transaction", "shop_id", "transaction_id"),
     )
 
@@ -239,6 +256,36 @@ class InventoryItemCostSnapshot(Base):
     )
 
 
+class OrderProfit(Base):
+    """Last computed profit breakdown per order.
+    
+    Rollups are maintained by applying the difference between an order's old
+    and new row, so ``date`` records which rollup day the row was added to.
+    """
+    
+    __tablename__ = "order_profit"
+    
+    order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), nullable=False)
+    date = Column(DateTime(timezone=True), nullable=False)
+    net_revenue = Column(Numeric(12, 2), nullable=False, default=0)
+    cogs = Column(Numeric(12, 2), nullable=False, default=0)
+    fees = Column(Numeric(12, 2), nullable=False, default=0)
+    shipping_cost = Column(Numeric(12, 2), nullable=False, default=0)
+    ad_spend = Column(Numeric(12, 2), nullable=False, default=0)
+    net_profit = Column(Numeric(12, 2), nullable=False, default=0)
+    margin_pct = Column(Numeric(12, 2), nullable=False, default=0)
+    flags = Column(JSONB, nullable=False, default={})
+    calculated_at = Column(DateTime(timezone=True), nullable=False, default=func.now(), onupdate=func.now())
+    
+    # Relationships
+    order = relationship("Order")
+    
+    __table_args__ = (
+        Index("idx_order_profit_shop_date", "shop_id", "date"),
+    )
+
+
 class DailyRollup(Base):
     """Daily aggregated metrics rollup."""
     
@@ -288,7 +335,13 @@ class AdSpendDaily(Base):
 
 
 class WebhookEvent(Base):
-    """Webhook events tracking."""
+    """Webhook events tracking.
+    
+    Range-partitioned by ``received_at`` (one partition per day, see
+    ``db/partitions.py``), so the primary key includes ``received_at`` and
+    ``dedup_key`` cannot be globally unique; duplicates are prevented with an
+    advisory lock per key instead.
+    """
     
     __tablename__ = "webhook_events"
     
@@ -296,11 +349,12 @@ class WebhookEvent(Base):
     shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), nullable=False)
     topic = Column(String(100), nullable=False)
     shop_resource_id = Column(String(50), nullable=False)
-    received_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    received_at = Column(DateTime(timezone=True), primary_key=True, nullable=False, default=func.now())
     processed_at = Column(DateTime(timezone=True), nullable=True)
-    dedup_key = Column(String(255), unique=True, nullable=False)
+    dedup_key = Column(String(255), nullable=False)
     status = Column(Enum("pending", "processing", "completed", "failed", name="webhook_status_enum"), nullable=False, default="pending")
     error = Column(Text, nullable=True)
+    payload = Column(LargeBinary, nullable=True)  # zlib-compressed raw body, for replay
     
     # Relationships
     shop = relationship("Shop", back_populates="webhook_events")
@@ -309,4 +363,29 @@ class WebhookEvent(Base):
         Index("idx_webhook_events_shop_status", "shop_id", "status"),
         Index("idx_webhook_events_dedup_key", "dedup_key"),
         Index("idx_webhook_events_received_at", "received_at"),
+        {"postgresql_partition_by": "RANGE (received_at)"},
+    )
+
+
+class WebhookQueueItem(Base):
+    """Raw webhook deliveries awaiting processing by the worker pool."""
+    
+    __tablename__ = "webhook_queue"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=func.gen_random_uuid())
+    topic = Column(String(100), nullable=False)
+    shop_domain = Column(String(255), nullable=False)
+    coalesce_key = Column(String(50), nullable=True)
+    partition = Column(Integer, nullable=False, default=0)
+    headers = Column(JSONB, nullable=False, default={})
+    body = Column(LargeBinary, nullable=False)
+    received_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    available_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    
+    __table_args__ = (
+        Index("idx_webhook_queue_partition_available_at", "partition", "available_at"),
+        Index("idx_webhook_queue_shop_coalesce_key", "shop_domain", "coalesce_key"),
     )
@@ -0,0 +1,139 @@
+"""Daily range partitions for the webhook_events table.
+
+Partitions are named ``webhook_events_pYYYYMMDD`` and cover one UTC day of
+``received_at``. ``maintain_webhook_event_partitions`` creates partitions
+``webhook_events_partitions_ahead_days`` ahead and drops whole partitions
+older than ``webhook_events_retention_days``, which is far cheaper than
+deleting rows and leaves no index bloat behind.
+
+Run ``python -m src.db.partitions`` from cron, or rely on the webhook worker,
+which runs maintenance periodically.
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from .database import AsyncSessionLocal, close_db
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "webhook_events"
+PARTITION_PREFIX = f"{PARENT_TABLE}_p"
+
+# Arbitrary constant so only one process runs maintenance at a time
+MAINTENANCE_LOCK_ID = 7_340_001
+
+
+def get_partition_name(day: date) -> str:
+    """Get the partition table name for a UTC day."""
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def _parse_partition_day(name: str) -> Optional[date]:
+    """Get the day a partition covers from its name, if it is one of ours."""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+async def get_webhook_event_partitions(db: AsyncSession) -> List[str]:
+    """List existing partitions of webhook_events."""
+    result = await db.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :parent"
+        ),
+        {"parent": PARENT_TABLE}
+    )
+    return [row[0] for row in result]
+
+
+async def create_webhook_event_partitions(
+    db: AsyncSession,
+    start: date,
+    days: int
+) -> List[str]:
+    """Create daily partitions for ``days`` days from ``start`` if missing."""
+    existing = set(await get_webhook_event_partitions(db))
+    created = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        name = get_partition_name(day)
+        if name in existing:
+            continue
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{day.isoformat()} 00:00:00+00') "
+            f"TO ('{(day + timedelta(days=1)).isoformat()} 00:00:00+00')"
+        ))
+        created.append(name)
+    return created
+
+
+async def drop_expired_webhook_event_partitions(
+    db: AsyncSession,
+    today: date
+) -> List[str]:
+    """Drop partitions that lie entirely before the retention window."""
+    cutoff = today - timedelta(days=settings.webhook_events_retention_days)
+    dropped = []
+    for name in await get_webhook_event_partitions(db):
+        day = _parse_partition_day(name)
+        if day is not None and day < cutoff:
+            await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+    return dropped
+
+
+async def maintain_webhook_event_partitions(db: AsyncSession) -> Dict[str, List[str]]:
+    """Create upcoming partitions and drop expired ones in one transaction.
+
+    Yesterday's partition is also ensured so deliveries received around
+    midnight, or re-enqueued with their original receive time, always have a
+    home.
+    """
+    locked = await db.execute(
+        text("SELECT pg_try_advisory_xact_lock(:lock_id)"), {"lock_id": MAINTENANCE_LOCK_ID}
+    )
+    if not locked.scalar():
+        await db.rollback()
+        return {"created": [], "dropped": []}
+
+    today = datetime.now(timezone.utc).date()
+    created = await create_webhook_event_partitions(
+        db, today - timedelta(days=1), settings.webhook_events_partitions_ahead_days + 2
+    )
+    dropped = await drop_expired_webhook_event_partitions(db, today)
+    await db.commit()
+
+    if created or dropped:
+        logger.info(
+            "webhook_events partitions: created %s, dropped %s", created, dropped
+        )
+    return {"created": created, "dropped": dropped}
+
+
+async def _run_maintenance() -> Dict[str, List[str]]:
+    """Run maintenance once with a fresh session."""
+    try:
+        async with AsyncSessionLocal() as db:
+            return await maintain_webhook_event_partitions(db)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=settings.log_level)
+    print(asyncio.run(_run_maintenance()))
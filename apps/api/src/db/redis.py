@@ -0,0 +1,35 @@
+"""Redis connection management."""
+
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+from ..config.settings import get_settings
+
+settings = get_settings()
+
+_redis: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """Get the shared Redis client (connections are opened lazily)."""
+    global _redis
+    
+    if _redis is None:
+        config = settings.redis_config
+        _redis = aioredis.from_url(
+            config["url"],
+            max_connections=config["max_connections"],
+            decode_responses=config["decode_responses"],
+        )
+    
+    return _redis
+
+
+async def close_redis() -> None:
+    """Close Redis connections."""
+    global _redis
+    
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
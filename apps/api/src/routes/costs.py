@@ -0,0 +1,53 @@
+"""Unit cost API routes."""
+
+import io
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..auth.middleware import get_current_shop
+from ..db.database import get_db
+from ..db.models import Shop
+from ..services.cost_import import cost_import_service
+from ..services.recosting import recosting_service
+
+router = APIRouter(prefix="/costs", tags=["costs"])
+
+
+@router.post("/import")
+async def import_costs(
+    file: UploadFile = File(..., description="CSV with inventory_item_id, unit_cost[, effective_date, currency]"),
+    recost: bool = Query(True, description="Re-cost affected order lines afterwards"),
+    shop: Shop = Depends(get_current_shop),
+    db: AsyncSession = Depends(get_db)
+):
+    """Import unit costs from a CSV upload; affected orders are re-costed in the background."""
+    # The upload is spooled to disk; read it as a text stream rather than into memory
+    csv_file = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        summary = await cost_import_service.load_csv(db, shop, csv_file, recost=recost)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cost CSV: {str(e)}")
+    finally:
+        csv_file.detach()
+    
+    inventory_item_ids = summary.pop("inventory_item_ids")
+    changed_snapshots = summary.pop("changed_snapshots")
+    
+    return {
+        **summary,
+        "items_changed": len(inventory_item_ids),
+        "recost_scheduled": bool(recost and changed_snapshots),
+    }
+
+
+@router.get("/recost/progress")
+async def get_recost_progress(
+    shop: Shop = Depends(get_current_shop)
+):
+    """Get progress of the shop's latest re-costing run."""
+    progress = await recosting_service.get_progress(shop.id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No re-costing run found")
+    
+    return progress
@@ -5,12 +5,15 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_
+from sqlalchemy.orm import selectinload
 
 from ..db.database import get_db
-from ..db.models import Shop, DailyRollup, Order
+from ..db.models import Shop, DailyRollup, Order, Transaction
 from ..auth.middleware import get_current_shop
 from ..services.profit_calculator import ProfitCalculator
+from ..services.rollup_service import rollup_service
 from ..utils.time_periods import get_time_period_dates
+from ..webhooks.telemetry import get_shop_webhook_status
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 profit_calculator = ProfitCalculator()
@@ -125,8 +128,22 @@ async def get_order_detail(
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    # Calculate profit breakdown
-    profit_data = await profit_calculator.calculate_order_profit(db, order)
+    # Use the stored breakdown; orders not processed since it was introduced
+    # are calculated on the fly
+    stored_profit = await rollup_service.get_order_profit(db, order.id)
+    if stored_profit is not None:
+        profit_data = {
+            'net_revenue': stored_profit.net_revenue,
+            'cogs': stored_profit.cogs,
+            'fees': stored_profit.fees,
+            'shipping_cost': stored_profit.shipping_cost,
+            'ad_spend': stored_profit.ad_spend,
+            'net_profit': stored_profit.net_profit,
+            'margin_pct': stored_profit.margin_pct,
+            'flags': stored_profit.flags,
+        }
+    else:
+        profit_data = await profit_calculator.calculate_loaded_order_profit(db, order)
     
     return {
         "order": {
@@ -150,8 +167,8 @@ async def get_order_detail(
                 "product_id": line.product_id,
                 "variant_id": line.variant_id,
                 "quantity": line.quantity,
-                "price": float(line.price_set.get('shop_money', {}).get('amount', 0)),
-                "unit_cost": float(line.effective_unit_cost) if line.effective_unit_cost else None,
+                "price": float(line.price),
+                "unit_cost": float(line.effective_unit_cost) if line.effective_unit_cost is not None else None,
                 "cost_source": line.cost_source
             }
             for line in order.lines
@@ -161,7 +178,7 @@ async def get_order_detail(
                 "id": str(refund.id),
                 "line_id": refund.line_id,
                 "refunded_quantity": refund.refunded_quantity,
-                "refunded_amount": float(refund.refunded_amount_set.get('shop_money', {}).get('amount', 0))
+                "refunded_amount": float(refund.refunded_amount)
             }
             for refund in order.refunds
         ],
@@ -170,12 +187,12 @@ async def get_order_detail(
                 "id": str(transaction.id),
                 "gateway": transaction.gateway,
                 "status": transaction.status,
-                "amount": float(transaction.amount_set.get('shop_money', {}).get('amount', 0)),
+                "amount": float(transaction.amount),
                 "processed_at": transaction.processed_at.isoformat() if transaction.processed_at else None,
                 "fees": [
                     {
                         "id": str(fee.id),
-                        "amount": float(fee.fee_amount_set.get('shop_money', {}).get('amount', 0)),
+                        "amount": float(fee.fee_amount),
                         "currency": fee.currency,
                         "estimated": fee.estimated
                     }
@@ -216,14 +233,22 @@ async def get_data_health(
     total_orders = await _get_total_orders(db, shop, start_date, end_date)
     orders_with_estimated_fees = await _get_orders_with_estimated_fees(db, shop, start_date, end_date)
     orders_missing_costs = await _get_orders_missing_costs(db, shop, start_date, end_date)
+    webhook_status = await get_shop_webhook_status(db, shop)
+    
+    recommendations = _get_health_recommendations(health_score, orders_with_estimated_fees, orders_missing_costs)
+    if webhook_status["status"] != "ok":
+        recommendations.append(
+            f"Webhook processing is lagging by {webhook_status['lag_ms'] // 1000}s. Recent orders may not be reflected yet."
+        )
     
     return {
         "total_orders": total_orders,
         "orders_with_estimated_fees": orders_with_estimated_fees,
         "orders_missing_unit_costs": orders_missing_costs,
         "data_completeness_score": health_score,
+        "webhooks": webhook_status,
         "last_updated": datetime.utcnow().isoformat(),
-        "recommendations": _get_health_recommendations(health_score, orders_with_estimated_fees, orders_missing_costs)
+        "recommendations": recommendations
     }
 
 
@@ -0,0 +1,17 @@
+"""Prometheus metrics route."""
+
+from fastapi import APIRouter, Depends, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.database import get_db
+from ..webhooks.telemetry import webhook_telemetry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+async def get_metrics(db: AsyncSession = Depends(get_db)):
+    """Expose webhook lag, throughput and queue depth in Prometheus format."""
+    await webhook_telemetry.refresh_queue_metrics(db)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,37 @@
+"""What-if scenario API routes."""
+
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..auth.middleware import get_current_shop
+from ..db.database import get_db
+from ..db.models import Shop
+from ..services.scenario_engine import scenario_engine
+from ..utils.time_periods import get_time_period_dates
+
+router = APIRouter(prefix="/scenarios", tags=["scenarios"])
+
+
+@router.post("")
+async def run_scenarios(
+    scenarios: List[Dict[str, Any]] = Body(..., embed=True, description="Overrides to evaluate"),
+    period: str = Query("30d", description="Time period: today, yesterday, 7d, 30d, mtd, qtd, ytd"),
+    shop: Shop = Depends(get_current_shop),
+    db: AsyncSession = Depends(get_db)
+):
+    """Evaluate what-if fee, shipping and COGS overrides for a period without saving anything."""
+    try:
+        date_range = get_time_period_dates(period, shop.timezone)
+        result = await scenario_engine.run(
+            db, shop.id, date_range['start'], date_range['end'], scenarios
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "period": period,
+        "currency": shop.currency,
+        **result,
+    }
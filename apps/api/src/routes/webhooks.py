@@ -1,81 +1,95 @@
 """Webhook routes for Shopify events."""
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..auth.middleware import get_current_shop
 from ..db.database import get_db
+from ..db.models import Shop
+from ..services.webhook_replay import webhook_replay_service
 from ..webhooks.handlers import webhook_handler
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
 
 @router.post("/orders_create")
-async def orders_create(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
+async def orders_create(request: Request):
     """Handle orders/create webhook."""
-    return await webhook_handler.handle_webhook(request, "orders/create", db)
+    return await webhook_handler.handle_webhook(request, "orders/create")
 
 
 @router.post("/orders_updated")
-async def orders_updated(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
+async def orders_updated(request: Request):
     """Handle orders/updated webhook."""
-    return await webhook_handler.handle_webhook(request, "orders/updated", db)
+    return await webhook_handler.handle_webhook(request, "orders/updated")
 
 
 @router.post("/orders_paid")
-async def orders_paid(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
+async def orders_paid(request: Request):
     """Handle orders/paid webhook."""
-    return await webhook_handler.handle_webhook(request, "orders/paid", db)
+    return await webhook_handler.handle_webhook(request, "orders/paid")
 
 
 @router.post("/orders_cancelled")
-async def orders_cancelled(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
+async def orders_cancelled(request: Request):
     """Handle orders/cancelled webhook."""
-    return await webhook_handler.handle_webhook(request, "orders/cancelled", db)
+    return await webhook_handler.handle_webhook(request, "orders/cancelled")
 
 
 @router.post("/orders_fulfilled")
-async def orders_fulfilled(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
+async def orders_fulfilled(request: Request):
     """Handle orders/fulfilled webhook."""
-    return await webhook_handler.handle_webhook(request, "orders/fulfilled", db)
+    return await webhook_handler.handle_webhook(request, "orders/fulfilled")
 
 
 @router.post("/orders_partially_fulfilled")
-async def orders_partially_fulfilled(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
+async def orders_partially_fulfilled(request: Request):
     """Handle orders/partially_fulfilled webhook."""
-    return await webhook_handler.handle_webhook(request, "orders/partially_fulfilled", db)
+    return await webhook_handler.handle_webhook(request, "orders/partially_fulfilled")
 
 
 @router.post("/refunds_create")
-async def refunds_create(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
+async def refunds_create(request: Request):
     """Handle refunds/create webhook."""
-    return await webhook_handler.handle_webhook(request, "refunds/create", db)
+    return await webhook_handler.handle_webhook(request, "refunds/create")
 
 
 @router.post("/transactions_create")
-async def transactions_create(
-    request: Request,
+async def transactions_create(request: Request):
+    """Handle transactions/create webhook."""
+    return await webhook_handler.handle_webhook(request, "transactions/create")
+
+
+@router.post("/replay")
+async def replay_webhooks(
+    background_tasks: BackgroundTasks,
+    topic: Optional[List[str]] = Query(None, description="Topics to replay"),
+    status: List[str] = Query(["failed"], description="Event statuses to replay"),
+    since: Optional[datetime] = Query(None, description="Received at or after"),
+    until: Optional[datetime] = Query(None, description="Received before"),
+    parallelism: Optional[int] = Query(None, ge=1, le=64, description="Orders replayed concurrently"),
+    dry_run: bool = Query(False, description="Only count matching events"),
+    shop: Shop = Depends(get_current_shop),
     db: AsyncSession = Depends(get_db)
 ):
-    """Handle transactions/create webhook."""
-    return await webhook_handler.handle_webhook(request, "transactions/create", db)
+    """Replay the shop's stored webhook events from their saved payloads."""
+    groups = await webhook_replay_service.select_events(
+        db, shop.id, topic, status, since, until
+    )
+    selected = sum(len(group) for group in groups)
+    
+    if not dry_run and selected:
+        background_tasks.add_task(
+            webhook_replay_service.replay,
+            shop_id=shop.id,
+            topics=topic,
+            statuses=status,
+            received_from=since,
+            received_to=until,
+            parallelism=parallelism,
+        )
+    
+    return {"success": True, "selected": selected, "dry_run": dry_run}
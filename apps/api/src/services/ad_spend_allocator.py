@@ -0,0 +1,207 @@
+"""Allocation of daily ad spend to orders and rollups.
+
+``AdSpendDaily`` holds spend per (shop, day, channel). After a sync, the
+affected days are re-allocated: each rollup day gets the day's spend per
+channel, and each order on the day gets a share of the total, weighted by the
+configured allocation rule. Both are set-based per shop and only touch the
+days passed in, so no order is recalculated.
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.database import AsyncSessionLocal, close_db
+from ..db.models import AdSpendDaily, Shop
+from .rollup_service import get_rollup_date, rollup_service
+from .settings_cache import settings_cache
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Allocation rules: SQL weight of an order_profit row ``p`` within its day.
+# Days where every weight is zero fall back to an equal split.
+ALLOCATION_RULES = {
+    "revenue": "GREATEST(p.net_revenue, 0)",
+    "orders": "1",
+    "contribution": "GREATEST(p.net_revenue - p.cogs - p.fees - p.shipping_cost, 0)",
+}
+
+# Shares are rounded on the running total, so each day's allocations add up
+# to exactly the day's spend.
+ALLOCATE_SQL = """
+    WITH spend AS (
+        SELECT *
+        FROM unnest(CAST(:days AS timestamptz[]), CAST(:amounts AS numeric[])) AS s(date, amount)
+    ),
+    weighted AS (
+        SELECT p.order_id, p.date, s.amount, {weight} AS weight
+        FROM order_profit p
+        JOIN spend s ON s.date = p.date
+        WHERE p.shop_id = :shop_id
+    ),
+    normalized AS (
+        SELECT order_id, date, amount,
+               CASE WHEN SUM(weight) OVER (PARTITION BY date) > 0 THEN weight ELSE 1 END AS weight
+        FROM weighted
+    ),
+    running AS (
+        SELECT order_id, date, amount, weight,
+               SUM(weight) OVER (
+                   PARTITION BY date ORDER BY weight DESC, order_id ROWS UNBOUNDED PRECEDING
+               ) AS running_weight,
+               SUM(weight) OVER (PARTITION BY date) AS day_weight
+        FROM normalized
+    ),
+    shares AS (
+        SELECT order_id,
+               ROUND(amount * running_weight / day_weight, 2)
+               - ROUND(amount * (running_weight - weight) / day_weight, 2) AS ad_spend
+        FROM running
+    )
+    UPDATE order_profit p
+    SET ad_spend = shares.ad_spend,
+        net_profit = p.net_profit + p.ad_spend - shares.ad_spend,
+        margin_pct = CASE
+            WHEN p.net_revenue > 0
+            THEN ROUND((p.net_profit + p.ad_spend - shares.ad_spend) / p.net_revenue * 100, 2)
+            ELSE 0
+        END
+    FROM shares
+    WHERE p.order_id = shares.order_id
+      AND p.ad_spend IS DISTINCT FROM shares.ad_spend
+"""
+
+
+class AdSpendAllocator:
+    """Allocates AdSpendDaily to order_profit rows and rollups_daily."""
+
+    async def allocate(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        days: Iterable[datetime],
+        rule: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Re-allocate a shop's ad spend for the given days.
+
+        Days are normalized to rollup days; days without spend clear earlier
+        allocations. Only channels in the shop's ``ad_spend_channels`` count,
+        when any are configured. Amounts are taken as shop currency. Does not
+        commit.
+        """
+        rule = rule or settings.ad_spend_allocation_rule
+        if rule not in ALLOCATION_RULES:
+            raise ValueError(f"Unknown ad spend allocation rule: {rule}")
+
+        days = sorted({get_rollup_date(day) for day in days})
+        if not days:
+            return {"days": 0, "orders": 0}
+
+        spend = await self._load_spend(db, shop_id, days)
+        await rollup_service.set_ad_spend(db, shop_id, spend)
+
+        result = await db.execute(
+            text(ALLOCATE_SQL.format(weight=ALLOCATION_RULES[rule])),
+            {
+                "shop_id": shop_id,
+                "days": days,
+                "amounts": [sum(spend[day].values(), Decimal('0')) for day in days],
+            }
+        )
+
+        return {"days": len(days), "orders": result.rowcount}
+
+    async def allocate_days(
+        self,
+        shop_id: Any,
+        days: Iterable[datetime],
+        rule: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Re-allocate days in a session of its own and commit; call after an ad spend sync."""
+        async with AsyncSessionLocal() as db:
+            try:
+                summary = await self.allocate(db, shop_id, days, rule)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        logger.info(
+            "Allocated ad spend for shop %s: %d days, %d orders changed",
+            shop_id, summary["days"], summary["orders"]
+        )
+        return summary
+
+    async def _load_spend(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        days: List[datetime]
+    ) -> Dict[datetime, Dict[str, Decimal]]:
+        """Sum AdSpendDaily per rollup day and channel."""
+        shop_settings = await settings_cache.get(db, shop_id)
+
+        query = (
+            select(AdSpendDaily.date, AdSpendDaily.channel, func.sum(AdSpendDaily.amount))
+            .where(
+                AdSpendDaily.shop_id == shop_id,
+                AdSpendDaily.date >= days[0],
+                AdSpendDaily.date < days[-1] + timedelta(days=1)
+            )
+            .group_by(AdSpendDaily.date, AdSpendDaily.channel)
+        )
+        if shop_settings.ad_spend_channels:
+            query = query.where(AdSpendDaily.channel.in_(shop_settings.ad_spend_channels))
+        result = await db.execute(query)
+
+        spend: Dict[datetime, Dict[str, Decimal]] = {day: {} for day in days}
+        for date, channel, amount in result:
+            day_spend = spend.get(get_rollup_date(date))
+            if day_spend is not None:
+                day_spend[channel] = day_spend.get(channel, Decimal('0')) + amount
+        return spend
+
+
+# Global instance
+ad_spend_allocator = AdSpendAllocator()
+
+
+async def _run_allocation(args: argparse.Namespace) -> Dict[str, int]:
+    """Resolve CLI arguments and allocate the date range."""
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Shop.id).where(Shop.shop_domain == args.shop))
+            shop_id = result.scalar_one()
+
+        since = get_rollup_date(args.since)
+        until = get_rollup_date(args.until or args.since)
+        days = [since + timedelta(days=offset) for offset in range((until - since).days + 1)]
+        return await ad_spend_allocator.allocate_days(shop_id, days, args.rule)
+    finally:
+        await close_db()
+
+
+def main() -> None:
+    """Re-allocate ad spend from the command line."""
+    parser = argparse.ArgumentParser(description="Allocate daily ad spend to orders and rollups.")
+    parser.add_argument("--shop", required=True, help="Shop domain, e.g. example.myshopify.com")
+    parser.add_argument("--since", required=True, type=datetime.fromisoformat, help="First day (ISO 8601)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Last day, inclusive (default: --since)")
+    parser.add_argument("--rule", choices=sorted(ALLOCATION_RULES), help="Allocation rule")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+    summary = asyncio.run(_run_allocation(args))
+    logger.info("Ad spend allocation finished: %s", summary)
+
+
+if __name__ == "__main__":
+    main()
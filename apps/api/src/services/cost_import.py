@@ -0,0 +1,269 @@
+"""Streaming CSV import of inventory item unit costs.
+
+The CSV needs a header row with ``inventory_item_id`` and ``unit_cost``
+columns, and may add ``effective_date`` (ISO 8601, defaults to the import
+time) and ``currency`` (defaults to the shop currency). Rows are parsed and
+validated in chunks on a worker thread, so a large upload never blocks the
+event loop, COPYed into a temporary staging table and merged into
+``inventory_item_cost_snapshots`` with one statement; invalid rows are
+skipped and reported. Once committed, the lines governed by inserted or
+changed snapshots are re-costed by ``recosting_service``.
+"""
+
+import argparse
+import asyncio
+import csv
+import itertools
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+from sqlalchemy import select, text
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.database import AsyncSessionLocal, close_db
+from ..db.models import Shop
+from .cost_resolver import cost_resolver
+from .recosting import recosting_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ('inventory_item_id', 'unit_cost')
+
+MAX_REPORTED_ERRORS = 100
+
+# Largest value NUMERIC(10, 2) holds
+MAX_UNIT_COST = Decimal('99999999.99')
+
+STAGING_TABLE = "cost_import_staging"
+
+STAGING_COLUMNS = ('row_number', 'inventory_item_id', 'effective_date', 'unit_cost', 'currency')
+
+CREATE_STAGING_SQL = text(f"""
+    CREATE TEMPORARY TABLE {STAGING_TABLE} (
+        row_number bigint NOT NULL,
+        inventory_item_id varchar(50) NOT NULL,
+        effective_date timestamptz NOT NULL,
+        unit_cost numeric(10, 2) NOT NULL,
+        currency varchar(3) NOT NULL
+    ) ON COMMIT DROP
+""")
+
+# The last row wins when the file repeats an (item, effective date) pair;
+# unchanged snapshots are not rewritten.
+MERGE_STAGING_SQL = text(f"""
+    INSERT INTO inventory_item_cost_snapshots AS s
+        (id, shop_id, inventory_item_id, effective_date, unit_cost, currency, source, created_at)
+    SELECT DISTINCT ON (inventory_item_id, effective_date)
+        gen_random_uuid(), CAST(:shop_id AS uuid), inventory_item_id, effective_date, unit_cost,
+        currency, CAST('csv' AS cost_source_enum), now()
+    FROM {STAGING_TABLE}
+    ORDER BY inventory_item_id, effective_date, row_number DESC
+    ON CONFLICT ON CONSTRAINT uq_cost_snapshots_item_date DO UPDATE
+    SET unit_cost = EXCLUDED.unit_cost,
+        currency = EXCLUDED.currency,
+        source = EXCLUDED.source
+    WHERE (s.unit_cost, s.currency, s.source)
+        IS DISTINCT FROM (EXCLUDED.unit_cost, EXCLUDED.currency, EXCLUDED.source)
+    RETURNING s.inventory_item_id, s.effective_date, (xmax = 0) AS inserted
+""")
+
+
+class CostImportService:
+    """Loads unit cost CSVs into inventory item cost snapshots."""
+
+    async def load_csv(
+        self,
+        db: AsyncSession,
+        shop: Shop,
+        file: TextIO,
+        chunk_size: Optional[int] = None,
+        recost: bool = True
+    ) -> Dict[str, Any]:
+        """Load a cost CSV for a shop and commit.
+
+        Returns row counts, the first MAX_REPORTED_ERRORS validation errors,
+        the inventory item ids whose snapshots were inserted or changed and
+        those ``changed_snapshots`` as (inventory_item_id, effective_date).
+        With ``recost``, re-costing starts in the background on commit.
+        Raises ValueError when the header is missing required columns.
+        """
+        chunk_size = chunk_size or settings.cost_import_chunk_size
+        imported_at = datetime.now(timezone.utc)
+
+        reader = csv.DictReader(file)
+        # Reading the header pulls the first line from the file
+        fieldnames = await run_in_threadpool(lambda: reader.fieldnames)
+        header = [name.strip().lower() for name in fieldnames or []]
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+        reader.fieldnames = header
+
+        summary: Dict[str, Any] = {"rows": 0, "valid": 0, "invalid": 0, "errors": []}
+
+        try:
+            await db.execute(CREATE_STAGING_SQL)
+            connection = await db.connection()
+            raw_connection = await connection.get_raw_connection()
+
+            while True:
+                records = await run_in_threadpool(
+                    self._parse_chunk, reader, chunk_size, shop.currency, imported_at, summary
+                )
+                if records is None:
+                    break
+
+                if records:
+                    await raw_connection.driver_connection.copy_records_to_table(
+                        STAGING_TABLE, records=records, columns=STAGING_COLUMNS
+                    )
+                    summary["valid"] += len(records)
+
+            result = await db.execute(MERGE_STAGING_SQL, {"shop_id": shop.id})
+            merged = result.all()
+            if merged:
+                cost_resolver.mark_changed(db, shop.id)
+                if recost:
+                    recosting_service.mark_changed(
+                        db, shop.id, [(row.inventory_item_id, row.effective_date) for row in merged]
+                    )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+        summary["snapshots_inserted"] = sum(1 for row in merged if row.inserted)
+        summary["snapshots_updated"] = len(merged) - summary["snapshots_inserted"]
+        summary["inventory_item_ids"] = sorted({row.inventory_item_id for row in merged})
+        summary["changed_snapshots"] = [(row.inventory_item_id, row.effective_date) for row in merged]
+
+        logger.info(
+            "Imported cost CSV for %s: %d rows, %d invalid, %d snapshots inserted, %d updated",
+            shop.shop_domain, summary["rows"], summary["invalid"],
+            summary["snapshots_inserted"], summary["snapshots_updated"]
+        )
+        return summary
+
+    def _parse_chunk(
+        self,
+        reader: csv.DictReader,
+        chunk_size: int,
+        shop_currency: str,
+        imported_at: datetime,
+        summary: Dict[str, Any]
+    ) -> Optional[List[Tuple[Any, ...]]]:
+        """Read and validate up to ``chunk_size`` rows into staging records.
+
+        Counts rows and errors into ``summary``. Returns None at the end of
+        the file. Blocking; runs on a worker thread.
+        """
+        chunk = list(itertools.islice(reader, chunk_size))
+        if not chunk:
+            return None
+
+        records = []
+        for row in chunk:
+            summary["rows"] += 1
+            row_number = summary["rows"] + 1  # header is line 1
+            try:
+                records.append(
+                    (row_number, *self._parse_row(row, shop_currency, imported_at))
+                )
+            except ValueError as e:
+                summary["invalid"] += 1
+                if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                    summary["errors"].append({"row": row_number, "error": str(e)})
+        return records
+
+    def _parse_row(
+        self,
+        row: Dict[str, Optional[str]],
+        shop_currency: str,
+        imported_at: datetime
+    ) -> Tuple[str, datetime, Decimal, str]:
+        """Validate one CSV row into (inventory_item_id, effective_date, unit_cost, currency)."""
+        inventory_item_id = (row.get('inventory_item_id') or '').strip()
+        # Accept GraphQL ids as exported from the Shopify admin
+        inventory_item_id = inventory_item_id.rsplit('/', 1)[-1]
+        if not inventory_item_id.isdigit() or len(inventory_item_id) > 50:
+            raise ValueError(f"invalid inventory_item_id {row.get('inventory_item_id')!r}")
+
+        raw_cost = (row.get('unit_cost') or '').strip().lstrip('$')
+        try:
+            unit_cost = Decimal(raw_cost).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f"invalid unit_cost {row.get('unit_cost')!r}")
+        if not unit_cost.is_finite() or unit_cost < 0 or unit_cost > MAX_UNIT_COST:
+            raise ValueError(f"unit_cost out of range: {raw_cost}")
+
+        raw_date = (row.get('effective_date') or '').strip()
+        if raw_date:
+            try:
+                effective_date = datetime.fromisoformat(raw_date.replace('Z', '+00:00'))
+            except ValueError:
+                raise ValueError(f"invalid effective_date {raw_date!r}")
+            if effective_date.tzinfo is None:
+                effective_date = effective_date.replace(tzinfo=timezone.utc)
+        else:
+            effective_date = imported_at
+
+        currency = (row.get('currency') or '').strip().upper() or shop_currency
+        if len(currency) != 3 or not currency.isalpha():
+            raise ValueError(f"invalid currency {row.get('currency')!r}")
+
+        return inventory_item_id, effective_date, unit_cost, currency
+
+
+# Global instance
+cost_import_service = CostImportService()
+
+
+async def _run_import(args: argparse.Namespace) -> Dict[str, Any]:
+    """Load the file for the shop, then re-cost affected lines in the foreground."""
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Shop).where(Shop.shop_domain == args.shop))
+            shop = result.scalar_one()
+            with open(args.path, encoding='utf-8-sig', newline='') as file:
+                summary = await cost_import_service.load_csv(
+                    db, shop, file, args.chunk_size, recost=False
+                )
+
+        changed_snapshots = summary.pop("changed_snapshots")
+        if args.recost and changed_snapshots:
+            summary["recost"] = await recosting_service.recost_snapshots(
+                shop.id, changed_snapshots, args.batch_size
+            )
+        summary["inventory_item_ids"] = len(summary["inventory_item_ids"])
+        return summary
+    finally:
+        await close_db()
+
+
+def main() -> None:
+    """Import a unit cost CSV from the command line.
+
+    Exits with status 1 if any row was invalid; valid rows are still imported.
+    """
+    parser = argparse.ArgumentParser(description="Import inventory item unit costs from CSV.")
+    parser.add_argument("path", help="CSV file")
+    parser.add_argument("--shop", required=True, help="Shop domain, e.g. example.myshopify.com")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Rows parsed and copied per chunk")
+    parser.add_argument("--batch-size", type=int, default=None, help="Snapshots re-costed per transaction")
+    parser.add_argument("--no-recost", dest="recost", action="store_false", help="Only load snapshots")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+    summary = asyncio.run(_run_import(args))
+    logger.info("Cost import finished: %s", summary)
+    if summary["invalid"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""As-of unit cost lookup over inventory item cost snapshots.
+
+Each shop's snapshot history is loaded once into per-item arrays sorted by
+effective date, so "cost of item X at time T" is a binary search instead of a
+query per order line. Histories live for ``cost_cache_ttl_seconds`` at most;
+ORM writes of snapshots invalidate the shop in every process once committed,
+through the session hooks below and a Redis pub/sub channel (see
+``invalidating_cache``). Code that writes
+snapshots with bulk INSERTs must call ``cost_resolver.mark_changed`` on the
+session (or ``invalidate`` after committing).
+"""
+
+import logging
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.models import InventoryItemCostSnapshot
+from .invalidating_cache import InvalidatingCache, track_committed_writes
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "costs:invalidate"
+
+
+class ItemCostHistory:
+    """One inventory item's snapshots, sorted by effective date."""
+
+    __slots__ = ('dates', 'costs', 'sources')
+
+    def __init__(self):
+        self.dates: List[datetime] = []
+        self.costs: List[Decimal] = []
+        self.sources: List[str] = []
+
+    def cost_at(self, at: datetime) -> Optional[Tuple[Decimal, str]]:
+        """Get the (unit cost, source) in effect at a time, if any."""
+        index = bisect_right(self.dates, at) - 1
+        if index < 0:
+            return None
+        return self.costs[index], self.sources[index]
+
+
+class ShopCostHistory:
+    """All of a shop's cost snapshots, indexed by inventory item."""
+
+    __slots__ = ('shop_id', 'items')
+
+    def __init__(self, shop_id: Any, snapshots: Iterable[Tuple[str, datetime, Decimal, str]]):
+        """Build from ``(inventory_item_id, effective_date, unit_cost, source)``
+        rows ordered by effective date."""
+        self.shop_id = shop_id
+        self.items: Dict[str, ItemCostHistory] = {}
+        for inventory_item_id, effective_date, unit_cost, source in snapshots:
+            history = self.items.get(inventory_item_id)
+            if history is None:
+                history = self.items[inventory_item_id] = ItemCostHistory()
+            history.dates.append(effective_date)
+            history.costs.append(unit_cost)
+            history.sources.append(source)
+
+    def cost_at(self, inventory_item_id: str, at: datetime) -> Optional[Tuple[Decimal, str]]:
+        """Get an item's (unit cost, source) in effect at a time, if any."""
+        history = self.items.get(inventory_item_id)
+        if history is None:
+            return None
+        return history.cost_at(at)
+
+
+class CostResolver(InvalidatingCache[ShopCostHistory]):
+    """Caches ShopCostHistory per shop with TTL, size bound and cross-process invalidation."""
+
+    def __init__(
+        self,
+        ttl_seconds: int = settings.cost_cache_ttl_seconds,
+        max_size: int = settings.cost_cache_max_shops
+    ):
+        super().__init__(INVALIDATION_CHANNEL, ttl_seconds, max_size)
+
+    async def get_history(self, db: AsyncSession, shop_id: Any) -> ShopCostHistory:
+        """Get a shop's snapshot history, loading it only on a miss."""
+        key = str(shop_id)
+        history = self._lookup(key)
+        if history is not None:
+            self.stats['hits'] += 1
+            return history
+
+        self.stats['misses'] += 1
+        result = await db.execute(
+            select(
+                InventoryItemCostSnapshot.inventory_item_id,
+                InventoryItemCostSnapshot.effective_date,
+                InventoryItemCostSnapshot.unit_cost,
+                InventoryItemCostSnapshot.source,
+            )
+            .where(InventoryItemCostSnapshot.shop_id == shop_id)
+            .order_by(InventoryItemCostSnapshot.effective_date)
+        )
+        history = ShopCostHistory(shop_id, result.tuples())
+        self._store(key, history)
+        return history
+
+    async def resolve(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        lookups: Iterable[Tuple[str, datetime]]
+    ) -> List[Optional[Tuple[Decimal, str]]]:
+        """Resolve many ``(inventory_item_id, at)`` lookups for one shop.
+
+        Returns ``(unit cost, source)`` or None per lookup, in order. Costs
+        at most one query, for an order or a whole backfill batch alike.
+        """
+        history = await self.get_history(db, shop_id)
+        return [
+            history.cost_at(inventory_item_id, at)
+            for inventory_item_id, at in lookups
+        ]
+
+    def mark_changed(self, db: AsyncSession, shop_id: Any) -> None:
+        """Invalidate a shop once ``db``'s transaction commits.
+
+        For snapshot writes that bypass the ORM unit of work.
+        """
+        db.sync_session.info.setdefault('changed_cost_shop_ids', []).append(shop_id)
+
+
+# Global instance
+cost_resolver = CostResolver()
+
+
+def _invalidate_committed(shop_ids: List[Any]) -> None:
+    for shop_id in set(shop_ids):
+        cost_resolver.invalidate_soon(shop_id)
+
+
+# Invalidate cached histories once snapshot writes are committed
+track_committed_writes(
+    'changed_cost_shop_ids',
+    lambda obj: [obj.shop_id] if isinstance(obj, InventoryItemCostSnapshot) else [],
+    _invalidate_committed
+)
@@ -0,0 +1,230 @@
+"""Compiled processing-fee rules from ``Settings.fee_overrides``.
+
+``fee_overrides`` maps gateway names to percentages, as saved by the
+dashboard, and may add finer-grained rules under the reserved ``rules`` key::
+
+    {
+        "paypal": 3.49,
+        "stripe": 2.9,
+        "rules": [
+            {"gateway": "paypal", "fixed": 0.49},
+            {"gateway": "shopify_payments", "card_brand": "American Express", "pct": 3.5},
+            {"currency_mismatch": true, "pct": 4.4, "name": "international"}
+        ]
+    }
+
+A gateway entry is a rule matching that gateway with the default fixed fee.
+A rule matches on any of ``gateway``, ``card_brand``, ``currency``
+(presentment currency) and ``currency_mismatch`` (presentment differs from
+shop currency); omitted fields match anything. ``pct`` and ``fixed`` fall
+back to the gateway's entry, if the rule names one, then to the default
+rule. When several rules match, the one with more fields wins, then the one
+whose fields rank higher in that order; a later rule with the same fields
+replaces an earlier one or a gateway entry.
+
+Rules are compiled once per settings load into a table keyed by field
+pattern, and resolved keys are memoized, so each lookup is a dict hit.
+"""
+
+from decimal import Decimal, InvalidOperation
+from itertools import product
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+MATCH_FIELDS = ('gateway', 'card_brand', 'currency', 'currency_mismatch')
+
+# Field subsets ordered most specific first, ties broken by MATCH_FIELDS order
+PATTERNS = sorted(
+    product((True, False), repeat=len(MATCH_FIELDS)),
+    key=lambda pattern: (-sum(pattern), [not used for used in pattern])
+)
+
+RULE_FIELDS = MATCH_FIELDS + ('pct', 'fixed', 'name')
+
+# Key of fee_overrides holding the rule list; every other key is a gateway
+RULES_KEY = "rules"
+
+DEFAULT_RULE_NAME = "default"
+
+FeeKey = Tuple[Optional[str], Optional[str], Optional[str], bool]
+
+
+class FeeRule:
+    """One resolved fee rate."""
+
+    __slots__ = ('name', 'pct', 'fixed')
+
+    def __init__(self, name: str, pct: Decimal, fixed: Decimal):
+        self.name = name
+        self.pct = pct  # fraction, e.g. 0.029
+        self.fixed = fixed
+
+    def estimate(self, amount: Decimal) -> Decimal:
+        """Estimate the fee on an amount."""
+        return amount * self.pct + self.fixed
+
+
+class FeeRules:
+    """A shop's fee rules compiled into a pattern lookup table."""
+
+    __slots__ = ('default', '_table', '_resolved')
+
+    def __init__(self, default: FeeRule, table: Dict[Tuple[Any, ...], FeeRule]):
+        self.default = default
+        self._table = table
+        self._resolved: Dict[FeeKey, FeeRule] = {}
+
+    @classmethod
+    def compile(
+        cls,
+        fee_overrides: Optional[Dict[str, Any]],
+        default_pct: Decimal,
+        default_fixed: Decimal
+    ) -> "FeeRules":
+        """Compile ``fee_overrides`` on top of the default percentage (a fraction) and fixed fee.
+
+        Raises ValueError for malformed overrides, including unknown rule fields.
+        """
+        fee_overrides = fee_overrides or {}
+        if not isinstance(fee_overrides, dict):
+            raise ValueError(f"fee_overrides must be an object: {fee_overrides!r}")
+        default = FeeRule(DEFAULT_RULE_NAME, default_pct, default_fixed)
+
+        table: Dict[Tuple[Any, ...], FeeRule] = {}
+        for gateway, pct in fee_overrides.items():
+            if gateway == RULES_KEY:
+                continue
+            values = cls._normalize(gateway, None, None, None)
+            table[values] = FeeRule(f"gateway={values[0]}", cls._pct(pct, gateway), default_fixed)
+
+        rules = fee_overrides.get(RULES_KEY, [])
+        if not isinstance(rules, list):
+            raise ValueError(f"Fee rules must be a list: {rules!r}")
+        for rule in rules:
+            if not isinstance(rule, dict):
+                raise ValueError(f"Fee rule must be an object: {rule!r}")
+            unknown = sorted(set(rule) - set(RULE_FIELDS))
+            if unknown:
+                raise ValueError(f"Unknown fee rule fields {unknown}: {rule!r}")
+            for field in MATCH_FIELDS:
+                expected = bool if field == 'currency_mismatch' else str
+                if rule.get(field) is not None and not isinstance(rule[field], expected):
+                    raise ValueError(f"Invalid fee rule {field}: {rule!r}")
+            values = cls._normalize(
+                rule.get('gateway'), rule.get('card_brand'),
+                rule.get('currency'), rule.get('currency_mismatch')
+            )
+            if all(value is None for value in values):
+                raise ValueError(f"Fee rule matches nothing specific: {rule!r}")
+            name = rule.get('name') or ",".join(
+                f"{field}={value}" for field, value in zip(MATCH_FIELDS, values) if value is not None
+            )
+            base = table.get((values[0], None, None, None), default) if values[0] else default
+            pct = cls._pct(rule['pct'], 'pct') if 'pct' in rule else base.pct
+            fixed = cls._decimal(rule['fixed'], 'fixed') if 'fixed' in rule else base.fixed
+            table[values] = FeeRule(name, pct, fixed)
+
+        return cls(default, table)
+
+    def lookup(
+        self,
+        gateway: Optional[str],
+        card_brand: Optional[str],
+        currency: Optional[str],
+        currency_mismatch: bool
+    ) -> FeeRule:
+        """Get the rule for a transaction's attributes."""
+        key = self._normalize(gateway, card_brand, currency, bool(currency_mismatch))
+        rule = self._resolved.get(key)
+        if rule is None:
+            rule = self._resolved[key] = self._resolve(key)
+        return rule
+
+    def estimate(
+        self,
+        amount: Decimal,
+        gateway: Optional[str],
+        card_brand: Optional[str],
+        currency: Optional[str],
+        currency_mismatch: bool
+    ) -> Tuple[Decimal, FeeRule]:
+        """Estimate the fee on an amount and return it with the rule used."""
+        rule = self.lookup(gateway, card_brand, currency, currency_mismatch)
+        return rule.estimate(amount), rule
+
+    def estimate_batch(
+        self,
+        amounts: Sequence[Decimal],
+        keys: Sequence[FeeKey]
+    ) -> Tuple[List[Decimal], List[str]]:
+        """Estimate fees for many amounts; returns the fees and the rule name for each."""
+        rules = [self.lookup(*key) for key in keys]
+        return (
+            [rule.estimate(amount) for amount, rule in zip(amounts, rules)],
+            [rule.name for rule in rules],
+        )
+
+    def with_default(self, pct: Optional[Decimal], fixed: Optional[Decimal]) -> "FeeRules":
+        """Copy with the default rule's percentage (a fraction) or fixed fee replaced."""
+        default = FeeRule(
+            DEFAULT_RULE_NAME,
+            self.default.pct if pct is None else pct,
+            self.default.fixed if fixed is None else fixed
+        )
+        return FeeRules(default, self._table)
+
+    def _resolve(self, key: FeeKey) -> FeeRule:
+        """Find the most specific rule matching a normalized key."""
+        for pattern in PATTERNS:
+            rule = self._table.get(
+                tuple(value if used else None for value, used in zip(key, pattern))
+            )
+            if rule is not None:
+                return rule
+        return self.default
+
+    @staticmethod
+    def _normalize(
+        gateway: Optional[str],
+        card_brand: Optional[str],
+        currency: Optional[str],
+        currency_mismatch: Optional[bool]
+    ) -> Tuple[Any, ...]:
+        """Normalize match values so lookups are case-insensitive."""
+        return (
+            gateway.strip().lower() if gateway else None,
+            card_brand.strip().lower() if card_brand else None,
+            currency.strip().upper() if currency else None,
+            currency_mismatch if currency_mismatch is not None else None,
+        )
+
+    @staticmethod
+    def _decimal(value: Any, field: str) -> Decimal:
+        """Parse a rule amount."""
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"Invalid fee rule {field}: {value!r}")
+        try:
+            amount = Decimal(str(value))
+        except InvalidOperation:
+            raise ValueError(f"Invalid fee rule {field}: {value!r}")
+        if not amount.is_finite() or amount < 0:
+            raise ValueError(f"Invalid fee rule {field}: {value!r}")
+        return amount
+
+    @classmethod
+    def _pct(cls, value: Any, field: str) -> Decimal:
+        """Parse a percentage (0-100) into a fraction."""
+        pct = cls._decimal(value, field)
+        if pct > 100:
+            raise ValueError(f"Fee percentage out of range for {field}: {value!r}")
+        return pct / 100
+
+
+def get_fee_key(
+    gateway: Optional[str],
+    card_brand: Optional[str],
+    currency: Optional[str],
+    shop_currency: Optional[str]
+) -> FeeKey:
+    """Build a lookup key from transaction and order attributes."""
+    return gateway, card_brand, currency, bool(currency and shop_currency and currency != shop_currency)
+
@@ -0,0 +1,184 @@
+"""Shared machinery for in-process caches invalidated across processes.
+
+``InvalidatingCache`` keeps entries per key with a TTL and a size bound and
+drops a key in every process through a Redis pub/sub channel.
+``track_committed_writes`` registers the session hooks that collect what a
+transaction's ORM writes touched and act on it once the transaction commits.
+``BackgroundTasks`` runs the follow-up work without blocking the commit.
+
+Hooks also fire for sessions used outside an event loop (Alembic, scripts);
+there local entries are still dropped, and anything that needs the loop is
+skipped with other processes falling back to their TTL.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Generic, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..db.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BackgroundTasks:
+    """Fire-and-forget tasks, referenced until done so they are not garbage collected."""
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+
+    def spawn(self, func: Callable[..., Awaitable[Any]], *args: Any) -> bool:
+        """Run ``func(*args)`` as a task; return False if no event loop is running."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        task = loop.create_task(func(*args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+
+class InvalidatingCache(Generic[T]):
+    """Entries per key with TTL, LRU size bound and cross-process invalidation.
+
+    Subclasses look entries up with ``_lookup`` and store them with
+    ``_store``, and count their own hits and misses in ``stats``.
+    """
+
+    def __init__(self, channel: str, ttl_seconds: int, max_size: int):
+        self.channel = channel
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, T]]" = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+        self._tasks = BackgroundTasks()
+        self.stats = Counter()
+
+    async def invalidate(self, key: Any) -> None:
+        """Drop a key here and tell every other process to drop it."""
+        self._drop(str(key))
+        try:
+            await get_redis().publish(self.channel, str(key))
+        except Exception as e:
+            # Other processes fall back to the TTL
+            logger.warning("Failed to publish %s invalidation for %s: %s", self.channel, key, e)
+
+    def invalidate_soon(self, key: Any) -> None:
+        """Drop a key here now and publish the invalidation in the background.
+
+        For synchronous callers such as session hooks.
+        """
+        self._drop(str(key))
+        if not self._tasks.spawn(self.invalidate, key):
+            logger.debug("No event loop to publish %s invalidation for %s", self.channel, key)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get cache counters and hit rate."""
+        hits = sum(count for name, count in self.stats.items() if name.endswith('hits'))
+        misses = sum(count for name, count in self.stats.items() if name.endswith('misses'))
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def _lookup(self, key: str) -> Optional[T]:
+        """Get a live entry, starting the invalidation listener on first use."""
+        self._ensure_listener()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key: str, value: T) -> None:
+        """Store an entry, evicting the least recently used beyond ``max_size``."""
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> Optional[T]:
+        """Remove an entry and return its value; override to keep side indexes in step."""
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def _drop(self, key: str) -> None:
+        """Drop one entry because it changed."""
+        if self._remove(key) is not None:
+            self.stats['invalidations'] += 1
+
+    def _ensure_listener(self) -> None:
+        """Start the invalidation subscriber on first use in this event loop."""
+        if self._listener is not None and not self._listener.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Synchronous use; entries then rely on the TTL alone
+            return
+        self._listener = loop.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        """Drop entries named on the invalidation channel, reconnecting on errors."""
+        while True:
+            try:
+                pubsub = get_redis().pubsub()
+                await pubsub.subscribe(self.channel)
+                # Anything published while we were disconnected is lost
+                self.clear()
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        key = message['data']
+                        if isinstance(key, bytes):
+                            key = key.decode('utf-8')
+                        self._drop(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Invalidation listener for %s failed, retrying: %s", self.channel, e)
+                await asyncio.sleep(5)
+
+
+def track_committed_writes(
+    info_key: str,
+    collect: Callable[[Any], Iterable[Any]],
+    on_commit: Callable[[List[Any]], None]
+) -> None:
+    """Call ``on_commit`` with what a transaction's ORM writes touched, once committed.
+
+    ``collect`` maps each new, changed or deleted object to the items to
+    remember (none for unrelated objects). Items are kept in
+    ``session.info[info_key]``, where code writing with bulk statements can
+    append its own; rolled back transactions discard them.
+    """
+
+    @event.listens_for(Session, "after_flush")
+    def _collect(session: Session, flush_context) -> None:
+        changed: List[Any] = session.info.setdefault(info_key, [])
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            changed.extend(collect(obj))
+
+    @event.listens_for(Session, "after_commit")
+    def _commit(session: Session) -> None:
+        changed = session.info.pop(info_key, None)
+        if changed:
+            on_commit(changed)
+
+    @event.listens_for(Session, "after_rollback")
+    def _forget(session: Session) -> None:
+        session.info.pop(info_key, None)
@@ -0,0 +1,192 @@
+"""Compact per-order profit inputs.
+
+``OrderAggregate`` holds what ProfitCalculator needs from an order graph and
+nothing more: parsed totals, a line list, refunded quantities keyed by line,
+recorded fee totals and the primary transaction's fee key. It is built once
+per order, either from a loaded ORM ``Order`` or straight from column
+queries, so large batches never materialize ORM graphs.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import Order, OrderLine, RefundLine, Transaction, TransactionFee
+
+# The order an order's transactions happened in: when they were processed
+# (else stored), then Shopify's id, compared as a number. Rows stored by one
+# INSERT share created_at, and transient rows built from a payload have none.
+TRANSACTION_ORDER = (
+    func.coalesce(Transaction.processed_at, Transaction.created_at),
+    func.length(Transaction.shop_transaction_id),
+    Transaction.shop_transaction_id,
+)
+
+
+def transaction_order_key(transaction: Transaction) -> Tuple[Any, ...]:
+    """Sort key matching TRANSACTION_ORDER, for loaded or transient transactions."""
+    happened_at = transaction.processed_at or transaction.created_at
+    shop_transaction_id = transaction.shop_transaction_id
+    # None sorts last, as NULL does in Postgres
+    return (
+        happened_at is None, happened_at,
+        shop_transaction_id is None, len(shop_transaction_id or ''), shop_transaction_id,
+    )
+
+
+class OrderAggregate:
+    """Profit inputs of one order."""
+
+    __slots__ = (
+        'id', 'processed_at', 'currency', 'presentment_currency', 'total',
+        'refunded_amount', 'has_refunds', 'lines', 'refunded_quantities',
+        'fees', 'fees_estimated', 'gateway', 'card_brand', '_primary_success',
+    )
+
+    def __init__(
+        self,
+        order_id: Any,
+        processed_at: datetime,
+        currency: str,
+        presentment_currency: str,
+        total: Decimal
+    ):
+        self.id = order_id
+        self.processed_at = processed_at
+        self.currency = currency
+        self.presentment_currency = presentment_currency
+        self.total = total
+        self.refunded_amount = Decimal('0')
+        self.has_refunds = False
+        # (line_id, quantity, effective_unit_cost)
+        self.lines: List[Tuple[str, int, Optional[Decimal]]] = []
+        self.refunded_quantities: Dict[str, int] = {}
+        self.fees = Decimal('0')
+        self.fees_estimated = False
+        self.gateway: Optional[str] = None
+        self.card_brand: Optional[str] = None
+        self._primary_success: Optional[bool] = None
+
+    @classmethod
+    def from_order(cls, order: Order) -> "OrderAggregate":
+        """Build from an order with lines, refunds and transactions (with fees) loaded."""
+        aggregate = cls(
+            order.id, order.processed_at, order.currency,
+            order.presentment_currency, order.current_total_price
+        )
+        for line in order.lines:
+            aggregate.lines.append((line.line_id, line.quantity, line.effective_unit_cost))
+        for refund in order.refunds:
+            aggregate.add_refund(refund.line_id, refund.refunded_quantity, refund.refunded_amount)
+        # Same order as load_order_aggregates, which decides the primary transaction
+        for transaction in sorted(order.transactions, key=transaction_order_key):
+            aggregate.add_transaction(
+                transaction.gateway,
+                transaction.card_brand,
+                transaction.status,
+                sum((fee.fee_amount for fee in transaction.fees), Decimal('0')),
+                any(fee.estimated for fee in transaction.fees)
+            )
+        return aggregate
+
+    def add_refund(self, line_id: str, quantity: int, amount: Decimal) -> None:
+        """Add a refund line."""
+        self.has_refunds = True
+        self.refunded_amount += amount
+        self.refunded_quantities[line_id] = self.refunded_quantities.get(line_id, 0) + quantity
+
+    def add_transaction(
+        self,
+        gateway: Optional[str],
+        card_brand: Optional[str],
+        status: str,
+        fees: Decimal,
+        fees_estimated: bool
+    ) -> None:
+        """Add a transaction's fee totals.
+
+        The first successful transaction (else the first) is the primary one
+        whose gateway and card brand select the fee rule.
+        """
+        self.fees += fees
+        self.fees_estimated = self.fees_estimated or fees_estimated
+        success = status == 'success'
+        if self._primary_success is None or (success and not self._primary_success):
+            self.gateway = gateway
+            self.card_brand = card_brand
+            self._primary_success = success
+
+
+async def load_order_aggregates(
+    db: AsyncSession,
+    shop_id: Any,
+    order_ids: Optional[Sequence[Any]] = None,
+    date_range: Optional[Dict[str, datetime]] = None
+) -> List[OrderAggregate]:
+    """Load aggregates for a shop's orders, ordered by ``processed_at``.
+
+    Orders are selected as in ProfitCalculator.calculate_orders_profit. Uses
+    four column queries (orders, lines, refund lines, transactions with fee
+    totals) and builds no ORM objects.
+    """
+    conditions = [Order.shop_id == shop_id]
+    if order_ids is not None:
+        conditions.append(Order.id.in_(order_ids))
+    if date_range is not None:
+        conditions.append(Order.processed_at >= date_range['start'])
+        conditions.append(Order.processed_at <= date_range['end'])
+
+    result = await db.execute(
+        select(
+            Order.id,
+            Order.processed_at,
+            Order.currency,
+            Order.presentment_currency,
+            Order.current_total_price
+        )
+        .where(*conditions)
+        .order_by(Order.processed_at)
+    )
+    aggregates = [OrderAggregate(*row) for row in result]
+    if not aggregates:
+        return aggregates
+    by_id = {aggregate.id: aggregate for aggregate in aggregates}
+
+    result = await db.execute(
+        select(OrderLine.order_id, OrderLine.line_id, OrderLine.quantity, OrderLine.effective_unit_cost)
+        .join(Order, Order.id == OrderLine.order_id)
+        .where(*conditions)
+    )
+    for order_id, line_id, quantity, unit_cost in result:
+        by_id[order_id].lines.append((line_id, quantity, unit_cost))
+
+    result = await db.execute(
+        select(RefundLine.order_id, RefundLine.line_id, RefundLine.refunded_quantity, RefundLine.refunded_amount)
+        .join(Order, Order.id == RefundLine.order_id)
+        .where(*conditions)
+    )
+    for order_id, line_id, quantity, amount in result:
+        by_id[order_id].add_refund(line_id, quantity, amount)
+
+    result = await db.execute(
+        select(
+            Transaction.order_id,
+            Transaction.gateway,
+            Transaction.card_brand,
+            Transaction.status,
+            func.coalesce(func.sum(TransactionFee.fee_amount), 0),
+            func.coalesce(func.bool_or(TransactionFee.estimated), False)
+        )
+        .join(Order, Order.id == Transaction.order_id)
+        .outerjoin(TransactionFee, TransactionFee.transaction_id == Transaction.id)
+        .where(*conditions)
+        .group_by(Transaction.id)
+        .order_by(*TRANSACTION_ORDER)
+    )
+    for order_id, gateway, card_brand, status, fees, fees_estimated in result:
+        by_id[order_id].add_transaction(gateway, card_brand, status, Decimal(fees), fees_estimated)
+
+    return aggregates
@@ -1,6 +1,6 @@
 """Profit calculation service."""
 
-from typing import Dict, Any, List
+from typing import Dict, Any, Optional, Sequence, Union
 from decimal import Decimal
 from datetime import datetime
 
@@ -8,11 +8,58 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 
-from ..db.models import Order, OrderLine, RefundLine, Transaction, TransactionFee, Settings
+from ..db.models import Order, OrderProfit, Shop, Transaction
 from ..config.settings import get_settings
+from .order_aggregate import OrderAggregate, load_order_aggregates
+from .settings_cache import ShopProfitSettings, settings_cache
 
 settings = get_settings()
 
+PERIOD_GRAINS = ('hour', 'day', 'week', 'month', 'quarter', 'year')
+
+PERIOD_FIELDS = ('net_revenue', 'cogs', 'fees', 'shipping_cost', 'ad_spend', 'net_profit')
+
+PROFIT_COLUMNS = (
+    'net_revenue', 'cogs', 'fees', 'shipping_cost', 'ad_spend', 'net_profit', 'margin_pct'
+)
+
+
+class OrderProfitColumns:
+    """Profit breakdowns for many orders, stored column-wise.
+    
+    Position ``i`` of every list belongs to ``order_ids[i]``.
+    """
+    
+    __slots__ = ('order_ids', 'processed_at', 'flags') + PROFIT_COLUMNS
+    
+    def __init__(self):
+        for column in self.__slots__:
+            setattr(self, column, [])
+    
+    def __len__(self) -> int:
+        return len(self.order_ids)
+    
+    def append(self, order: OrderAggregate, profit_data: Dict[str, Any]) -> None:
+        """Add one order's breakdown."""
+        self.order_ids.append(order.id)
+        self.processed_at.append(order.processed_at)
+        self.flags.append(profit_data['flags'])
+        for column in PROFIT_COLUMNS:
+            getattr(self, column).append(profit_data[column])
+    
+    def row(self, index: int) -> Dict[str, Any]:
+        """Get one order's breakdown in the calculate_order_profit shape."""
+        row = {column: getattr(self, column)[index] for column in PROFIT_COLUMNS}
+        row['flags'] = self.flags[index]
+        return row
+    
+    def totals(self) -> Dict[str, Decimal]:
+        """Sum the additive columns."""
+        return {
+            column: sum(getattr(self, column), Decimal('0'))
+            for column in PROFIT_COLUMNS if column != 'margin_pct'
+        }
+
 
 class ProfitCalculator:
     """Calculates profit metrics for orders and periods."""
@@ -35,248 +82,199 @@ class ProfitCalculator:
         )
         order_with_data = result.scalar_one()
         
-        # Calculate components
-        net_revenue = self._calculate_net_revenue(order_with_data)
-        cogs = await self._calculate_cogs(db, order_with_data)
-        fees = await self._calculate_fees(db, order_with_data)
-        shipping_cost = await self._calculate_shipping_cost(db, order_with_data)
-        ad_spend = await self._calculate_ad_spend(db, order_with_data)
-        
-        # Calculate totals
-        net_profit = net_revenue - cogs - fees - shipping_cost - ad_spend
-        margin_pct = (net_profit / net_revenue * 100) if net_revenue > 0 else Decimal('0')
-        
-        # Determine flags
-        flags = self._calculate_flags(order_with_data, fees, cogs)
-        
-        return {
-            'net_revenue': net_revenue,
-            'cogs': cogs,
-            'fees': fees,
-            'shipping_cost': shipping_cost,
-            'ad_spend': ad_spend,
-            'net_profit': net_profit,
-            'margin_pct': margin_pct,
-            'flags': flags
-        }
-    
-    def _calculate_net_revenue(self, order: Order) -> Decimal:
-        """Calculate net revenue (total - refunds)."""
-        total_revenue = order.current_total_price
-        
-        # Subtract refunds
-        refunded_amount = Decimal('0')
-        for refund in order.refunds:
-            refunded_amount += self._extract_amount_from_price_set(
-                refund.refunded_amount_set, order.currency
-            )
-        
-        return total_revenue - refunded_amount
+        return await self.calculate_loaded_order_profit(db, order_with_data)
     
-    async def _calculate_cogs(
+    async def calculate_orders_profit(
         self, 
         db: AsyncSession, 
-        order: Order
-    ) -> Decimal:
-        """Calculate cost of goods sold."""
-        total_cogs = Decimal('0')
-        
-        for line in order.lines:
-            if line.effective_unit_cost:
-                line_cogs = line.effective_unit_cost * line.quantity
-                
-                # Adjust for refunds
-                refunded_qty = self._get_refunded_quantity(order, line.line_id)
-                if refunded_qty > 0:
-                    refunded_cogs = line.effective_unit_cost * refunded_qty
-                    line_cogs -= refunded_cogs
-                
-                total_cogs += line_cogs
+        shop_id: Any, 
+        order_ids: Optional[Sequence[Any]] = None, 
+        date_range: Optional[Dict[str, datetime]] = None
+    ) -> OrderProfitColumns:
+        """Calculate profit breakdowns for many orders of one shop.
         
-        return total_cogs
-    
-    async def _calculate_fees(
-        self, 
-        db: AsyncSession, 
-        order: Order
-    ) -> Decimal:
-        """Calculate processing fees."""
-        total_fees = Decimal('0')
-        estimated_fees = False
+        Orders are selected by ``order_ids`` or by ``processed_at`` within
+        ``date_range`` (``{'start', 'end'}``, as from get_time_period_dates).
+        Orders are loaded as compact aggregates by a few column queries, with
+        no ORM graphs, and Settings is read once, instead of per order.
+        """
+        if order_ids is None and date_range is None:
+            raise ValueError("Either order_ids or date_range is required")
         
-        # Sum actual transaction fees
-        for transaction in order.transactions:
-            for fee in transaction.fees:
-                fee_amount = self._extract_amount_from_price_set(
-                    fee.fee_amount_set, order.currency
-                )
-                total_fees += fee_amount
-                
-                if fee.estimated:
-                    estimated_fees = True
+        aggregates = await load_order_aggregates(db, shop_id, order_ids, date_range)
+        shop_settings = await self._get_shop_settings(db, shop_id)
         
-        # If no fees found, estimate using settings
-        if total_fees == 0:
-            total_fees = await self._estimate_fees(db, order)
-            estimated_fees = True
-        
-        return total_fees
+        columns = OrderProfitColumns()
+        for aggregate in aggregates:
+            columns.append(aggregate, self._calculate_aggregate_profit(aggregate, shop_settings))
+        return columns
     
-    async def _calculate_shipping_cost(
+    async def calculate_loaded_order_profit(
         self, 
         db: AsyncSession, 
         order: Order
-    ) -> Decimal:
-        """Calculate shipping cost using settings."""
-        # Get shop settings
-        result = await db.execute(
-            select(Settings).where(Settings.shop_id == order.shop_id)
-        )
-        settings_obj = result.scalar_one_or_none()
-        
-        if not settings_obj:
-            return Decimal('0')
-        
-        shipping_rule = settings_obj.shipping_cost_rule
-        
-        if shipping_rule['type'] == 'flat':
-            return Decimal(str(shipping_rule['value']))
-        elif shipping_rule['type'] == 'percentage':
-            percentage = Decimal(str(shipping_rule['value'])) / 100
-            return order.current_total_price * percentage
-        
-        return Decimal('0')
+    ) -> Dict[str, Any]:
+        """Calculate profit breakdown for an order whose lines, refunds and
+        transactions (with fees) are already populated, e.g. an in-memory graph."""
+        shop_settings = await self._get_shop_settings(db, order.shop_id)
+        return self._calculate_profit(order, shop_settings)
     
-    async def _calculate_ad_spend(
+    async def _get_shop_settings(
         self, 
         db: AsyncSession, 
-        order: Order
-    ) -> Decimal:
-        """Calculate ad spend for order date."""
-        # This would typically be calculated at the daily level
-        # For individual orders, we might allocate based on order value
-        # For now, return 0 as ad spend is tracked daily
-        return Decimal('0')
+        shop_id: Any
+    ) -> ShopProfitSettings:
+        """Get a shop's settings (cached)."""
+        return await settings_cache.get(db, shop_id)
     
-    def _calculate_flags(
+    def _calculate_profit(
         self, 
         order: Order, 
-        fees: Decimal, 
-        cogs: Decimal
+        shop_settings: ShopProfitSettings
     ) -> Dict[str, Any]:
-        """Calculate order flags."""
+        """Calculate profit breakdown for a loaded order with the shop's settings."""
+        return self._calculate_aggregate_profit(OrderAggregate.from_order(order), shop_settings)
+    
+    def _calculate_aggregate_profit(
+        self, 
+        aggregate: OrderAggregate, 
+        shop_settings: ShopProfitSettings
+    ) -> Dict[str, Any]:
+        """Calculate every profit component and flag of an order in one pass."""
         flags = {}
         
-        # Check for estimated fees
-        has_estimated_fees = False
-        for transaction in order.transactions:
-            for fee in transaction.fees:
-                if fee.estimated:
-                    has_estimated_fees = True
-                    break
+        # Net revenue (total - refunds)
+        net_revenue = aggregate.total - aggregate.refunded_amount
+        
+        # COGS, net of refunded quantities
+        cogs = Decimal('0')
+        refunded_quantities = aggregate.refunded_quantities
+        for line_id, quantity, unit_cost in aggregate.lines:
+            if unit_cost is not None:
+                cogs += unit_cost * (quantity - refunded_quantities.get(line_id, 0))
+            else:
+                flags['no_unit_cost'] = True
         
-        if has_estimated_fees or fees == 0:
+        # Recorded transaction fees, else estimated from the shop's fee rules
+        # using the primary transaction
+        fees = aggregate.fees
+        if aggregate.fees_estimated:
             flags['fees_estimated'] = True
+        if fees == 0:
+            fees, rule = shop_settings.fee_rules.estimate(
+                aggregate.total,
+                aggregate.gateway,
+                aggregate.card_brand,
+                aggregate.presentment_currency,
+                aggregate.presentment_currency != aggregate.currency
+            )
+            flags['fees_estimated'] = True
+            flags['fee_rule'] = rule.name
         
-        # Check for missing unit costs
-        has_missing_costs = False
-        for line in order.lines:
-            if not line.effective_unit_cost:
-                has_missing_costs = True
-                break
+        # Shipping cost from settings
+        if shop_settings.shipping_type == 'flat':
+            shipping_cost = shop_settings.shipping_value
+        elif shop_settings.shipping_type == 'percentage':
+            shipping_cost = aggregate.total * shop_settings.shipping_value / 100
+        else:
+            shipping_cost = Decimal('0')
         
-        if has_missing_costs:
-            flags['no_unit_cost'] = True
+        # Ad spend is tracked daily and allocated to orders by the
+        # ad_spend_allocator; rollup_service keeps the stored allocation
+        ad_spend = Decimal('0')
         
-        # Check for multi-currency
-        if order.currency != order.presentment_currency:
-            flags['multi_currency'] = True
+        # Calculate totals
+        net_profit = net_revenue - cogs - fees - shipping_cost - ad_spend
+        margin_pct = (net_profit / net_revenue * 100) if net_revenue > 0 else Decimal('0')
         
-        # Check for refunds
-        if order.refunds:
+        if aggregate.currency != aggregate.presentment_currency:
+            flags['multi_currency'] = True
+        if aggregate.has_refunds:
             flags['has_refunds'] = True
         
-        return flags
+        return {
+            'net_revenue': net_revenue,
+            'cogs': cogs,
+            'fees': fees,
+            'shipping_cost': shipping_cost,
+            'ad_spend': ad_spend,
+            'net_profit': net_profit,
+            'margin_pct': margin_pct,
+            'flags': flags
+        }
     
-    def _extract_amount_from_price_set(
+    async def calculate_period_profit(
         self, 
-        price_set: Dict[str, Any], 
-        currency: str
-    ) -> Decimal:
-        """Extract amount from price set for given currency."""
-        if not price_set:
-            return Decimal('0')
-        
-        # Try shop money first
-        if 'shop_money' in price_set:
-            shop_money = price_set['shop_money']
-            if shop_money.get('currency_code') == currency:
-                return Decimal(shop_money.get('amount', '0'))
+        db: AsyncSession, 
+        shop_id: Union[Any, Sequence[Any]], 
+        start_date: datetime, 
+        end_date: datetime, 
+        grain: Optional[str] = "day", 
+        timezone: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Calculate profit for a time period for one shop or a list of shops.
         
-        # Try presentment money
-        if 'presentment_money' in price_set:
-            presentment_money = price_set['presentment_money']
-            if presentment_money.get('currency_code') == currency:
-                return Decimal(presentment_money.get('amount', '0'))
+        Runs one aggregate query over order_profit joined to orders, bucketed
+        by ``grain`` (hour, day, week, month, quarter or year; None for totals
+        only). Buckets are in ``timezone`` if given, else each order's shop
+        timezone, so a day of a multi-shop result is every shop's local day
+        with that date. Orders not yet in order_profit count towards
+        orders_count and AOV but add no profit components. Returns the totals
+        plus a ``periods`` list with the same fields per bucket.
+        """
+        if grain is not None and grain not in PERIOD_GRAINS:
+            raise ValueError(f"Unsupported grain: {grain}")
         
-        # Fallback to first available amount
-        for money_type in ['shop_money', 'presentment_money']:
-            if money_type in price_set:
-                money = price_set[money_type]
-                return Decimal(money.get('amount', '0'))
+        shop_ids = list(shop_id) if isinstance(shop_id, (list, tuple, set)) else [shop_id]
         
-        return Decimal('0')
-    
-    def _get_refunded_quantity(self, order: Order, line_id: str) -> int:
-        """Get refunded quantity for a line item."""
-        total_refunded = 0
-        for refund in order.refunds:
-            if refund.line_id == line_id:
-                total_refunded += refund.refunded_quantity
-        return total_refunded
-    
-    async def _estimate_fees(
-        self, 
-        db: AsyncSession, 
-        order: Order
-    ) -> Decimal:
-        """Estimate processing fees using settings."""
-        # Get shop settings
-        result = await db.execute(
-            select(Settings).where(Settings.shop_id == order.shop_id)
+        columns = [
+            func.count(Order.id).label('orders_count'),
+            func.coalesce(func.sum(Order.current_total_price), 0).label('gross_sales'),
+        ] + [
+            func.coalesce(func.sum(getattr(OrderProfit, field)), 0).label(field)
+            for field in PERIOD_FIELDS
+        ]
+        query = (
+            select(*columns)
+            .select_from(Order)
+            .outerjoin(OrderProfit, OrderProfit.order_id == Order.id)
+            .where(
+                Order.shop_id.in_(shop_ids),
+                Order.processed_at >= start_date,
+                Order.processed_at <= end_date
+            )
         )
-        settings_obj = result.scalar_one_or_none()
+        if grain is not None:
+            if timezone is None:
+                query = query.join(Shop, Shop.id == Order.shop_id)
+            zone = timezone if timezone is not None else Shop.timezone
+            period = func.date_trunc(grain, func.timezone(zone, Order.processed_at)).label('period')
+            query = query.add_columns(period).group_by(period).order_by(period)
+        
+        result = await db.execute(query)
+        rows = result.mappings().all()
         
-        if not settings_obj:
-            # Use default settings
-            percentage = Decimal(str(settings.default_fee_percentage)) / 100
-            fixed_fee = Decimal(str(settings.default_fee_fixed))
-            return (order.current_total_price * percentage) + fixed_fee
+        periods = [
+            {'period': row['period'], **self._period_totals(row)}
+            for row in rows
+        ] if grain is not None else []
         
-        # Use shop-specific settings
-        percentage = Decimal(str(settings_obj.fee_default_pct)) / 100
-        fixed_fee = Decimal('0.30')  # Default fixed fee
+        totals = {
+            key: sum((row[key] for row in rows), Decimal('0'))
+            for key in ('gross_sales',) + PERIOD_FIELDS
+        }
+        totals['orders_count'] = sum(row['orders_count'] for row in rows)
         
-        return (order.current_total_price * percentage) + fixed_fee
+        return {**self._period_totals(totals), 'periods': periods}
     
-    async def calculate_period_profit(
-        self, 
-        db: AsyncSession, 
-        shop_id: str, 
-        start_date: datetime, 
-        end_date: datetime
-    ) -> Dict[str, Any]:
-        """Calculate profit for a time period."""
-        # This would aggregate all orders in the period
-        # For now, return a placeholder structure
+    def _period_totals(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape summed components into the period result fields."""
+        net_revenue = Decimal(row['net_revenue'])
+        net_profit = Decimal(row['net_profit'])
+        orders_count = row['orders_count']
         return {
-            'net_revenue': Decimal('0'),
-            'cogs': Decimal('0'),
-            'fees': Decimal('0'),
-            'shipping_cost': Decimal('0'),
-            'ad_spend': Decimal('0'),
-            'net_profit': Decimal('0'),
-            'margin_pct': Decimal('0'),
-            'orders_count': 0,
-            'aov': Decimal('0')
+            **{field: Decimal(row[field]) for field in PERIOD_FIELDS},
+            'margin_pct': (net_profit / net_revenue * 100) if net_revenue > 0 else Decimal('0'),
+            'orders_count': orders_count,
+            'aov': Decimal(row['gross_sales']) / orders_count if orders_count else Decimal('0'),
         }
@@ -0,0 +1,347 @@
+"""Incremental re-costing of stored order lines after cost snapshots change.
+
+A snapshot decides the unit cost of its item's orders created from its
+effective date until the item's next snapshot, so a new or changed snapshot
+only touches lines in that interval. Each batch of changed snapshots is one
+set-based statement that updates those lines, applies the COGS difference to
+their order_profit rows and returns per-day deltas for rollups_daily; no
+order is recalculated.
+
+Snapshot writes trigger a run once their transaction commits: ORM writes
+through the session hooks below, bulk INSERTs by calling
+``recosting_service.mark_changed`` on the session.
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.database import AsyncSessionLocal
+from ..db.models import InventoryItemCostSnapshot
+from ..db.redis import get_redis
+from .invalidating_cache import BackgroundTasks, track_committed_writes
+from .rollup_service import rollup_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# (inventory_item_id, effective_date); a None date stands for every line of the item
+ChangedSnapshot = Tuple[str, Optional[datetime]]
+
+PROGRESS_KEY = "recost:progress:{shop_id}"
+
+# Serializes re-costing per shop, so deltas are computed against settled costs
+LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext(:lock_key))")
+
+# Lines are set to the snapshot in effect when their order was created, or to
+# no cost (source 'null', as at ingest) when none is, e.g. after the only
+# earlier snapshot was deleted; lines whose cost does not change are left
+# alone. COGS deltas count net of refunded quantities and treat a missing cost
+# as zero, as ProfitCalculator does.
+RECOST_SQL = text("""
+    WITH changed AS (
+        SELECT DISTINCT inventory_item_id, effective_date
+        FROM unnest(CAST(:inventory_item_ids AS varchar[]), CAST(:effective_dates AS timestamptz[]))
+            AS c(inventory_item_id, effective_date)
+    ),
+    intervals AS (
+        SELECT c.inventory_item_id,
+               COALESCE(c.effective_date, '-infinity') AS valid_from,
+               CASE WHEN c.effective_date IS NOT NULL THEN (
+                   SELECT min(s.effective_date)
+                   FROM inventory_item_cost_snapshots s
+                   WHERE s.shop_id = :shop_id
+                     AND s.inventory_item_id = c.inventory_item_id
+                     AND s.effective_date > c.effective_date
+               ) END AS valid_to
+        FROM changed c
+    ),
+    costed AS (
+        SELECT DISTINCT ON (ol.id)
+               ol.id, ol.effective_unit_cost AS old_cost, c.unit_cost,
+               COALESCE(c.source, 'null') AS source,
+               ol.quantity - COALESCE(r.quantity, 0) AS net_quantity
+        FROM intervals i
+        JOIN order_lines ol
+          ON ol.shop_id = :shop_id
+         AND ol.inventory_item_id = i.inventory_item_id
+        JOIN orders o
+          ON o.id = ol.order_id
+         AND o.created_at >= i.valid_from
+         AND (i.valid_to IS NULL OR o.created_at < i.valid_to)
+        LEFT JOIN LATERAL (
+            SELECT s.unit_cost, s.source
+            FROM inventory_item_cost_snapshots s
+            WHERE s.shop_id = ol.shop_id
+              AND s.inventory_item_id = ol.inventory_item_id
+              AND s.effective_date <= o.created_at
+            ORDER BY s.effective_date DESC
+            LIMIT 1
+        ) c ON true
+        LEFT JOIN LATERAL (
+            SELECT SUM(rl.refunded_quantity) AS quantity
+            FROM refund_lines rl
+            WHERE rl.order_id = ol.order_id
+              AND rl.line_id = ol.line_id
+        ) r ON true
+        ORDER BY ol.id
+    ),
+    updated AS (
+        UPDATE order_lines ol
+        SET effective_unit_cost = costed.unit_cost,
+            cost_source = costed.source
+        FROM costed
+        WHERE ol.id = costed.id
+          AND (
+              ol.effective_unit_cost IS DISTINCT FROM costed.unit_cost
+              OR ol.cost_source IS DISTINCT FROM costed.source
+          )
+        RETURNING ol.order_id,
+                  (COALESCE(costed.unit_cost, 0) - COALESCE(costed.old_cost, 0))
+                  * costed.net_quantity AS cogs_delta
+    ),
+    order_deltas AS (
+        SELECT order_id, COUNT(*) AS lines, SUM(cogs_delta) AS cogs_delta
+        FROM updated
+        GROUP BY order_id
+    ),
+    profits AS (
+        UPDATE order_profit p
+        SET cogs = p.cogs + d.cogs_delta,
+            net_profit = p.net_profit - d.cogs_delta,
+            margin_pct = CASE
+                WHEN p.net_revenue > 0
+                THEN ROUND((p.net_profit - d.cogs_delta) / p.net_revenue * 100, 2)
+                ELSE 0
+            END,
+            calculated_at = now()
+        FROM order_deltas d
+        WHERE p.order_id = d.order_id
+          AND d.cogs_delta <> 0
+        RETURNING p.order_id, p.date
+    )
+    SELECT d.order_id, d.lines, d.cogs_delta, profits.date
+    FROM order_deltas d
+    LEFT JOIN profits ON profits.order_id = d.order_id
+""")
+
+# Runs after RECOST_SQL so it sees the updated lines
+REFRESH_COST_FLAGS_SQL = text("""
+    WITH flagged AS (
+        UPDATE order_profit p
+        SET flags = CASE
+            WHEN EXISTS (
+                SELECT 1
+                FROM order_lines ol
+                WHERE ol.order_id = p.order_id
+                  AND ol.effective_unit_cost IS NULL
+            )
+            THEN p.flags || CAST('{"no_unit_cost": true}' AS jsonb)
+            ELSE p.flags - 'no_unit_cost'
+        END
+        WHERE p.order_id = ANY(CAST(:order_ids AS uuid[]))
+        RETURNING p.order_id, p.flags
+    )
+    UPDATE orders o
+    SET flags = flagged.flags
+    FROM flagged
+    WHERE o.id = flagged.order_id
+      AND o.flags IS DISTINCT FROM flagged.flags
+""")
+
+
+class RecostingService:
+    """Applies changed unit costs to order lines, order profit and rollups.
+
+    Snapshots are processed in batches, each in its own transaction: a
+    batch's line updates, profit deltas and rollup deltas commit together,
+    and a repeated run finds nothing left to change.
+    """
+
+    def __init__(self):
+        self._tasks = BackgroundTasks()
+
+    async def recost_snapshots(
+        self,
+        shop_id: Any,
+        snapshots: Iterable[ChangedSnapshot],
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Re-cost the lines governed by new or changed snapshots and return counts.
+
+        Progress is logged and published under PROGRESS_KEY after each batch.
+        """
+        batch_size = batch_size or settings.cost_recost_batch_size
+        snapshots = list(dict.fromkeys(snapshots))
+        summary = {
+            "status": "running",
+            "snapshots": len(snapshots),
+            "done": 0,
+            "lines": 0,
+            "orders": 0,
+            "days": 0,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self._report_progress(shop_id, summary)
+
+        try:
+            for start in range(0, len(snapshots), batch_size):
+                batch = snapshots[start:start + batch_size]
+                async with AsyncSessionLocal() as db:
+                    try:
+                        counts = await self.recost_batch(db, shop_id, batch)
+                        await db.commit()
+                    except Exception:
+                        await db.rollback()
+                        raise
+
+                summary["done"] += len(batch)
+                for key in ("lines", "orders", "days"):
+                    summary[key] += counts[key]
+                logger.info(
+                    "Re-costed %d/%d snapshots for shop %s: %d lines, %d orders, %d days",
+                    summary["done"], summary["snapshots"], shop_id,
+                    summary["lines"], summary["orders"], summary["days"]
+                )
+                await self._report_progress(shop_id, summary)
+        except Exception as e:
+            summary["status"] = "failed"
+            summary["error"] = str(e)
+            await self._report_progress(shop_id, summary)
+            raise
+
+        summary["status"] = "completed"
+        await self._report_progress(shop_id, summary)
+        return summary
+
+    async def recost_items(
+        self,
+        shop_id: Any,
+        inventory_item_ids: Iterable[str],
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Re-cost every line of the given inventory items."""
+        return await self.recost_snapshots(
+            shop_id,
+            [(inventory_item_id, None) for inventory_item_id in sorted(set(inventory_item_ids))],
+            batch_size
+        )
+
+    async def recost_batch(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        snapshots: List[ChangedSnapshot]
+    ) -> Dict[str, int]:
+        """Re-cost one batch: lines, order_profit COGS and flags, and rollup deltas.
+
+        Does not commit.
+        """
+        await db.execute(LOCK_SQL, {"lock_key": f"recost:{shop_id}"})
+        result = await db.execute(
+            RECOST_SQL,
+            {
+                "shop_id": shop_id,
+                "inventory_item_ids": [inventory_item_id for inventory_item_id, _ in snapshots],
+                "effective_dates": [effective_date for _, effective_date in snapshots],
+            }
+        )
+        rows = result.all()
+        if not rows:
+            return {"lines": 0, "orders": 0, "days": 0}
+
+        await db.execute(REFRESH_COST_FLAGS_SQL, {"order_ids": [row.order_id for row in rows]})
+
+        # Only days with a changed order_profit row get a delta
+        deltas: Dict[datetime, Dict[str, Decimal]] = {}
+        for row in rows:
+            if row.date is None:
+                continue
+            day_deltas = deltas.setdefault(row.date, {'cogs': Decimal('0'), 'net_profit': Decimal('0')})
+            day_deltas['cogs'] += row.cogs_delta
+            day_deltas['net_profit'] -= row.cogs_delta
+        await rollup_service.apply_rollup_deltas(db, shop_id, deltas)
+
+        return {
+            "lines": sum(row.lines for row in rows),
+            "orders": len(rows),
+            "days": len(deltas),
+        }
+
+    def mark_changed(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        snapshots: Iterable[ChangedSnapshot]
+    ) -> None:
+        """Re-cost snapshots once ``db``'s transaction commits.
+
+        For snapshot writes that bypass the ORM unit of work.
+        """
+        changed = db.sync_session.info.setdefault('changed_cost_snapshots', [])
+        changed.extend((shop_id, inventory_item_id, date) for inventory_item_id, date in snapshots)
+
+    async def get_progress(self, shop_id: Any) -> Optional[Dict[str, Any]]:
+        """Get the latest run's progress for a shop, if any."""
+        value = await get_redis().get(PROGRESS_KEY.format(shop_id=shop_id))
+        return json.loads(value) if value else None
+
+    def _schedule(self, shop_id: Any, snapshots: List[ChangedSnapshot]) -> None:
+        """Run recost_snapshots in the background."""
+        if not self._tasks.spawn(self._run, shop_id, snapshots):
+            logger.warning(
+                "No event loop to re-cost %d snapshots for shop %s; run recost_snapshots for them",
+                len(snapshots), shop_id
+            )
+
+    async def _run(self, shop_id: Any, snapshots: List[ChangedSnapshot]) -> None:
+        """Background run; failures are logged, the next change retries."""
+        try:
+            await self.recost_snapshots(shop_id, snapshots)
+        except Exception as e:
+            logger.error("Re-costing failed for shop %s: %s", shop_id, e)
+
+    async def _report_progress(self, shop_id: Any, summary: Dict[str, Any]) -> None:
+        """Publish progress for status polling."""
+        try:
+            await get_redis().set(
+                PROGRESS_KEY.format(shop_id=shop_id),
+                json.dumps(summary),
+                ex=settings.cost_recost_progress_ttl_seconds
+            )
+        except Exception as e:
+            # Progress is advisory; the log has it too
+            logger.warning("Failed to publish re-costing progress for %s: %s", shop_id, e)
+
+
+# Global instance
+recosting_service = RecostingService()
+
+
+def _collect_snapshot(obj: Any) -> List[Tuple[Any, str, Optional[datetime]]]:
+    """A written snapshot, with any date it moved from."""
+    if not isinstance(obj, InventoryItemCostSnapshot):
+        return []
+    history = inspect(obj).attrs.effective_date.history
+    return [
+        (obj.shop_id, obj.inventory_item_id, effective_date)
+        for effective_date in {obj.effective_date, *history.deleted}
+    ]
+
+
+def _recost_committed(changed: List[Tuple[Any, str, Optional[datetime]]]) -> None:
+    by_shop: Dict[Any, List[ChangedSnapshot]] = {}
+    for shop_id, inventory_item_id, effective_date in changed:
+        by_shop.setdefault(shop_id, []).append((inventory_item_id, effective_date))
+    for shop_id, snapshots in by_shop.items():
+        recosting_service._schedule(shop_id, snapshots)
+
+
+# Start re-costing once new or changed snapshots are committed
+track_committed_writes('changed_cost_snapshots', _collect_snapshot, _recost_committed)
@@ -0,0 +1,104 @@
+"""Rebuilding order_profit and rollups_daily from stored orders.
+
+Recalculates every order of a shop in batches and stores the breakdowns
+through RollupService, so each day's rollup becomes the sum of its orders.
+Storing applies ``new - old``, so a rebuild is safe to repeat or to run while
+webhooks arrive. Needed after migration 0008, which clears the order-derived
+rollup totals written before order_profit existed::
+
+    python -m src.services.rollup_rebuild [--shop example.myshopify.com]
+
+Per-channel ad spend on the rollups is kept; run the ad spend allocator
+afterwards to share it out to the rebuilt orders.
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+
+from ..config.settings import get_settings
+from ..db.database import AsyncSessionLocal, close_db
+from ..db.models import Order, Shop
+from .profit_calculator import ProfitCalculator
+from .rollup_service import rollup_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+profit_calculator = ProfitCalculator()
+
+
+async def rebuild_shop_rollups(shop_id: Any, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Recalculate and store every order of a shop, one transaction per batch.
+
+    Returns the number of orders and batches processed.
+    """
+    batch_size = batch_size or settings.backfill_batch_size
+    summary = {"orders": 0, "batches": 0}
+    last_id = None
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            query = select(Order.id).where(Order.shop_id == shop_id)
+            if last_id is not None:
+                query = query.where(Order.id > last_id)
+            result = await db.execute(query.order_by(Order.id).limit(batch_size))
+            order_ids = result.scalars().all()
+            if not order_ids:
+                break
+
+            columns = await profit_calculator.calculate_orders_profit(db, shop_id, order_ids=order_ids)
+            await rollup_service.store_order_profits(
+                db, shop_id,
+                [
+                    (order_id, columns.processed_at[index], columns.row(index))
+                    for index, order_id in enumerate(columns.order_ids)
+                ]
+            )
+            await db.commit()
+
+        last_id = order_ids[-1]
+        summary["orders"] += len(order_ids)
+        summary["batches"] += 1
+        logger.info("Rebuilt rollups for %d orders of shop %s", summary["orders"], shop_id)
+
+    return summary
+
+
+async def _run_rebuild(args: argparse.Namespace) -> Dict[str, int]:
+    """Resolve CLI arguments and rebuild the selected shops."""
+    try:
+        async with AsyncSessionLocal() as db:
+            query = select(Shop.id).order_by(Shop.shop_domain)
+            if args.shop:
+                query = query.where(Shop.shop_domain == args.shop)
+            result = await db.execute(query)
+            shop_ids = result.scalars().all()
+
+        totals = {"shops": len(shop_ids), "orders": 0, "batches": 0}
+        for shop_id in shop_ids:
+            summary = await rebuild_shop_rollups(shop_id, args.batch_size)
+            totals["orders"] += summary["orders"]
+            totals["batches"] += summary["batches"]
+        return totals
+    finally:
+        await close_db()
+
+
+def main() -> None:
+    """Rebuild rollups from the command line."""
+    parser = argparse.ArgumentParser(description="Recalculate orders and rebuild daily rollups.")
+    parser.add_argument("--shop", help="Shop domain, e.g. example.myshopify.com (default: every shop)")
+    parser.add_argument("--batch-size", type=int, help="Orders per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+    summary = asyncio.run(_run_rebuild(args))
+    logger.info("Rollup rebuild finished: %s", summary)
+
+
+if __name__ == "__main__":
+    main()
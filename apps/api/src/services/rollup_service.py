@@ -0,0 +1,275 @@
+"""Per-order profit storage and delta-based daily rollup maintenance."""
+
+from datetime import datetime, time, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import DailyRollup, Order, OrderProfit
+
+CENT = Decimal('0.01')
+
+# order_profit columns that add up into rollups_daily. Ad spend is per channel
+# on the rollup and maintained by set_ad_spend, so orders contribute their
+# net profit before allocated ad spend.
+ROLLUP_FIELDS = ('net_revenue', 'cogs', 'fees', 'shipping_cost', 'net_profit')
+
+PROFIT_FIELDS = ROLLUP_FIELDS + ('ad_spend', 'margin_pct')
+
+# rollups_daily.margin_pct is NUMERIC(5, 2)
+MAX_MARGIN_PCT = Decimal('999.99')
+
+
+def get_rollup_date(processed_at: datetime) -> datetime:
+    """Get the rollup day (UTC midnight) an order processed at this time counts towards."""
+    if processed_at.tzinfo is not None:
+        processed_at = processed_at.astimezone(timezone.utc)
+    return datetime.combine(processed_at.date(), time.min, tzinfo=timezone.utc)
+
+
+class RollupService:
+    """Keeps order_profit and rollups_daily in step.
+
+    Each order's contribution to its day is the order_profit row; storing a
+    new breakdown applies ``new - old`` to the rollup, so recalculating an
+    order any number of times never double counts it.
+
+    Ad spend is owned by the allocation job: recalculating an order keeps its
+    allocated ``ad_spend`` (unless it moved to another day), and each day's
+    rollup carries the day's spend per channel instead of the sum of
+    allocations.
+    """
+
+    async def store_order_profits(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        entries: List[Tuple[Any, datetime, Dict[str, Any]]]
+    ) -> None:
+        """Persist profit breakdowns and apply their deltas to rollups.
+
+        ``entries`` are ``(order_id, processed_at, profit_data)`` with
+        profit_data shaped like calculate_order_profit's result. Also writes
+        the orders' flags. Does not commit.
+        """
+        if not entries:
+            return
+
+        # Every statement below touches rows in order_id order, so concurrent
+        # writers lock overlapping orders in the same order and cannot deadlock
+        entries = sorted({entry[0]: entry for entry in entries}.values(), key=lambda entry: entry[0])
+        order_ids = [order_id for order_id, _, _ in entries]
+
+        # Make sure every order has a row to lock; a fresh row contributes nothing
+        await db.execute(
+            insert(OrderProfit)
+            .values([
+                {
+                    'order_id': order_id,
+                    'shop_id': shop_id,
+                    'date': get_rollup_date(processed_at),
+                    'flags': {},
+                }
+                for order_id, processed_at, _ in entries
+            ])
+            .on_conflict_do_nothing(index_elements=[OrderProfit.order_id])
+        )
+        result = await db.execute(
+            select(OrderProfit)
+            .where(OrderProfit.order_id.in_(order_ids))
+            .order_by(OrderProfit.order_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        old_rows = {row.order_id: row for row in result.scalars()}
+
+        deltas: Dict[datetime, Dict[str, Decimal]] = {}
+        profit_rows = []
+        for order_id, processed_at, profit_data in entries:
+            old = old_rows[order_id]
+            new_date = get_rollup_date(processed_at)
+            new_values = {
+                field: Decimal(profit_data[field]).quantize(CENT) for field in PROFIT_FIELDS
+            }
+
+            # Swap the calculated ad spend for the stored allocation
+            ad_spend = old.ad_spend if old.date == new_date else Decimal('0')
+            profit_before_ad_spend = new_values['net_profit'] + new_values['ad_spend']
+            new_values['ad_spend'] = ad_spend
+            new_values['net_profit'] = profit_before_ad_spend - ad_spend
+            new_values['margin_pct'] = (
+                (new_values['net_profit'] / new_values['net_revenue'] * 100).quantize(CENT)
+                if new_values['net_revenue'] > 0 else Decimal('0')
+            )
+
+            # Rollups take net profit before allocated ad spend
+            old_contribution = {field: getattr(old, field) for field in ROLLUP_FIELDS}
+            old_contribution['net_profit'] += old.ad_spend
+            new_contribution = {field: new_values[field] for field in ROLLUP_FIELDS}
+            new_contribution['net_profit'] = profit_before_ad_spend
+
+            for field in ROLLUP_FIELDS:
+                self._add_delta(deltas, old.date, field, -old_contribution[field])
+                self._add_delta(deltas, new_date, field, new_contribution[field])
+
+            profit_rows.append({
+                'order_id': order_id,
+                'date': new_date,
+                'flags': profit_data['flags'],
+                **new_values,
+            })
+
+        await db.execute(update(OrderProfit), profit_rows)
+        await db.execute(
+            update(Order),
+            [{'id': row['order_id'], 'flags': row['flags']} for row in profit_rows]
+        )
+
+        await self.apply_rollup_deltas(db, shop_id, deltas)
+
+    async def apply_rollup_deltas(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        deltas: Dict[datetime, Dict[str, Decimal]]
+    ) -> None:
+        """Add per-day component deltas to rollups_daily with one upsert.
+
+        Increments are done in SQL, so concurrent writers never lose updates;
+        days are upserted in date order so they lock rows in a stable order.
+        Does not commit.
+        """
+        rows = []
+        for day, day_deltas in sorted(deltas.items()):
+            if not any(day_deltas.values()):
+                continue
+            values = {field: day_deltas.get(field, Decimal('0')) for field in ROLLUP_FIELDS}
+            rows.append({
+                'shop_id': shop_id,
+                'date': day,
+                'ad_spend': {},
+                'margin_pct': self._margin_pct(values['net_profit'], values['net_revenue']),
+                **values,
+            })
+        if not rows:
+            return
+
+        stmt = insert(DailyRollup).values(rows)
+        net_revenue = DailyRollup.net_revenue + stmt.excluded.net_revenue
+        net_profit = DailyRollup.net_profit + stmt.excluded.net_profit
+        margin_pct = case(
+            (
+                net_revenue > 0,
+                func.least(
+                    func.greatest(net_profit / net_revenue * 100, -MAX_MARGIN_PCT),
+                    MAX_MARGIN_PCT
+                )
+            ),
+            else_=Decimal('0')
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_rollups_daily_shop_date",
+            set_={
+                **{
+                    field: getattr(DailyRollup, field) + getattr(stmt.excluded, field)
+                    for field in ROLLUP_FIELDS
+                },
+                'margin_pct': margin_pct,
+                'updated_at': func.now(),
+            }
+        )
+        await db.execute(stmt)
+
+    async def set_ad_spend(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        spend: Dict[datetime, Dict[str, Decimal]]
+    ) -> Dict[datetime, Decimal]:
+        """Replace the per-channel ad spend of rollup days.
+
+        ``spend`` maps rollup days to ``{channel: amount}``; an empty dict
+        clears a day. Net profit moves by the change in the day's total.
+        Returns the change per day. Does not commit.
+        """
+        if not spend:
+            return {}
+        days = sorted(spend)
+
+        await db.execute(
+            insert(DailyRollup)
+            .values([
+                {'shop_id': shop_id, 'date': day, 'ad_spend': {}}
+                for day in days
+            ])
+            .on_conflict_do_nothing(constraint="uq_rollups_daily_shop_date")
+        )
+        result = await db.execute(
+            select(DailyRollup.id, DailyRollup.date, DailyRollup.ad_spend)
+            .where(
+                DailyRollup.shop_id == shop_id,
+                DailyRollup.date.in_(days)
+            )
+            .order_by(DailyRollup.date)
+            .with_for_update()
+        )
+
+        changes: Dict[datetime, Decimal] = {}
+        rows = []
+        for rollup_id, day, old_channels in result:
+            new_channels = {
+                channel: Decimal(amount).quantize(CENT)
+                for channel, amount in spend[day].items()
+            }
+            old_total = sum((Decimal(str(amount)) for amount in (old_channels or {}).values()), Decimal('0'))
+            new_total = sum(new_channels.values(), Decimal('0'))
+            if new_total != old_total:
+                changes[day] = new_total - old_total
+            rows.append({
+                'id': rollup_id,
+                # JSONB holds numbers, as the dashboard sums them
+                'ad_spend': {channel: float(amount) for channel, amount in new_channels.items()},
+            })
+
+        await db.execute(update(DailyRollup), rows)
+        await self.apply_rollup_deltas(
+            db, shop_id,
+            {day: {'net_profit': -change} for day, change in changes.items()}
+        )
+        return changes
+
+    async def get_order_profit(
+        self,
+        db: AsyncSession,
+        order_id: Any
+    ) -> Optional[OrderProfit]:
+        """Get an order's stored profit breakdown, if calculated."""
+        result = await db.execute(
+            select(OrderProfit).where(OrderProfit.order_id == order_id)
+        )
+        return result.scalar_one_or_none()
+
+    def _margin_pct(self, net_profit: Decimal, net_revenue: Decimal) -> Decimal:
+        """Margin for a new rollup row, clamped to the column's range."""
+        if net_revenue <= 0:
+            return Decimal('0')
+        margin_pct = (net_profit / net_revenue * 100).quantize(CENT)
+        return max(min(margin_pct, MAX_MARGIN_PCT), -MAX_MARGIN_PCT)
+
+    def _add_delta(
+        self,
+        deltas: Dict[datetime, Dict[str, Decimal]],
+        day: datetime,
+        field: str,
+        amount: Decimal
+    ) -> None:
+        """Accumulate a component delta for a day."""
+        day_deltas = deltas.setdefault(day, {})
+        day_deltas[field] = day_deltas.get(field, Decimal('0')) + amount
+
+
+# Global instance
+rollup_service = RollupService()
@@ -0,0 +1,372 @@
+"""What-if profit scenarios over an in-memory columnar snapshot of orders.
+
+A shop's period is loaded once into NumPy arrays (per-order revenue, refunds,
+recorded fees, fee rule key and allocated ad spend; per-line net quantity, unit
+cost and inventory item) with a handful of aggregate queries. Each scenario
+is then a few vectorized expressions over those arrays, so many overrides can
+be compared without touching ``Settings`` or writing anything.
+
+A scenario is a dict of optional overrides on top of the shop's settings::
+
+    {
+        "name": "cheaper processor",
+        "fee_pct": 2.6,                    # percent, for estimated fees
+        "fee_fixed": 0.30,
+        "fee_gateways": {"paypal": {"pct": 3.49, "fixed": 0.49}},   # beats fee rules
+        "estimate_all_fees": False,        # ignore recorded fees
+        "shipping": {"type": "flat", "value": 7},   # or percentage
+        "cogs_multiplier": 1.0,
+        "unit_costs": {"<inventory_item_id>": 12.5},
+        "default_unit_cost": None,         # for lines without a cost
+    }
+
+Figures follow ProfitCalculator's rules, in floats rounded to cents.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.models import Order, OrderLine, OrderProfit, RefundLine, Transaction, TransactionFee
+from .fee_rules import FeeKey, get_fee_key
+from .order_aggregate import TRANSACTION_ORDER
+from .settings_cache import ShopProfitSettings, settings_cache
+
+settings = get_settings()
+
+SCENARIO_KEYS = frozenset({
+    'name', 'fee_pct', 'fee_fixed', 'fee_gateways', 'estimate_all_fees', 'shipping',
+    'cogs_multiplier', 'unit_costs', 'default_unit_cost',
+})
+
+RESULT_FIELDS = ('net_revenue', 'cogs', 'fees', 'shipping_cost', 'ad_spend', 'net_profit')
+
+
+class OrderSnapshot:
+    """Columnar profit inputs for a shop's orders in a period."""
+
+    __slots__ = (
+        'order_count', 'revenue', 'refunds', 'recorded_fees', 'fee_key_codes', 'fee_keys',
+        'ad_spend', 'line_order', 'line_net_qty', 'line_unit_cost', 'line_item_codes',
+        'item_codes',
+    )
+
+    def __init__(self, order_count: int):
+        self.order_count = order_count
+        self.revenue = np.zeros(order_count)
+        self.refunds = np.zeros(order_count)
+        self.recorded_fees = np.zeros(order_count)
+        # Index into ``fee_keys``, the distinct fee rule keys of the orders
+        self.fee_key_codes = np.zeros(order_count, dtype=np.int32)
+        self.fee_keys: List[FeeKey] = []
+        self.ad_spend = np.zeros(order_count)
+        self.line_order = np.zeros(0, dtype=np.int64)
+        self.line_net_qty = np.zeros(0)
+        # NaN where the line has no unit cost
+        self.line_unit_cost = np.zeros(0)
+        self.line_item_codes = np.zeros(0, dtype=np.int64)
+        self.item_codes: Dict[str, int] = {}
+
+
+class ScenarioEngine:
+    """Loads order snapshots (cached briefly) and evaluates scenarios against them."""
+
+    def __init__(
+        self,
+        ttl_seconds: int = settings.scenario_snapshot_ttl_seconds,
+        max_size: int = settings.scenario_snapshot_max_entries
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._snapshots: "OrderedDict[Tuple[str, datetime, datetime], Tuple[float, OrderSnapshot]]" = OrderedDict()
+
+    async def run(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        start_date: datetime,
+        end_date: datetime,
+        scenarios: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Evaluate scenarios for a shop's period against the current settings.
+
+        Returns the baseline and each scenario's totals, with each
+        scenario's difference from the baseline. Raises ValueError for
+        malformed scenarios.
+        """
+        for scenario in scenarios:
+            self._validate(scenario)
+
+        shop_settings = await settings_cache.get(db, shop_id)
+        snapshot = await self.get_snapshot(db, shop_id, start_date, end_date)
+
+        baseline = self.evaluate(snapshot, shop_settings, {})
+        results = []
+        for index, scenario in enumerate(scenarios):
+            totals = self.evaluate(snapshot, shop_settings, scenario)
+            results.append({
+                'name': scenario.get('name') or f"scenario {index + 1}",
+                **totals,
+                'delta': {
+                    field: round(totals[field] - baseline[field], 2)
+                    for field in RESULT_FIELDS + ('margin_pct',)
+                },
+            })
+
+        return {'baseline': baseline, 'scenarios': results}
+
+    async def get_snapshot(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        start_date: datetime,
+        end_date: datetime
+    ) -> OrderSnapshot:
+        """Get a shop's period snapshot, loading it only on a miss."""
+        key = (str(shop_id), start_date, end_date)
+        entry = self._snapshots.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+            self._snapshots.move_to_end(key)
+            return entry[1]
+
+        snapshot = await self._load_snapshot(db, shop_id, start_date, end_date)
+
+        self._snapshots[key] = (time.monotonic(), snapshot)
+        self._snapshots.move_to_end(key)
+        while len(self._snapshots) > self.max_size:
+            self._snapshots.popitem(last=False)
+
+        return snapshot
+
+    def evaluate(
+        self,
+        snapshot: OrderSnapshot,
+        shop_settings: ShopProfitSettings,
+        scenario: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Compute period totals for one scenario."""
+        net_revenue = snapshot.revenue - snapshot.refunds
+
+        # COGS: unit cost x (quantity - refunded quantity), summed per order
+        unit_cost = snapshot.line_unit_cost
+        if scenario.get('unit_costs'):
+            overrides = np.full(len(snapshot.item_codes), np.nan)
+            for inventory_item_id, cost in scenario['unit_costs'].items():
+                code = snapshot.item_codes.get(str(inventory_item_id))
+                if code is not None:
+                    overrides[code] = float(cost)
+            line_overrides = overrides[snapshot.line_item_codes]
+            unit_cost = np.where(np.isnan(line_overrides), unit_cost, line_overrides)
+        if scenario.get('default_unit_cost') is not None:
+            unit_cost = np.where(np.isnan(unit_cost), float(scenario['default_unit_cost']), unit_cost)
+        unit_cost = np.nan_to_num(unit_cost, nan=0.0)
+        if scenario.get('cogs_multiplier') is not None:
+            unit_cost = unit_cost * float(scenario['cogs_multiplier'])
+        cogs = np.bincount(
+            snapshot.line_order,
+            weights=unit_cost * snapshot.line_net_qty,
+            minlength=snapshot.order_count
+        )
+
+        # Fees: recorded fees, else the matching fee rule (or the scenario's
+        # gateway override) applied per distinct fee key
+        fee_rules = shop_settings.fee_rules.with_default(
+            Decimal(str(scenario['fee_pct'])) / 100 if scenario.get('fee_pct') is not None else None,
+            Decimal(str(scenario['fee_fixed'])) if scenario.get('fee_fixed') is not None else None
+        )
+        fee_gateways = scenario.get('fee_gateways') or {}
+        key_pct = np.zeros(len(snapshot.fee_keys))
+        key_fixed = np.zeros(len(snapshot.fee_keys))
+        for code, key in enumerate(snapshot.fee_keys):
+            rule = fee_rules.lookup(*key)
+            key_pct[code] = float(rule.pct)
+            key_fixed[code] = float(rule.fixed)
+            override = fee_gateways.get(key[0])
+            if override:
+                key_pct[code] = float(override.get('pct', fee_rules.default.pct * 100)) / 100
+                key_fixed[code] = float(override.get('fixed', fee_rules.default.fixed))
+        estimated_fees = (
+            snapshot.revenue * key_pct[snapshot.fee_key_codes]
+            + key_fixed[snapshot.fee_key_codes]
+        )
+        if scenario.get('estimate_all_fees'):
+            fees = estimated_fees
+        else:
+            fees = np.where(snapshot.recorded_fees != 0, snapshot.recorded_fees, estimated_fees)
+
+        # Shipping
+        shipping = scenario.get('shipping') or {
+            'type': shop_settings.shipping_type, 'value': shop_settings.shipping_value
+        }
+        if shipping.get('type') == 'flat':
+            shipping_cost = np.full(snapshot.order_count, float(shipping['value']))
+        elif shipping.get('type') == 'percentage':
+            shipping_cost = snapshot.revenue * float(shipping['value']) / 100
+        else:
+            shipping_cost = np.zeros(snapshot.order_count)
+
+        net_profit = net_revenue - cogs - fees - shipping_cost - snapshot.ad_spend
+
+        totals = {
+            'net_revenue': net_revenue.sum(),
+            'cogs': cogs.sum(),
+            'fees': fees.sum(),
+            'shipping_cost': shipping_cost.sum(),
+            'ad_spend': snapshot.ad_spend.sum(),
+            'net_profit': net_profit.sum(),
+        }
+        result = {field: round(float(value), 2) for field, value in totals.items()}
+        result['margin_pct'] = (
+            round(result['net_profit'] / result['net_revenue'] * 100, 2)
+            if result['net_revenue'] > 0 else 0.0
+        )
+        result['orders_count'] = snapshot.order_count
+        return result
+
+    def _validate(self, scenario: Dict[str, Any]) -> None:
+        """Reject unknown keys and unusable values before any work."""
+        if not isinstance(scenario, dict):
+            raise ValueError("Each scenario must be an object")
+        unknown = set(scenario) - SCENARIO_KEYS
+        if unknown:
+            raise ValueError(f"Unknown scenario keys: {', '.join(sorted(unknown))}")
+        shipping = scenario.get('shipping')
+        if shipping is not None and shipping.get('type') not in (None, 'flat', 'percentage'):
+            raise ValueError(f"Unknown shipping type: {shipping.get('type')}")
+        try:
+            for key in ('fee_pct', 'fee_fixed', 'cogs_multiplier', 'default_unit_cost'):
+                if scenario.get(key) is not None:
+                    float(scenario[key])
+            for rule in (scenario.get('fee_gateways') or {}).values():
+                for value in rule.values():
+                    float(value)
+            for cost in (scenario.get('unit_costs') or {}).values():
+                float(cost)
+            if shipping is not None and shipping.get('type'):
+                float(shipping['value'])
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            raise ValueError(f"Invalid scenario value: {e}")
+
+    async def _load_snapshot(
+        self,
+        db: AsyncSession,
+        shop_id: Any,
+        start_date: datetime,
+        end_date: datetime
+    ) -> OrderSnapshot:
+        """Load a period into columns with aggregate queries (no ORM objects)."""
+        in_period = (
+            Order.shop_id == shop_id,
+            Order.processed_at >= start_date,
+            Order.processed_at <= end_date,
+        )
+
+        result = await db.execute(
+            select(
+                Order.id,
+                Order.current_total_price,
+                func.coalesce(OrderProfit.ad_spend, 0),
+                Order.presentment_currency,
+                Order.currency
+            )
+            .outerjoin(OrderProfit, OrderProfit.order_id == Order.id)
+            .where(*in_period)
+        )
+        orders = result.all()
+        order_index = {row[0]: index for index, row in enumerate(orders)}
+
+        snapshot = OrderSnapshot(len(orders))
+        snapshot.revenue = np.fromiter((float(row[1]) for row in orders), dtype=float, count=len(orders))
+        snapshot.ad_spend = np.fromiter((float(row[2]) for row in orders), dtype=float, count=len(orders))
+
+        result = await db.execute(
+            select(RefundLine.order_id, func.sum(RefundLine.refunded_amount))
+            .join(Order, Order.id == RefundLine.order_id)
+            .where(*in_period)
+            .group_by(RefundLine.order_id)
+        )
+        for order_id, amount in result:
+            snapshot.refunds[order_index[order_id]] = float(amount)
+
+        result = await db.execute(
+            select(Transaction.order_id, func.sum(TransactionFee.fee_amount))
+            .join(Order, Order.id == Transaction.order_id)
+            .join(TransactionFee, TransactionFee.transaction_id == Transaction.id)
+            .where(*in_period)
+            .group_by(Transaction.order_id)
+        )
+        for order_id, fees in result:
+            snapshot.recorded_fees[order_index[order_id]] = float(fees)
+
+        # Fee rules match on the primary transaction, as in ProfitCalculator:
+        # the first successful one, else the first
+        result = await db.execute(
+            select(Transaction.order_id, Transaction.gateway, Transaction.card_brand)
+            .join(Order, Order.id == Transaction.order_id)
+            .where(*in_period)
+            .distinct(Transaction.order_id)
+            .order_by(Transaction.order_id, Transaction.status != 'success', *TRANSACTION_ORDER)
+        )
+        primary = {order_id: (gateway, card_brand) for order_id, gateway, card_brand in result}
+        key_codes: Dict[FeeKey, int] = {}
+        for index, row in enumerate(orders):
+            gateway, card_brand = primary.get(row[0], (None, None))
+            key = get_fee_key(gateway, card_brand, row[3], row[4])
+            snapshot.fee_key_codes[index] = key_codes.setdefault(key, len(key_codes))
+        snapshot.fee_keys = list(key_codes)
+
+        refunded_quantities = (
+            select(
+                RefundLine.order_id,
+                RefundLine.line_id,
+                func.sum(RefundLine.refunded_quantity).label('quantity')
+            )
+            .join(Order, Order.id == RefundLine.order_id)
+            .where(*in_period)
+            .group_by(RefundLine.order_id, RefundLine.line_id)
+            .subquery()
+        )
+        result = await db.execute(
+            select(
+                OrderLine.order_id,
+                OrderLine.inventory_item_id,
+                OrderLine.quantity - func.coalesce(refunded_quantities.c.quantity, 0),
+                OrderLine.effective_unit_cost
+            )
+            .join(Order, Order.id == OrderLine.order_id)
+            .outerjoin(
+                refunded_quantities,
+                and_(
+                    refunded_quantities.c.order_id == OrderLine.order_id,
+                    refunded_quantities.c.line_id == OrderLine.line_id
+                )
+            )
+            .where(*in_period)
+        )
+        lines = result.all()
+        item_codes = snapshot.item_codes
+        snapshot.line_order = np.fromiter(
+            (order_index[row[0]] for row in lines), dtype=np.int64, count=len(lines)
+        )
+        snapshot.line_item_codes = np.fromiter(
+            (item_codes.setdefault(row[1], len(item_codes)) for row in lines),
+            dtype=np.int64, count=len(lines)
+        )
+        snapshot.line_net_qty = np.fromiter((row[2] for row in lines), dtype=float, count=len(lines))
+        # NaN marks lines without a cost; a cost of 0 is real, as in ProfitCalculator
+        snapshot.line_unit_cost = np.fromiter(
+            (float(row[3]) if row[3] is not None else np.nan for row in lines), dtype=float, count=len(lines)
+        )
+
+        return snapshot
+
+
+# Global instance
+scenario_engine = ScenarioEngine()
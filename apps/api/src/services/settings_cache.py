@@ -0,0 +1,108 @@
+"""Per-shop cache of Settings and the fee/shipping rules derived from them.
+
+Settings change a few times a year but are needed for every profit
+calculation. Entries live for ``settings_cache_ttl_seconds`` at most; any ORM
+unit-of-work write to a Settings row invalidates the entry in every process
+once committed, through the session hooks below and a Redis pub/sub channel
+(see ``invalidating_cache``). Code that changes settings with a bulk UPDATE
+must call ``settings_cache.invalidate`` itself.
+"""
+
+import logging
+from decimal import Decimal
+from typing import Any, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.models import Settings
+from .fee_rules import FeeRules
+from .invalidating_cache import InvalidatingCache, track_committed_writes
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "settings:invalidate"
+
+
+class ShopProfitSettings:
+    """A shop's Settings with the numeric rules pre-parsed for profit calculation."""
+
+    __slots__ = (
+        'shop_id', 'exists', 'fee_pct', 'fee_fixed', 'fee_overrides', 'fee_rules',
+        'shipping_type', 'shipping_value', 'ad_spend_channels',
+    )
+
+    def __init__(self, shop_id: Any, settings_obj: Optional[Settings]):
+        self.shop_id = shop_id
+        self.exists = settings_obj is not None
+        default_fixed = Decimal(str(settings.default_fee_fixed))
+
+        if settings_obj is None:
+            # App-wide defaults for shops that never saved settings
+            self.fee_pct = Decimal(str(settings.default_fee_percentage)) / 100
+            self.fee_overrides = {}
+            self.fee_rules = FeeRules.compile(None, self.fee_pct, default_fixed)
+            self.fee_fixed = self.fee_rules.default.fixed
+            self.shipping_type = None
+            self.shipping_value = Decimal('0')
+            self.ad_spend_channels = []
+            return
+
+        self.fee_pct = Decimal(str(settings_obj.fee_default_pct)) / 100
+        self.fee_overrides = dict(settings_obj.fee_overrides or {})
+        try:
+            self.fee_rules = FeeRules.compile(self.fee_overrides, self.fee_pct, default_fixed)
+        except ValueError as e:
+            logger.warning("Ignoring invalid fee_overrides for shop %s: %s", shop_id, e)
+            self.fee_rules = FeeRules.compile(None, self.fee_pct, default_fixed)
+        self.fee_fixed = self.fee_rules.default.fixed
+        shipping_rule = settings_obj.shipping_cost_rule or {}
+        self.shipping_type = shipping_rule.get('type')
+        self.shipping_value = Decimal(str(shipping_rule.get('value', 0)))
+        self.ad_spend_channels = list(settings_obj.ad_spend_channels or [])
+
+
+class SettingsCache(InvalidatingCache[ShopProfitSettings]):
+    """Caches ShopProfitSettings per shop with TTL, size bound and cross-process invalidation."""
+
+    def __init__(
+        self,
+        ttl_seconds: int = settings.settings_cache_ttl_seconds,
+        max_size: int = settings.shop_cache_max_size
+    ):
+        super().__init__(INVALIDATION_CHANNEL, ttl_seconds, max_size)
+
+    async def get(self, db: AsyncSession, shop_id: Any) -> ShopProfitSettings:
+        """Get a shop's profit settings, querying only on a miss."""
+        key = str(shop_id)
+        shop_settings = self._lookup(key)
+        if shop_settings is not None:
+            self.stats['hits'] += 1
+            return shop_settings
+
+        self.stats['misses'] += 1
+        result = await db.execute(
+            select(Settings).where(Settings.shop_id == shop_id)
+        )
+        shop_settings = ShopProfitSettings(shop_id, result.scalar_one_or_none())
+        self._store(key, shop_settings)
+        return shop_settings
+
+
+# Global instance
+settings_cache = SettingsCache()
+
+
+def _invalidate_committed(shop_ids: List[Any]) -> None:
+    for shop_id in set(shop_ids):
+        settings_cache.invalidate_soon(shop_id)
+
+
+# Invalidate cached settings once Settings writes are committed
+track_committed_writes(
+    'changed_settings_shop_ids',
+    lambda obj: [obj.shop_id] if isinstance(obj, Settings) else [],
+    _invalidate_committed
+)
@@ -0,0 +1,109 @@
+"""Per-process TTL cache for Shop lookups.
+
+Any ORM unit-of-work write to a Shop row (a reinstall's new access token, an
+uninstall) invalidates the shop in every process once committed, through the
+session hooks below and a Redis pub/sub channel (see ``invalidating_cache``),
+so workers never keep using a stale token for longer than the TTL.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from ..config.settings import get_settings
+from ..db.models import Shop
+from .invalidating_cache import InvalidatingCache, track_committed_writes
+
+settings = get_settings()
+
+INVALIDATION_CHANNEL = "shops:invalidate"
+
+
+class ShopCache(InvalidatingCache[Shop]):
+    """Caches shops by id and by domain with TTL and size bounds.
+    
+    Entries are detached snapshots; callers get a copy merged into their own
+    session with ``load=False``, so a hit costs no SQL and the cached object is
+    never shared between sessions.
+    """
+    
+    def __init__(
+        self, 
+        ttl_seconds: int = settings.shop_cache_ttl_seconds, 
+        max_size: int = settings.shop_cache_max_size
+    ):
+        super().__init__(INVALIDATION_CHANNEL, ttl_seconds, max_size)
+        self._id_by_domain: Dict[str, str] = {}
+    
+    async def get_by_domain(self, db: AsyncSession, shop_domain: str) -> Optional[Shop]:
+        """Get shop by domain."""
+        shop_id = self._id_by_domain.get(shop_domain)
+        cached = self._lookup(shop_id) if shop_id else None
+        if cached is not None:
+            self.stats['domain_hits'] += 1
+            return await db.merge(cached, load=False)
+        
+        self.stats['domain_misses'] += 1
+        result = await db.execute(
+            select(Shop).where(Shop.shop_domain == shop_domain)
+        )
+        shop = result.scalar_one_or_none()
+        if shop is not None:
+            self._put(shop)
+        return shop
+    
+    async def get_by_id(self, db: AsyncSession, shop_id: Any) -> Optional[Shop]:
+        """Get shop by id."""
+        cached = self._lookup(str(shop_id))
+        if cached is not None:
+            self.stats['id_hits'] += 1
+            return await db.merge(cached, load=False)
+        
+        self.stats['id_misses'] += 1
+        result = await db.execute(select(Shop).where(Shop.id == shop_id))
+        shop = result.scalar_one_or_none()
+        if shop is not None:
+            self._put(shop)
+        return shop
+    
+    def clear(self) -> None:
+        """Drop all entries."""
+        super().clear()
+        self._id_by_domain.clear()
+    
+    def _remove(self, key: str) -> Optional[Shop]:
+        """Remove an entry along with its domain mapping."""
+        shop = super()._remove(key)
+        if shop is not None and self._id_by_domain.get(shop.shop_domain) == key:
+            del self._id_by_domain[shop.shop_domain]
+        return shop
+    
+    def _put(self, shop: Shop) -> None:
+        """Store a detached snapshot of a loaded shop."""
+        snapshot = Shop(**{
+            attr.key: getattr(shop, attr.key) for attr in Shop.__mapper__.column_attrs
+        })
+        make_transient_to_detached(snapshot)
+        
+        shop_id = str(shop.id)
+        self._store(shop_id, snapshot)
+        self._id_by_domain[shop.shop_domain] = shop_id
+
+
+# Global instance
+shop_cache = ShopCache()
+
+
+def _invalidate_committed(shop_ids: List[Any]) -> None:
+    for shop_id in set(shop_ids):
+        shop_cache.invalidate_soon(shop_id)
+
+
+# Invalidate cached shops once Shop writes are committed
+track_committed_writes(
+    'changed_shop_ids',
+    lambda obj: [obj.id] if isinstance(obj, Shop) else [],
+    _invalidate_committed
+)
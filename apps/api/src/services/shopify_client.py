@@ -3,12 +3,16 @@
 import httpx
 from typing import Dict, Any, List, Optional
 from datetime import datetime
+from decimal import Decimal
 
 from ..config.settings import get_settings
 from ..db.models import Shop
 
 settings = get_settings()
 
+# Maximum ids per GraphQL nodes() query
+NODES_QUERY_LIMIT = 250
+
 
 class ShopifyClient:
     """Shopify GraphQL API client."""
@@ -33,44 +37,69 @@ class ShopifyClient:
         self, 
         shop: Shop, 
         inventory_item_id: str
-    ) -> Optional[float]:
+    ) -> Optional[Decimal]:
         """Get unit cost for inventory item from Shopify."""
+        costs = await self.get_inventory_item_costs(shop, [inventory_item_id])
+        return costs.get(inventory_item_id)
+    
+    async def get_inventory_item_costs(
+        self, 
+        shop: Shop, 
+        inventory_item_ids: List[str]
+    ) -> Dict[str, Decimal]:
+        """Get unit costs for many inventory items from Shopify.
+        
+        Uses one ``nodes(ids:)`` query per NODES_QUERY_LIMIT ids over a single
+        connection. Untracked items, items without a cost and chunks that fail
+        are left out of the result.
+        """
         query = """
-        query getInventoryItem($id: ID!) {
-            inventoryItem(id: $id) {
-                id
-                unitCost
-                tracked
+        query getInventoryItems($ids: [ID!]!) {
+            nodes(ids: $ids) {
+                ... on InventoryItem {
+                    id
+                    unitCost {
+                        amount
+                        currencyCode
+                    }
+                    tracked
+                }
             }
         }
         """
         
-        variables = {"id": f"gid://shopify/InventoryItem/{inventory_item_id}"}
-        
         url = f"{self._get_shop_url(shop)}/graphql.json"
         headers = self._get_headers(shop.access_token)
+        inventory_item_ids = list(dict.fromkeys(inventory_item_ids))
         
-        payload = {
-            "query": query,
-            "variables": variables
-        }
-        
+        costs = {}
         async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
-                
-                data = response.json()
-                if 'errors' in data:
-                    return None
-                
-                inventory_item = data.get('data', {}).get('inventoryItem')
-                if inventory_item and inventory_item.get('tracked'):
-                    return float(inventory_item.get('unitCost', 0))
+            for start in range(0, len(inventory_item_ids), NODES_QUERY_LIMIT):
+                chunk = inventory_item_ids[start:start + NODES_QUERY_LIMIT]
+                payload = {
+                    "query": query,
+                    "variables": {
+                        "ids": [f"gid://shopify/InventoryItem/{item_id}" for item_id in chunk]
+                    }
+                }
                 
-                return None
-            except Exception:
-                return None
+                try:
+                    response = await client.post(url, json=payload, headers=headers)
+                    response.raise_for_status()
+                    
+                    data = response.json()
+                    if 'errors' in data:
+                        continue
+                    
+                    for node in data.get('data', {}).get('nodes') or []:
+                        if not node or not node.get('tracked') or not node.get('unitCost'):
+                            continue
+                        item_id = node['id'].rsplit('/', 1)[-1]
+                        costs[item_id] = Decimal(str(node['unitCost']['amount']))
+                except Exception:
+                    continue
+        
+        return costs
     
     async def get_order_details(
         self, 
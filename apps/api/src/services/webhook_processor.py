@@ -1,100 +1,119 @@
 """Webhook processing service."""
 
-from typing import Dict, Any, List
+from collections import Counter
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 from datetime import datetime
 from decimal import Decimal
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
 
 from ..db.models import (
-    Order, OrderLine, RefundLine, Transaction, TransactionFee,
-    InventoryItemCostSnapshot, DailyRollup
+    Shop, Order, OrderLine, RefundLine, Transaction, TransactionFee,
+    InventoryItemCostSnapshot
 )
+from ..services.cost_resolver import cost_resolver
 from ..services.profit_calculator import ProfitCalculator
+from ..services.recosting import recosting_service
+from ..services.rollup_service import rollup_service
 from ..services.shopify_client import ShopifyClient
-from ..utils.currency import normalize_amount, convert_currency
+from ..utils.currency import normalize_amount, convert_currency, extract_money_amounts
 from ..utils.dedup import generate_dedup_key
 
 profit_calculator = ProfitCalculator()
 
+ORDER_TOPICS = frozenset({
+    "orders/create",
+    "orders/updated",
+    "orders/paid",
+    "orders/cancelled",
+    "orders/fulfilled",
+    "orders/partially_fulfilled",
+})
+
 
 class WebhookProcessor:
     """Processes webhook events and updates database."""
     
     def __init__(self):
         self.shopify_client = ShopifyClient()
+        self.stale_skips = Counter()
     
     async def process_order_create(
         self, 
         db: AsyncSession, 
         shop: Shop, 
-        payload: Dict[str, Any]
-    ) -> None:
-        """Process order creation webhook."""
+        payload: Dict[str, Any],
+        topic: str = "orders/create"
+    ) -> bool:
+        """Process order creation webhook.
+        
+        The whole order graph is upserted and profit/rollups are updated in a
+        single transaction, so a failure never leaves a partial order behind.
+        Returns False when the payload is older than the stored order and was
+        skipped.
+        """
         order_data = self._extract_order_data(payload)
         
-        # Check if order already exists
-        result = await db.execute(
-            select(Order).where(
-                Order.shop_id == shop.id,
-                Order.shop_order_id == str(order_data['id'])
-            )
-        )
-        existing_order = result.scalar_one_or_none()
+        try:
+            order = await self._upsert_order_graph(db, shop, order_data)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
         
-        if existing_order:
-            # Update existing order
-            await self._update_order(db, existing_order, order_data)
-        else:
-            # Create new order
-            await self._create_order(db, shop, order_data)
+        if order is None:
+            self.stale_skips[topic] += 1
+            return False
+        
+        return True
     
     async def process_order_update(
         self, 
         db: AsyncSession, 
         shop: Shop, 
         payload: Dict[str, Any]
-    ) -> None:
+    ) -> bool:
         """Process order update webhook."""
-        await self.process_order_create(db, shop, payload)
+        return await self.process_order_create(db, shop, payload, topic="orders/updated")
     
     async def process_order_paid(
         self, 
         db: AsyncSession, 
         shop: Shop, 
         payload: Dict[str, Any]
-    ) -> None:
+    ) -> bool:
         """Process order paid webhook."""
-        await self.process_order_create(db, shop, payload)
+        return await self.process_order_create(db, shop, payload, topic="orders/paid")
     
     async def process_order_cancelled(
         self, 
         db: AsyncSession, 
         shop: Shop, 
         payload: Dict[str, Any]
-    ) -> None:
+    ) -> bool:
         """Process order cancelled webhook."""
-        await self.process_order_create(db, shop, payload)
+        return await self.process_order_create(db, shop, payload, topic="orders/cancelled")
     
     async def process_order_fulfilled(
         self, 
         db: AsyncSession, 
         shop: Shop, 
         payload: Dict[str, Any]
-    ) -> None:
+    ) -> bool:
         """Process order fulfilled webhook."""
-        await self.process_order_create(db, shop, payload)
+        return await self.process_order_create(db, shop, payload, topic="orders/fulfilled")
     
     async def process_order_partially_fulfilled(
         self, 
         db: AsyncSession, 
         shop: Shop, 
         payload: Dict[str, Any]
-    ) -> None:
+    ) -> bool:
         """Process order partially fulfilled webhook."""
-        await self.process_order_create(db, shop, payload)
+        return await self.process_order_create(db, shop, payload, topic="orders/partially_fulfilled")
     
     async def process_refund_create(
         self, 
@@ -105,24 +124,19 @@ class WebhookProcessor:
         """Process refund creation webhook."""
         refund_data = self._extract_refund_data(payload)
         
-        # Get the order
-        result = await db.execute(
-            select(Order).where(
-                Order.shop_id == shop.id,
-                Order.shop_order_id == str(refund_data['order_id'])
-            )
-        )
-        order = result.scalar_one_or_none()
-        
+        order = await self._get_order(db, shop, refund_data['order_id'])
         if not order:
             return
         
-        # Process refund lines
-        for refund_line in refund_data.get('refund_line_items', []):
-            await self._create_refund_line(db, shop, order, refund_line)
-        
-        # Recalculate order profit
-        await self._recalculate_order_profit(db, order)
+        try:
+            await self._upsert_refund_lines(
+                db, self._build_refund_line_rows(shop, order.id, refund_data['refund_line_items'])
+            )
+            await self._recalculate_order_profit(db, order)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
     
     async def process_transaction_create(
         self, 
@@ -133,23 +147,141 @@ class WebhookProcessor:
         """Process transaction creation webhook."""
         transaction_data = self._extract_transaction_data(payload)
         
-        # Get the order
-        result = await db.execute(
-            select(Order).where(
-                Order.shop_id == shop.id,
-                Order.shop_order_id == str(transaction_data['order_id'])
+        order = await self._get_order(db, shop, transaction_data['order_id'])
+        if not order:
+            return
+        
+        try:
+            await self._upsert_transactions(
+                db, self._build_transaction_rows(shop, order.id, [transaction_data])
             )
+            await self._recalculate_order_profit(db, order)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    
+    async def process_batch(
+        self, 
+        db: AsyncSession, 
+        shop: Shop, 
+        entries: List[Tuple[str, Dict[str, Any]]]
+    ) -> Dict[str, int]:
+        """Apply many deliveries for one shop inside the caller's transaction.
+        
+        Orders, lines, refund lines, transactions and fees are each written with
+        one bulk upsert, then profit is recalculated once per affected order and
+        rollups once per affected day. Does not commit.
+        """
+        snapshots: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        refunds: List[Dict[str, Any]] = []
+        transactions: List[Dict[str, Any]] = []
+        
+        for topic, payload in entries:
+            if topic in ORDER_TOPICS:
+                order_data = self._extract_order_data(payload)
+                shop_order_id = str(order_data['id'])
+                current = snapshots.get(shop_order_id)
+                if current is None or (
+                    self._parse_datetime(current[1]['updated_at'])
+                    <= self._parse_datetime(order_data['updated_at'])
+                ):
+                    snapshots[shop_order_id] = (topic, order_data)
+            elif topic == "refunds/create":
+                refunds.append(self._extract_refund_data(payload))
+            elif topic == "transactions/create":
+                transactions.append(self._extract_transaction_data(payload))
+            else:
+                raise ValueError(f"Unknown webhook topic: {topic}")
+        
+        # Orders first: stale snapshots are dropped before any child work
+        order_rows = {
+            shop_order_id: self._build_order_row(shop, order_data)
+            for shop_order_id, (_, order_data) in snapshots.items()
+        }
+        upserted = await self._upsert_orders(db, list(order_rows.values()))
+        for shop_order_id, (topic, _) in snapshots.items():
+            if shop_order_id not in upserted:
+                self.stale_skips[topic] += 1
+        
+        order_ids = {shop_order_id: ids[0] for shop_order_id, ids in upserted.items()}
+        child_order_ids = {
+            str(data['order_id']) for data in refunds + transactions
+        } - order_ids.keys()
+        if child_order_ids:
+            result = await db.execute(
+                select(Order.shop_order_id, Order.id).where(
+                    Order.shop_id == shop.id,
+                    Order.shop_order_id.in_(child_order_ids)
+                )
+            )
+            order_ids.update({row.shop_order_id: row.id for row in result})
+        
+        line_rows = await self._build_line_rows(
+            db, shop,
+            [
+                (order_ids[shop_order_id], order_rows[shop_order_id], snapshots[shop_order_id][1]['line_items'])
+                for shop_order_id in upserted
+            ]
         )
-        order = result.scalar_one_or_none()
+        refund_line_rows = []
+        transaction_rows = []
+        for shop_order_id in upserted:
+            _, order_data = snapshots[shop_order_id]
+            order_id = order_ids[shop_order_id]
+            refund_line_rows += self._build_refund_line_rows(
+                shop, order_id,
+                [
+                    refund_line
+                    for refund in order_data['refunds']
+                    for refund_line in refund.get('refund_line_items', [])
+                ]
+            )
+            transaction_rows += self._build_transaction_rows(
+                shop, order_id, order_data['transactions']
+            )
         
-        if not order:
-            return
+        affected_order_ids = {order_ids[shop_order_id] for shop_order_id in upserted}
+        for refund_data in refunds:
+            order_id = order_ids.get(str(refund_data['order_id']))
+            if order_id:
+                refund_line_rows += self._build_refund_line_rows(
+                    shop, order_id, refund_data['refund_line_items']
+                )
+                affected_order_ids.add(order_id)
+        for transaction_data in transactions:
+            order_id = order_ids.get(str(transaction_data['order_id']))
+            if order_id:
+                transaction_rows += self._build_transaction_rows(
+                    shop, order_id, [transaction_data]
+                )
+                affected_order_ids.add(order_id)
         
-        # Create transaction
-        await self._create_transaction(db, shop, order, transaction_data)
+        await self._upsert_order_lines(db, line_rows)
+        await self._upsert_refund_lines(db, refund_line_rows)
+        await self._upsert_transactions(db, transaction_rows)
         
-        # Recalculate order profit
-        await self._recalculate_order_profit(db, order)
+        await self._recalculate_orders_profit(db, shop.id, affected_order_ids)
+        
+        return {
+            'orders': len(affected_order_ids),
+            'stale': len(snapshots) - len(upserted),
+        }
+    
+    async def _get_order(
+        self, 
+        db: AsyncSession, 
+        shop: Shop, 
+        shop_order_id: Any
+    ) -> Optional[Order]:
+        """Get order by Shopify order id."""
+        result = await db.execute(
+            select(Order).where(
+                Order.shop_id == shop.id,
+                Order.shop_order_id == str(shop_order_id)
+            )
+        )
+        return result.scalar_one_or_none()
     
     def _extract_order_data(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Extract order data from webhook payload."""
@@ -189,6 +321,7 @@ class WebhookProcessor:
             'id': payload['id'],
             'order_id': payload['order_id'],
             'gateway': payload['gateway'],
+            'card_brand': (payload.get('payment_details') or {}).get('credit_card_company'),
             'status': payload['status'],
             'amount': payload['amount'],
             'currency': payload['currency'],
@@ -196,267 +329,484 @@ class WebhookProcessor:
             'fee': payload.get('fee'),
         }
     
-    async def _create_order(
+    async def _upsert_order_graph(
         self, 
         db: AsyncSession, 
         shop: Shop, 
         order_data: Dict[str, Any]
-    ) -> Order:
-        """Create new order in database."""
-        # Parse dates
-        created_at = datetime.fromisoformat(order_data['created_at'].replace('Z', '+00:00'))
-        processed_at = datetime.fromisoformat(
-            order_data.get('processed_at', order_data['created_at']).replace('Z', '+00:00')
+    ) -> Optional[Order]:
+        """Upsert an order and all its children without committing.
+        
+        Each table is written with one bulk ``INSERT ... ON CONFLICT`` and the
+        profit is calculated from the in-memory graph instead of reloading it.
+        Returns None, without touching child rows or profit, when the stored
+        order is already at the same or a newer version.
+        """
+        order_row = self._build_order_row(shop, order_data)
+        upserted = await self._upsert_order(db, order_row)
+        if upserted is None:
+            return None
+        order_id, inserted = upserted
+        
+        line_rows = await self._build_line_rows(
+            db, shop, [(order_id, order_row, order_data['line_items'])]
         )
-        
-        # Create order
-        order = Order(
-            shop_id=shop.id,
-            shop_order_id=str(order_data['id']),
-            created_at=created_at,
-            processed_at=processed_at,
-            currency=order_data['currency'],
-            presentment_currency=order_data['presentment_currency'],
-            current_total_price=Decimal(order_data['total_price']),
-            current_total_discounts=Decimal(order_data['total_discounts']),
-            current_total_tax=Decimal(order_data['total_tax']),
-            current_total_duties=Decimal(order_data['total_duties']) if order_data.get('total_duties') else None,
-            current_total_shipping_price_set=order_data.get('total_shipping_price_set'),
-            financial_status=order_data['financial_status'],
-            fulfillment_status=order_data.get('fulfillment_status'),
-            customer_id=str(order_data['customer_id']) if order_data.get('customer_id') else None,
-            flags={}
+        refund_line_rows = self._build_refund_line_rows(
+            shop, order_id,
+            [
+                refund_line
+                for refund in order_data['refunds']
+                for refund_line in refund.get('refund_line_items', [])
+            ]
+        )
+        transaction_rows = self._build_transaction_rows(
+            shop, order_id, order_data['transactions']
         )
         
-        db.add(order)
-        await db.commit()
-        await db.refresh(order)
-        
-        # Process line items
-        for line_item in order_data.get('line_items', []):
-            await self._create_order_line(db, shop, order, line_item)
-        
-        # Process refunds
-        for refund in order_data.get('refunds', []):
-            for refund_line in refund.get('refund_line_items', []):
-                await self._create_refund_line(db, shop, order, refund_line)
-        
-        # Process transactions
-        for transaction in order_data.get('transactions', []):
-            await self._create_transaction(db, shop, order, transaction)
+        await self._upsert_order_lines(db, line_rows)
+        await self._upsert_refund_lines(db, refund_line_rows)
+        fee_rows = await self._upsert_transactions(db, transaction_rows)
+        
+        # Assemble the in-memory graph (transient objects, never added to the session)
+        order = Order(id=order_id, **order_row)
+        order.lines = [OrderLine(**row) for row in line_rows]
+        order.refunds = [RefundLine(**row) for row in refund_line_rows]
+        
+        if transaction_rows or inserted:
+            fees_by_transaction = {row['transaction_id']: row for row in fee_rows}
+            transactions = []
+            for row, _ in transaction_rows:
+                transaction = Transaction(**row)
+                fee_row = fees_by_transaction.get(row['id'])
+                transaction.fees = [TransactionFee(**fee_row)] if fee_row else []
+                transactions.append(transaction)
+            order.transactions = transactions
+        else:
+            # Order payloads often omit transactions; keep the ones that arrived
+            # through transactions/create.
+            order.transactions = await self._load_transactions(db, order_id)
         
-        # Calculate profit
-        await self._recalculate_order_profit(db, order)
+        await self._apply_order_profit(db, order)
         
         return order
     
-    async def _update_order(
+    def _build_order_row(
         self, 
-        db: AsyncSession, 
-        order: Order, 
+        shop: Shop, 
         order_data: Dict[str, Any]
-    ) -> None:
-        """Update existing order."""
-        # Update order fields
-        order.updated_at = datetime.utcnow()
-        order.current_total_price = Decimal(order_data['total_price'])
-        order.current_total_discounts = Decimal(order_data['total_discounts'])
-        order.current_total_tax = Decimal(order_data['total_tax'])
-        order.current_total_duties = Decimal(order_data['total_duties']) if order_data.get('total_duties') else None
-        order.financial_status = order_data['financial_status']
-        order.fulfillment_status = order_data.get('fulfillment_status')
-        
-        await db.commit()
-        
-        # Recalculate profit
-        await self._recalculate_order_profit(db, order)
+    ) -> Dict[str, Any]:
+        """Build orders row values from extracted order data."""
+        return {
+            'shop_id': shop.id,
+            'shop_order_id': str(order_data['id']),
+            'created_at': self._parse_datetime(order_data['created_at']),
+            'processed_at': self._parse_datetime(order_data.get('processed_at') or order_data['created_at']),
+            'currency': order_data['currency'],
+            'presentment_currency': order_data['presentment_currency'],
+            'current_total_price': Decimal(order_data['total_price']),
+            'current_total_discounts': Decimal(order_data['total_discounts']),
+            'current_total_tax': Decimal(order_data['total_tax']),
+            'current_total_duties': Decimal(order_data['total_duties']) if order_data.get('total_duties') else None,
+            'current_total_shipping_price_set': order_data.get('total_shipping_price_set'),
+            'financial_status': order_data['financial_status'],
+            'fulfillment_status': order_data.get('fulfillment_status'),
+            'customer_id': str(order_data['customer_id']) if order_data.get('customer_id') else None,
+            'shop_updated_at': self._parse_datetime(order_data.get('updated_at')),
+            'flags': {},
+        }
     
-    async def _create_order_line(
+    async def _build_line_rows(
         self, 
         db: AsyncSession, 
         shop: Shop, 
-        order: Order, 
-        line_item: Dict[str, Any]
-    ) -> OrderLine:
-        """Create order line item."""
-        # Get unit cost from inventory item
-        unit_cost, cost_source = await self._get_unit_cost(
-            db, shop, line_item['inventory_item_id'], order.created_at
+        orders: List[Tuple[Any, Dict[str, Any], List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """Build order_lines rows for ``(order_id, order_row, line_items)``
+        entries, resolving every line's unit cost in one call."""
+        entries = [
+            (order_id, order_row, line_item)
+            for order_id, order_row, line_items in orders
+            for line_item in line_items
+        ]
+        unit_costs = await self._get_unit_costs(
+            db, shop,
+            [
+                (str(line_item['inventory_item_id']), order_row['created_at'])
+                for _, order_row, line_item in entries
+            ]
         )
         
-        order_line = OrderLine(
-            shop_id=shop.id,
-            order_id=order.id,
-            line_id=str(line_item['id']),
-            product_id=str(line_item['product_id']),
-            variant_id=str(line_item['variant_id']),
-            inventory_item_id=str(line_item['inventory_item_id']),
-            quantity=line_item['quantity'],
-            price_set=line_item['price_set'],
-            discount_allocations=line_item.get('discount_allocations', []),
-            presentment_currency=order.presentment_currency,
-            shop_currency=order.currency,
-            effective_unit_cost=unit_cost,
-            cost_source=cost_source
-        )
-        
-        db.add(order_line)
-        await db.commit()
-        await db.refresh(order_line)
-        
-        return order_line
+        rows = []
+        for (order_id, order_row, line_item), (unit_cost, cost_source) in zip(entries, unit_costs):
+            price, presentment_price = extract_money_amounts(line_item['price_set'])
+            rows.append({
+                'shop_id': shop.id,
+                'order_id': order_id,
+                'line_id': str(line_item['id']),
+                'product_id': str(line_item['product_id']),
+                'variant_id': str(line_item['variant_id']),
+                'inventory_item_id': str(line_item['inventory_item_id']),
+                'quantity': line_item['quantity'],
+                'price_set': line_item['price_set'],
+                'price': price,
+                'presentment_price': presentment_price,
+                'discount_allocations': line_item.get('discount_allocations', []),
+                'presentment_currency': order_row['presentment_currency'],
+                'shop_currency': order_row['currency'],
+                'effective_unit_cost': unit_cost,
+                'cost_source': cost_source,
+            })
+        return rows
     
-    async def _create_refund_line(
+    def _build_refund_line_rows(
         self, 
-        db: AsyncSession, 
         shop: Shop, 
-        order: Order, 
-        refund_line: Dict[str, Any]
-    ) -> RefundLine:
-        """Create refund line item."""
-        refund_line_obj = RefundLine(
-            shop_id=shop.id,
-            order_id=order.id,
-            line_id=str(refund_line['line_item_id']),
-            refunded_quantity=refund_line['quantity'],
-            refunded_amount_set=refund_line.get('subtotal_set', {})
-        )
-        
-        db.add(refund_line_obj)
-        await db.commit()
-        await db.refresh(refund_line_obj)
-        
-        return refund_line_obj
+        order_id: Any, 
+        refund_line_items: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Build refund_lines rows."""
+        rows = []
+        for refund_line in refund_line_items:
+            refunded_amount_set = refund_line.get('subtotal_set', {})
+            refunded_amount, presentment_refunded_amount = extract_money_amounts(refunded_amount_set)
+            rows.append({
+                'shop_id': shop.id,
+                'order_id': order_id,
+                'line_id': str(refund_line['line_item_id']),
+                'refund_line_id': str(refund_line['id']) if refund_line.get('id') else None,
+                'refunded_quantity': refund_line['quantity'],
+                'refunded_amount_set': refunded_amount_set,
+                'refunded_amount': refunded_amount,
+                'presentment_refunded_amount': presentment_refunded_amount,
+            })
+        return rows
     
-    async def _create_transaction(
+    def _build_transaction_rows(
         self, 
-        db: AsyncSession, 
         shop: Shop, 
-        order: Order, 
-        transaction_data: Dict[str, Any]
-    ) -> Transaction:
-        """Create transaction."""
-        processed_at = None
-        if transaction_data.get('processed_at'):
-            processed_at = datetime.fromisoformat(
-                transaction_data['processed_at'].replace('Z', '+00:00')
-            )
-        
-        transaction = Transaction(
-            shop_id=shop.id,
-            order_id=order.id,
-            gateway=transaction_data['gateway'],
-            status=transaction_data['status'],
-            amount_set={
-                'shop_money': {
-                    'amount': transaction_data['amount'],
-                    'currency_code': transaction_data['currency']
-                },
-                'presentment_money': {
-                    'amount': transaction_data['amount'],
+        order_id: Any, 
+        transactions: List[Dict[str, Any]]
+    ) -> List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """Build (transaction row, fee row) pairs.
+        
+        Fee rows are keyed by transaction id once the transaction is written.
+        """
+        rows = []
+        for transaction_data in transactions:
+            money = {
+                'amount': transaction_data['amount'],
+                'currency_code': transaction_data['currency']
+            }
+            amount_set = {'shop_money': money, 'presentment_money': money}
+            amount, presentment_amount = extract_money_amounts(amount_set)
+            transaction_row = {
+                'shop_id': shop.id,
+                'order_id': order_id,
+                'shop_transaction_id': str(transaction_data['id']),
+                'gateway': transaction_data['gateway'],
+                'card_brand': transaction_data.get('card_brand') or (
+                    transaction_data.get('payment_details') or {}
+                ).get('credit_card_company'),
+                'status': transaction_data['status'],
+                'amount_set': amount_set,
+                'amount': amount,
+                'presentment_amount': presentment_amount,
+                'processed_at': self._parse_datetime(transaction_data.get('processed_at')),
+            }
+            
+            fee_row = None
+            if transaction_data.get('fee'):
+                fee_money = {
+                    'amount': transaction_data['fee'],
                     'currency_code': transaction_data['currency']
                 }
+                fee_amount_set = {'shop_money': fee_money, 'presentment_money': fee_money}
+                fee_amount, presentment_fee_amount = extract_money_amounts(fee_amount_set)
+                fee_row = {
+                    'shop_id': shop.id,
+                    'fee_amount_set': fee_amount_set,
+                    'fee_amount': fee_amount,
+                    'presentment_fee_amount': presentment_fee_amount,
+                    'currency': transaction_data['currency'],
+                    'presentment_currency': transaction_data['currency'],
+                    'estimated': False,
+                }
+            
+            rows.append((transaction_row, fee_row))
+        return rows
+    
+    async def _upsert_order(
+        self, 
+        db: AsyncSession, 
+        order_row: Dict[str, Any]
+    ) -> Optional[Tuple[Any, bool]]:
+        """Upsert the order row, returning its id and whether it was inserted.
+        
+        The update only applies when the payload's ``updated_at`` is newer than
+        the stored version; otherwise no row is returned and None is returned.
+        """
+        upserted = await self._upsert_orders(db, [order_row])
+        return upserted.get(order_row['shop_order_id'])
+    
+    async def _upsert_orders(
+        self, 
+        db: AsyncSession, 
+        order_rows: List[Dict[str, Any]]
+    ) -> Dict[str, Tuple[Any, bool]]:
+        """Bulk upsert order rows with version checks.
+        
+        Returns ``{shop_order_id: (id, inserted)}`` for the rows that were
+        written; stale rows are left out.
+        """
+        if not order_rows:
+            return {}
+        
+        stmt = insert(Order).values(order_rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_orders_shop_order_id",
+            set_={
+                'processed_at': stmt.excluded.processed_at,
+                'current_total_price': stmt.excluded.current_total_price,
+                'current_total_discounts': stmt.excluded.current_total_discounts,
+                'current_total_tax': stmt.excluded.current_total_tax,
+                'current_total_duties': stmt.excluded.current_total_duties,
+                'current_total_shipping_price_set': stmt.excluded.current_total_shipping_price_set,
+                'financial_status': stmt.excluded.financial_status,
+                'fulfillment_status': stmt.excluded.fulfillment_status,
+                'customer_id': stmt.excluded.customer_id,
+                'shop_updated_at': stmt.excluded.shop_updated_at,
+                'updated_at': func.now(),
             },
-            processed_at=processed_at
+            where=or_(
+                Order.shop_updated_at.is_(None),
+                stmt.excluded.shop_updated_at.is_(None),
+                Order.shop_updated_at < stmt.excluded.shop_updated_at
+            )
+        ).returning(
+            Order.id, Order.shop_order_id, literal_column("xmax = 0").label("inserted")
         )
         
-        db.add(transaction)
-        await db.commit()
-        await db.refresh(transaction)
+        result = await db.execute(stmt)
+        return {row.shop_order_id: (row.id, row.inserted) for row in result}
+    
+    async def _upsert_order_lines(
+        self, 
+        db: AsyncSession, 
+        rows: List[Dict[str, Any]]
+    ) -> None:
+        """Bulk upsert order lines."""
+        if not rows:
+            return
         
-        # Create transaction fee if available
-        if transaction_data.get('fee'):
-            await self._create_transaction_fee(db, shop, transaction, transaction_data)
+        rows = self._dedupe_rows(rows, ('order_id', 'line_id'))
+        stmt = insert(OrderLine).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_order_lines_order_line",
+            set_={
+                'quantity': stmt.excluded.quantity,
+                'price_set': stmt.excluded.price_set,
+                'price': stmt.excluded.price,
+                'presentment_price': stmt.excluded.presentment_price,
+                'discount_allocations': stmt.excluded.discount_allocations,
+                'effective_unit_cost': stmt.excluded.effective_unit_cost,
+                'cost_source': stmt.excluded.cost_source,
+            }
+        )
+        await db.execute(stmt)
+    
+    async def _upsert_refund_lines(
+        self, 
+        db: AsyncSession, 
+        rows: List[Dict[str, Any]]
+    ) -> None:
+        """Bulk upsert refund lines."""
+        if not rows:
+            return
         
-        return transaction
+        rows = self._dedupe_rows(rows, ('order_id', 'refund_line_id'))
+        stmt = insert(RefundLine).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_refund_lines_order_refund_line",
+            set_={
+                'refunded_quantity': stmt.excluded.refunded_quantity,
+                'refunded_amount_set': stmt.excluded.refunded_amount_set,
+                'refunded_amount': stmt.excluded.refunded_amount,
+                'presentment_refunded_amount': stmt.excluded.presentment_refunded_amount,
+            }
+        )
+        await db.execute(stmt)
     
-    async def _create_transaction_fee(
+    async def _upsert_transactions(
         self, 
         db: AsyncSession, 
-        shop: Shop, 
-        transaction: Transaction, 
-        transaction_data: Dict[str, Any]
-    ) -> TransactionFee:
-        """Create transaction fee."""
-        fee_amount = transaction_data.get('fee', '0')
-        
-        transaction_fee = TransactionFee(
-            shop_id=shop.id,
-            transaction_id=transaction.id,
-            fee_amount_set={
-                'shop_money': {
-                    'amount': fee_amount,
-                    'currency_code': transaction_data['currency']
-                },
-                'presentment_money': {
-                    'amount': fee_amount,
-                    'currency_code': transaction_data['currency']
-                }
-            },
-            currency=transaction_data['currency'],
-            presentment_currency=transaction_data['currency'],
-            estimated=False
+        rows: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """Bulk upsert transactions and their fees.
+        
+        Returns the written fee rows with ``transaction_id`` set.
+        """
+        if not rows:
+            return []
+        
+        transaction_rows = self._dedupe_rows(
+            [transaction_row for transaction_row, _ in rows],
+            ('order_id', 'shop_transaction_id')
         )
+        stmt = insert(Transaction).values(transaction_rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_transactions_order_transaction",
+            set_={
+                'gateway': stmt.excluded.gateway,
+                'card_brand': stmt.excluded.card_brand,
+                'status': stmt.excluded.status,
+                'amount_set': stmt.excluded.amount_set,
+                'amount': stmt.excluded.amount,
+                'presentment_amount': stmt.excluded.presentment_amount,
+                'processed_at': stmt.excluded.processed_at,
+            }
+        ).returning(Transaction.id, Transaction.order_id, Transaction.shop_transaction_id)
+        
+        result = await db.execute(stmt)
+        transaction_ids = {
+            (row.order_id, row.shop_transaction_id): row.id for row in result
+        }
         
-        db.add(transaction_fee)
-        await db.commit()
-        await db.refresh(transaction_fee)
+        fee_rows_by_transaction = {}
+        for transaction_row, fee_row in rows:
+            transaction_row['id'] = transaction_ids[
+                (transaction_row['order_id'], transaction_row['shop_transaction_id'])
+            ]
+            if fee_row:
+                fee_rows_by_transaction[transaction_row['id']] = {
+                    **fee_row, 'transaction_id': transaction_row['id']
+                }
+        fee_rows = list(fee_rows_by_transaction.values())
+        
+        if fee_rows:
+            fee_stmt = insert(TransactionFee).values(fee_rows)
+            fee_stmt = fee_stmt.on_conflict_do_update(
+                constraint="uq_transaction_fees_transaction",
+                set_={
+                    'fee_amount_set': fee_stmt.excluded.fee_amount_set,
+                    'fee_amount': fee_stmt.excluded.fee_amount,
+                    'presentment_fee_amount': fee_stmt.excluded.presentment_fee_amount,
+                    'currency': fee_stmt.excluded.currency,
+                    'presentment_currency': fee_stmt.excluded.presentment_currency,
+                    'estimated': fee_stmt.excluded.estimated,
+                }
+            )
+            await db.execute(fee_stmt)
         
-        return transaction_fee
+        return fee_rows
     
-    async def _get_unit_cost(
+    def _dedupe_rows(
+        self, 
+        rows: List[Dict[str, Any]], 
+        key_fields: Tuple[str, ...]
+    ) -> List[Dict[str, Any]]:
+        """Keep the last row per natural key.
+        
+        A single ``INSERT ... ON CONFLICT DO UPDATE`` cannot touch the same row
+        twice. Rows with a NULL key never conflict and are all kept.
+        """
+        deduped = {}
+        for index, row in enumerate(rows):
+            key = tuple(row[field] for field in key_fields)
+            if any(value is None for value in key):
+                key = ('__row__', index)
+            deduped[key] = row
+        return list(deduped.values())
+    
+    async def _load_transactions(
         self, 
         db: AsyncSession, 
-        shop: Shop, 
-        inventory_item_id: str, 
-        order_date: datetime
-    ) -> tuple[Decimal | None, str]:
-        """Get unit cost for inventory item at order date."""
-        # Look for existing snapshot
+        order_id: Any
+    ) -> List[Transaction]:
+        """Load stored transactions with fees for an order."""
         result = await db.execute(
-            select(InventoryItemCostSnapshot)
-            .where(
-                InventoryItemCostSnapshot.shop_id == shop.id,
-                InventoryItemCostSnapshot.inventory_item_id == inventory_item_id,
-                InventoryItemCostSnapshot.effective_date <= order_date
-            )
-            .order_by(InventoryItemCostSnapshot.effective_date.desc())
+            select(Transaction)
+            .options(selectinload(Transaction.fees))
+            .where(Transaction.order_id == order_id)
         )
-        snapshot = result.scalar_one_or_none()
-        
-        if snapshot:
-            return snapshot.unit_cost, snapshot.source
-        
-        # Try to fetch from Shopify API
-        try:
-            unit_cost = await self.shopify_client.get_inventory_item_cost(
-                shop, inventory_item_id
-            )
-            if unit_cost:
-                # Store snapshot
-                snapshot = InventoryItemCostSnapshot(
-                    shop_id=shop.id,
-                    inventory_item_id=inventory_item_id,
-                    effective_date=order_date,
-                    unit_cost=unit_cost,
-                    currency=shop.currency,
-                    source='api'
+        return list(result.scalars().all())
+    
+    def _parse_datetime(self, value: Optional[str]) -> Optional[datetime]:
+        """Parse a Shopify ISO-8601 timestamp."""
+        if not value:
+            return None
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    
+    async def _get_unit_costs(
+        self, 
+        db: AsyncSession, 
+        shop: Shop, 
+        lookups: List[Tuple[str, datetime]]
+    ) -> List[Tuple[Decimal | None, str]]:
+        """Get ``(unit cost, cost source)`` per ``(inventory_item_id, order_date)``.
+        
+        Snapshots are resolved as of each order date from the cached history.
+        Items with no snapshot at all are fetched from Shopify with one batched
+        query and stored, in one insert, as snapshots effective from their
+        earliest order date.
+        """
+        resolved = await cost_resolver.resolve(db, shop.id, lookups)
+        
+        missing: Dict[str, datetime] = {}
+        for (inventory_item_id, order_date), cost in zip(lookups, resolved):
+            if cost is None:
+                missing[inventory_item_id] = min(order_date, missing.get(inventory_item_id, order_date))
+        
+        fetched: Dict[str, Decimal] = {}
+        if missing:
+            costs = await self.shopify_client.get_inventory_item_costs(shop, list(missing))
+            fetched = {
+                inventory_item_id: unit_cost
+                for inventory_item_id, unit_cost in costs.items()
+                if unit_cost is not None
+            }
+        
+        if fetched:
+            # Store snapshots; a concurrent writer may have stored the same ones.
+            # Older orders of these items, costed before a snapshot existed,
+            # are re-costed once the batch commits.
+            result = await db.execute(
+                insert(InventoryItemCostSnapshot)
+                .values([
+                    {
+                        'shop_id': shop.id,
+                        'inventory_item_id': inventory_item_id,
+                        'effective_date': missing[inventory_item_id],
+                        'unit_cost': unit_cost,
+                        'currency': shop.currency,
+                        'source': 'api',
+                    }
+                    for inventory_item_id, unit_cost in fetched.items()
+                ])
+                .on_conflict_do_nothing(constraint="uq_cost_snapshots_item_date")
+                .returning(
+                    InventoryItemCostSnapshot.inventory_item_id,
+                    InventoryItemCostSnapshot.effective_date
                 )
-                db.add(snapshot)
-                await db.commit()
-                
-                return unit_cost, 'api'
-        except Exception:
-            pass
-        
-        return None, 'null'
+            )
+            cost_resolver.mark_changed(db, shop.id)
+            recosting_service.mark_changed(db, shop.id, result.all())
+        
+        unit_costs = []
+        for (inventory_item_id, _), cost in zip(lookups, resolved):
+            if cost is not None:
+                unit_costs.append(cost)
+            elif inventory_item_id in fetched:
+                unit_costs.append((fetched[inventory_item_id], 'api'))
+            else:
+                unit_costs.append((None, 'null'))
+        return unit_costs
     
     async def _recalculate_order_profit(
         self, 
         db: AsyncSession, 
         order: Order
     ) -> None:
-        """Recalculate order profit and update rollups."""
+        """Reload an order's graph, recalculate profit and update rollups."""
         # Get order with all related data
         result = await db.execute(
             select(Order)
@@ -466,62 +816,48 @@ class WebhookProcessor:
                 selectinload(Order.transactions).selectinload(Transaction.fees)
             )
             .where(Order.id == order.id)
+            .execution_options(populate_existing=True)
         )
         order_with_data = result.scalar_one()
         
-        # Calculate profit
-        profit_data = await profit_calculator.calculate_order_profit(
-            db, order_with_data
+        await self._apply_order_profit(db, order_with_data)
+    
+    async def _apply_order_profit(
+        self, 
+        db: AsyncSession, 
+        order: Order
+    ) -> Dict[str, Any]:
+        """Calculate profit for a loaded order graph and store it with its rollup delta.
+        
+        Does not commit; callers own the transaction.
+        """
+        profit_data = await profit_calculator.calculate_loaded_order_profit(db, order)
+        await rollup_service.store_order_profits(
+            db, order.shop_id, [(order.id, order.processed_at, profit_data)]
         )
-        
-        # Update order flags
-        order.flags = profit_data['flags']
-        await db.commit()
-        
-        # Update daily rollup
-        await self._update_daily_rollup(db, order, profit_data)
+        return profit_data
     
-    async def _update_daily_rollup(
+    async def _recalculate_orders_profit(
         self, 
         db: AsyncSession, 
-        order: Order, 
-        profit_data: Dict[str, Any]
+        shop_id: Any, 
+        order_ids: Iterable[Any]
     ) -> None:
-        """Update daily rollup for order's date."""
-        order_date = order.processed_at.date()
+        """Recalculate profit for many orders of one shop in one pass.
         
-        # Get or create daily rollup
-        result = await db.execute(
-            select(DailyRollup).where(
-                DailyRollup.shop_id == order.shop_id,
-                DailyRollup.date == order_date
-            )
-        )
-        rollup = result.scalar_one_or_none()
-        
-        if not rollup:
-            rollup = DailyRollup(
-                shop_id=order.shop_id,
-                date=order_date,
-                net_revenue=Decimal('0'),
-                cogs=Decimal('0'),
-                fees=Decimal('0'),
-                shipping_cost=Decimal('0'),
-                ad_spend={},
-                net_profit=Decimal('0'),
-                margin_pct=Decimal('0')
-            )
-            db.add(rollup)
-        
-        # Recalculate daily totals (this would need to aggregate all orders for the day)
-        # For now, just update this order's contribution
-        rollup.net_revenue += profit_data['net_revenue']
-        rollup.cogs += profit_data['cogs']
-        rollup.fees += profit_data['fees']
-        rollup.shipping_cost += profit_data['shipping_cost']
-        rollup.net_profit += profit_data['net_profit']
-        
-        if rollup.net_revenue > 0:
-            rollup.margin_pct = (rollup.net_profit / rollup.net_revenue) * 100
+        Breakdowns, flags and rollup deltas are written in bulk. Does not commit.
+        """
+        order_ids = list(order_ids)
+        if not order_ids:
+            return
         
-        await db.commit()
+        columns = await profit_calculator.calculate_orders_profit(
+            db, shop_id, order_ids=order_ids
+        )
+        await rollup_service.store_order_profits(
+            db, shop_id,
+            [
+                (order_id, columns.processed_at[index], columns.row(index))
+                for index, order_id in enumerate(columns.order_ids)
+            ]
+        )
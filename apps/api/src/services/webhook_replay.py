@@ -0,0 +1,181 @@
+"""Bulk replay of stored webhook events."""
+
+import argparse
+import asyncio
+import logging
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.database import AsyncSessionLocal, close_db
+from ..db.models import Shop, WebhookEvent
+from ..webhooks.coalescer import get_order_id
+from ..webhooks.handlers import webhook_handler
+from .shop_cache import shop_cache
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PROGRESS_LOG_INTERVAL = 500
+
+
+class WebhookReplayService:
+    """Reprocesses failed (or otherwise selected) webhook events from their stored payloads.
+
+    Events for the same order are replayed sequentially in receive order;
+    different orders are replayed concurrently, up to ``parallelism`` at once,
+    each with its own session.
+    """
+
+    async def select_events(
+        self,
+        db: AsyncSession,
+        shop_id: Optional[UUID] = None,
+        topics: Optional[Sequence[str]] = None,
+        statuses: Sequence[str] = ("failed",),
+        received_from: Optional[datetime] = None,
+        received_to: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> List[List[UUID]]:
+        """Select replayable events, grouped by (shop, order) in receive order."""
+        query = (
+            select(WebhookEvent.id, WebhookEvent.shop_id, WebhookEvent.topic, WebhookEvent.payload)
+            .where(
+                WebhookEvent.payload.is_not(None),
+                WebhookEvent.status.in_(statuses)
+            )
+            .order_by(WebhookEvent.received_at)
+            .execution_options(yield_per=1000)
+        )
+        if shop_id is not None:
+            query = query.where(WebhookEvent.shop_id == shop_id)
+        if topics:
+            query = query.where(WebhookEvent.topic.in_(topics))
+        if received_from is not None:
+            query = query.where(WebhookEvent.received_at >= received_from)
+        if received_to is not None:
+            query = query.where(WebhookEvent.received_at < received_to)
+        if limit is not None:
+            query = query.limit(limit)
+
+        groups: Dict[Any, List[UUID]] = {}
+        result = await db.stream(query)
+        async for event_id, event_shop_id, topic, payload in result:
+            order_id = get_order_id(topic, zlib.decompress(payload))
+            key = (event_shop_id, order_id) if order_id else event_id
+            groups.setdefault(key, []).append(event_id)
+
+        return list(groups.values())
+
+    async def replay(
+        self,
+        shop_id: Optional[UUID] = None,
+        topics: Optional[Sequence[str]] = None,
+        statuses: Sequence[str] = ("failed",),
+        received_from: Optional[datetime] = None,
+        received_to: Optional[datetime] = None,
+        parallelism: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Replay every selected event and return counts."""
+        async with AsyncSessionLocal() as db:
+            groups = await self.select_events(
+                db, shop_id, topics, statuses, received_from, received_to, limit
+            )
+
+        summary = {
+            "selected": sum(len(group) for group in groups),
+            "replayed": 0,
+            "failed": 0,
+        }
+        slots = asyncio.Semaphore(parallelism or settings.webhook_replay_parallelism)
+
+        logger.info("Replaying %d webhook events in %d groups", summary["selected"], len(groups))
+        await asyncio.gather(*(self._replay_group(group, slots, summary) for group in groups))
+        logger.info(
+            "Webhook replay finished: %d replayed, %d failed",
+            summary["replayed"], summary["failed"]
+        )
+
+        return summary
+
+    async def _replay_group(
+        self,
+        event_ids: List[UUID],
+        slots: asyncio.Semaphore,
+        summary: Dict[str, Any]
+    ) -> None:
+        """Replay one order's events in order, recording outcomes in ``summary``."""
+        async with slots:
+            async with AsyncSessionLocal() as db:
+                for event_id in event_ids:
+                    result = await db.execute(
+                        select(WebhookEvent).where(WebhookEvent.id == event_id)
+                    )
+                    webhook_event = result.scalar_one()
+                    try:
+                        shop = await shop_cache.get_by_id(db, webhook_event.shop_id)
+                        await webhook_handler.replay_webhook_event(db, shop, webhook_event)
+                        summary["replayed"] += 1
+                    except Exception as e:
+                        summary["failed"] += 1
+                        logger.warning(
+                            "Replay of webhook event %s (%s) failed: %s",
+                            event_id, webhook_event.topic, e
+                        )
+
+                    done = summary["replayed"] + summary["failed"]
+                    if done % PROGRESS_LOG_INTERVAL == 0:
+                        logger.info("Webhook replay progress: %d/%d", done, summary["selected"])
+
+
+# Global instance
+webhook_replay_service = WebhookReplayService()
+
+
+async def _run_replay(args: argparse.Namespace) -> Dict[str, Any]:
+    """Resolve CLI filters and run the replay."""
+    try:
+        shop_id = None
+        if args.shop:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(Shop.id).where(Shop.shop_domain == args.shop))
+                shop_id = result.scalar_one()
+
+        return await webhook_replay_service.replay(
+            shop_id=shop_id,
+            topics=args.topic,
+            statuses=args.status or ["failed"],
+            received_from=args.since,
+            received_to=args.until,
+            parallelism=args.parallelism,
+            limit=args.limit,
+        )
+    finally:
+        await close_db()
+
+
+def main() -> None:
+    """Replay stored webhook events from the command line."""
+    parser = argparse.ArgumentParser(description="Replay stored webhook events.")
+    parser.add_argument("--shop", help="Shop domain, e.g. example.myshopify.com")
+    parser.add_argument("--topic", action="append", help="Topic to replay (repeatable)")
+    parser.add_argument("--status", action="append", help="Event status to replay (repeatable, default failed)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Received at or after (ISO 8601)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Received before (ISO 8601)")
+    parser.add_argument("--parallelism", type=int, default=None, help="Orders replayed concurrently")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum events to replay")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+    summary = asyncio.run(_run_replay(args))
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
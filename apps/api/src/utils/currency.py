@@ -1,7 +1,7 @@
 """Currency conversion and normalization utilities."""
 
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 import httpx
 
 from ..config.settings import get_settings
@@ -129,29 +129,38 @@ def extract_amount_from_price_set(
     price_set: Dict[str, Any], 
     currency: str
 ) -> Decimal:
-    """Extract amount from Shopify price set for given currency."""
+    """Extract amount from Shopify price set for given currency.
+    
+    Takes the presentment amount when only that side is in ``currency``,
+    else the shop amount (see extract_money_amounts).
+    """
+    shop_amount, presentment_amount = extract_money_amounts(price_set)
     if not price_set:
-        return Decimal('0')
+        return shop_amount
     
-    # Try shop money first
-    if 'shop_money' in price_set:
-        shop_money = price_set['shop_money']
-        if shop_money.get('currency_code') == currency:
-            return Decimal(shop_money.get('amount', '0'))
+    shop_currency = (price_set.get('shop_money') or {}).get('currency_code')
+    presentment_currency = (price_set.get('presentment_money') or {}).get('currency_code')
+    if presentment_currency == currency and shop_currency != currency:
+        return presentment_amount
+    return shop_amount
+
+
+def extract_money_amounts(price_set: Optional[Dict[str, Any]]) -> Tuple[Decimal, Decimal]:
+    """Extract (shop, presentment) amounts from a Shopify money set.
     
-    # Try presentment money
-    if 'presentment_money' in price_set:
-        presentment_money = price_set['presentment_money']
-        if presentment_money.get('currency_code') == currency:
-            return Decimal(presentment_money.get('amount', '0'))
+    A missing side falls back to the other one, and an empty set to zero.
+    """
+    if not price_set:
+        return Decimal('0'), Decimal('0')
     
-    # Fallback to first available amount
-    for money_type in ['shop_money', 'presentment_money']:
-        if money_type in price_set:
-            money = price_set[money_type]
-            return Decimal(money.get('amount', '0'))
+    shop_amount = (price_set.get('shop_money') or {}).get('amount')
+    presentment_amount = (price_set.get('presentment_money') or {}).get('amount')
+    if shop_amount is None:
+        shop_amount = presentment_amount
+    if presentment_amount is None:
+        presentment_amount = shop_amount
     
-    return Decimal('0')
+    return Decimal(str(shop_amount or '0')), Decimal(str(presentment_amount or '0'))
 
 
 # Global converter instance
@@ -1,9 +1,16 @@
 """Deduplication utilities for webhooks and events."""
 
 import hashlib
-from typing import Any, Dict
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional
 from datetime import datetime
 
+from ..config.settings import get_settings
+from ..db.redis import get_redis
+
+settings = get_settings()
+
 
 def generate_dedup_key(
     topic: str, 
@@ -26,6 +33,23 @@ def generate_webhook_dedup_key(
     return generate_dedup_key(topic, shop_domain, resource_id, timestamp)
 
 
+def build_webhook_event_dedup_key(
+    topic: str, 
+    shop_domain: str, 
+    resource_id: str, 
+    timestamp: str, 
+    webhook_id: Optional[str] = None
+) -> str:
+    """Build the WebhookEvent.dedup_key for a delivery.
+    
+    Shopify keeps X-Shopify-Webhook-Id stable across retries of the same
+    delivery, so it is preferred over the payload timestamp when present.
+    """
+    if webhook_id:
+        return f"{topic}:{shop_domain}:{webhook_id}"
+    return f"{topic}:{shop_domain}:{resource_id}:{timestamp}"
+
+
 def generate_bulk_operation_key(
     operation_type: str, 
     shop_id: str, 
@@ -64,3 +88,85 @@ def create_event_fingerprint(event_data: Dict[str, Any]) -> str:
     # Convert to string and hash
     fingerprint_str = str(sorted(fingerprint_data.items()))
     return hashlib.md5(fingerprint_str.encode()).hexdigest()
+
+
+class WebhookDeduplicator:
+    """Drops redelivered webhooks before they reach Postgres.
+    
+    Deliveries are keyed on X-Shopify-Webhook-Id and checked against a bounded
+    in-process LRU first, then an atomic Redis ``SET NX EX``. Anything that gets
+    past both (e.g. Redis unavailable) is caught when the event is recorded,
+    where an advisory lock on the dedup key serializes concurrent copies.
+    """
+    
+    def __init__(
+        self, 
+        max_size: int = settings.webhook_dedup_cache_size, 
+        ttl_seconds: int = settings.webhook_dedup_ttl_seconds
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self.stats = Counter()
+    
+    async def claim(self, webhook_id: str) -> bool:
+        """Mark a delivery as seen; return False if it was already seen."""
+        if self._seen_locally(webhook_id):
+            self.stats['local_hits'] += 1
+            return False
+        
+        try:
+            is_new = await get_redis().set(
+                self._redis_key(webhook_id), 1, nx=True, ex=self.ttl_seconds
+            )
+        except Exception:
+            # Fall through to the advisory-locked dedup check in the handler
+            self.stats['redis_errors'] += 1
+            is_new = True
+        
+        self._remember(webhook_id)
+        
+        if not is_new:
+            self.stats['redis_hits'] += 1
+            return False
+        
+        self.stats['misses'] += 1
+        return True
+    
+    async def release(self, webhook_id: str) -> None:
+        """Forget a delivery so Shopify's retry is processed (e.g. after a failure)."""
+        self._seen.pop(webhook_id, None)
+        
+        try:
+            await get_redis().delete(self._redis_key(webhook_id))
+        except Exception:
+            self.stats['redis_errors'] += 1
+    
+    def _seen_locally(self, webhook_id: str) -> bool:
+        """Check the in-process LRU, dropping the entry if it expired."""
+        seen_at = self._seen.get(webhook_id)
+        if seen_at is None:
+            return False
+        
+        if time.monotonic() - seen_at > self.ttl_seconds:
+            del self._seen[webhook_id]
+            return False
+        
+        self._seen.move_to_end(webhook_id)
+        return True
+    
+    def _remember(self, webhook_id: str) -> None:
+        """Add to the LRU, evicting the oldest entry when full."""
+        self._seen[webhook_id] = time.monotonic()
+        self._seen.move_to_end(webhook_id)
+        
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+    
+    def _redis_key(self, webhook_id: str) -> str:
+        """Get the Redis key for a delivery."""
+        return f"webhook:seen:{webhook_id}"
+
+
+# Global instance
+webhook_deduplicator = WebhookDeduplicator()
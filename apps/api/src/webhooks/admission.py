@@ -0,0 +1,69 @@
+"""Admission control for webhook routes.
+
+Each admitted webhook request holds one pooled DB connection until it is done,
+so the number in flight is capped below the pool's capacity, leaving
+``database_dashboard_reserved_connections`` for dashboard reads. When the cap
+is reached, deliveries are either spilled to the ingest queue (a single short
+insert, using a small slice kept back for it) or rejected with 503 and
+``Retry-After`` so Shopify redelivers later.
+"""
+
+from typing import Any, Dict, Optional
+
+from ..config.settings import get_settings
+from .telemetry import webhook_telemetry
+
+settings = get_settings()
+
+PROCESS = "process"
+SPILL = "spill"
+
+
+class WebhookAdmission:
+    """Non-blocking in-flight limiter for webhook requests."""
+
+    def __init__(self, limit: Optional[int] = None):
+        pool_capacity = settings.database_pool_size + settings.database_max_overflow
+        self.limit = limit or settings.webhook_max_inflight or max(
+            1, pool_capacity - settings.database_dashboard_reserved_connections
+        )
+        # Keep part of the webhook slice for cheap spills so a flood of slow
+        # inline processing cannot block queueing too
+        self.spill_reserve = (
+            max(1, self.limit // 4)
+            if settings.webhook_overload_action == "queue" and self.limit > 1
+            else 0
+        )
+        self.inflight = 0
+
+    def admit(self) -> Optional[str]:
+        """Admit a request for processing or spilling, or return None when saturated."""
+        if self.inflight < self.limit - self.spill_reserve:
+            mode = PROCESS
+        elif settings.webhook_overload_action == "queue" and self.inflight < self.limit:
+            mode = SPILL
+        else:
+            webhook_telemetry.admission.labels(outcome="rejected").inc()
+            return None
+
+        self.inflight += 1
+        webhook_telemetry.admission.labels(outcome=mode).inc()
+        webhook_telemetry.inflight.set(self.inflight)
+        return mode
+
+    def release(self) -> None:
+        """Release an admitted request's slot."""
+        self.inflight -= 1
+        webhook_telemetry.inflight.set(self.inflight)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get current limit and usage."""
+        return {
+            "limit": self.limit,
+            "spill_reserve": self.spill_reserve,
+            "inflight": self.inflight,
+        }
+
+
+# Global instance
+webhook_admission = WebhookAdmission()
@@ -0,0 +1,104 @@
+"""Coalescing of bursts of order snapshot webhooks.
+
+Every orders/* topic carries the full order, so when several deliveries for
+the same (shop, order) are waiting in the queue only the newest one (by the
+payload's ``updated_at``) needs to be processed.
+"""
+
+import json
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..db.models import WebhookQueueItem
+
+ORDER_SNAPSHOT_TOPICS = frozenset({
+    "orders/create",
+    "orders/updated",
+    "orders/paid",
+    "orders/cancelled",
+    "orders/fulfilled",
+    "orders/partially_fulfilled",
+})
+
+
+ORDER_CHILD_TOPICS = frozenset({
+    "refunds/create",
+    "transactions/create",
+})
+
+
+def get_order_id(topic: str, body: bytes) -> Optional[str]:
+    """Get the Shopify order id a delivery belongs to, if any."""
+    if topic in ORDER_SNAPSHOT_TOPICS:
+        field = 'id'
+    elif topic in ORDER_CHILD_TOPICS:
+        field = 'order_id'
+    else:
+        return None
+
+    try:
+        return str(json.loads(body)[field])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def get_coalesce_key(topic: str, order_id: Optional[str]) -> Optional[str]:
+    """Get the key deliveries of this topic can be merged on."""
+    if topic not in ORDER_SNAPSHOT_TOPICS:
+        return None
+    return order_id
+
+
+def group_coalesced(items: List[WebhookQueueItem]) -> List[List[WebhookQueueItem]]:
+    """Group claimed items so deliveries for the same order are processed together."""
+    groups: Dict[Any, List[WebhookQueueItem]] = {}
+    for item in items:
+        key = (item.shop_domain, item.coalesce_key) if item.coalesce_key else item.id
+        groups.setdefault(key, []).append(item)
+    return list(groups.values())
+
+
+def _payload_version(payload: Dict[str, Any]) -> datetime:
+    """Get the payload's updated_at as a comparable timestamp."""
+    value = payload.get('updated_at')
+    if not value:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def select_newest(
+    parsed: List[Tuple[WebhookQueueItem, Dict[str, Any]]]
+) -> Tuple[WebhookQueueItem, Dict[str, Any]]:
+    """Pick the newest payload by updated_at, breaking ties by receive time."""
+    return max(parsed, key=lambda pair: (_payload_version(pair[1]), pair[0].received_at))
+
+
+class CoalesceStats:
+    """Counters for coalesced deliveries, per topic."""
+
+    def __init__(self):
+        self.received = Counter()
+        self.merged = Counter()
+        self.processed = Counter()
+
+    def record(self, topics: List[str], processed_topic: str) -> None:
+        """Record a processed group of deliveries."""
+        self.received.update(topics)
+        self.processed[processed_topic] += 1
+        merged_topics = list(topics)
+        merged_topics.remove(processed_topic)
+        self.merged.update(merged_topics)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get counters as a plain dict."""
+        return {
+            "received": sum(self.received.values()),
+            "merged": sum(self.merged.values()),
+            "processed": sum(self.processed.values()),
+            "merged_by_topic": dict(self.merged),
+        }
+
+
+# Global instance
+coalesce_stats = CoalesceStats()
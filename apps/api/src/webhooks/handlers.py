@@ -3,19 +3,27 @@
 import json
 import hashlib
 import hmac
-from typing import Dict, Any
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
 from fastapi import HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
 
 from ..config.settings import get_settings
-from ..db.models import Shop, WebhookEvent
-from ..db.database import get_db
+from ..db.models import Shop, WebhookEvent, WebhookQueueItem
+from ..db.database import AsyncSessionLocal
 from ..services.webhook_processor import WebhookProcessor
 from ..services.profit_calculator import ProfitCalculator
+from ..services.shop_cache import shop_cache
+from ..utils.dedup import build_webhook_event_dedup_key, webhook_deduplicator
+from .admission import SPILL, webhook_admission
+from .coalescer import coalesce_stats, group_coalesced, select_newest
+from .queue import enqueue_webhook
+from .telemetry import webhook_telemetry
 
 settings = get_settings()
 
@@ -40,10 +48,13 @@ class WebhookHandler:
     async def handle_webhook(
         self,
         request: Request,
-        topic: str,
-        db: AsyncSession
+        topic: str
     ) -> Dict[str, Any]:
-        """Handle incoming webhook."""
+        """Handle incoming webhook.
+        
+        Verification and dedup need no database; a pooled session is only
+        taken once the request is admitted (see ``admission.py``).
+        """
         # Get raw body
         body = await request.body()
         
@@ -57,76 +68,405 @@ class WebhookHandler:
         if not shop_domain:
             raise HTTPException(status_code=400, detail="Missing shop domain")
         
-        # Get shop from database
-        result = await db.execute(
-            select(Shop).where(Shop.shop_domain == shop_domain)
-        )
-        shop = result.scalar_one_or_none()
+        # Drop redeliveries before they reach Postgres
+        webhook_id = request.headers.get("X-Shopify-Webhook-Id")
+        if webhook_id and not await webhook_deduplicator.claim(webhook_id):
+            return {"status": "duplicate"}
         
-        if not shop:
-            raise HTTPException(status_code=404, detail="Shop not found")
+        try:
+            return await self._admit_webhook(request, topic, shop_domain, body, webhook_id)
+        except Exception:
+            # Let Shopify's retry of this delivery through
+            if webhook_id:
+                await webhook_deduplicator.release(webhook_id)
+            raise
+    
+    async def _admit_webhook(
+        self,
+        request: Request,
+        topic: str,
+        shop_domain: str,
+        body: bytes,
+        webhook_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """Process, spill or reject a delivery depending on in-flight load."""
+        mode = webhook_admission.admit()
+        if mode is None:
+            raise HTTPException(
+                status_code=503,
+                detail="Webhook processing is saturated",
+                headers={"Retry-After": str(settings.webhook_retry_after_seconds)}
+            )
         
-        # Parse payload
         try:
-            payload = json.loads(body.decode('utf-8'))
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=400, detail="Invalid JSON payload")
+            async with AsyncSessionLocal() as db:
+                if mode == SPILL:
+                    item = await enqueue_webhook(db, topic, shop_domain, request.headers, body)
+                    return {"status": "queued", "queue_id": str(item.id)}
+                return await self._ingest_webhook(
+                    request, topic, shop_domain, body, webhook_id, db
+                )
+        finally:
+            webhook_admission.release()
+    
+    async def _ingest_webhook(
+        self,
+        request: Request,
+        topic: str,
+        shop_domain: str,
+        body: bytes,
+        webhook_id: Optional[str],
+        db: AsyncSession
+    ) -> Dict[str, Any]:
+        """Queue or process a verified, non-duplicate delivery."""
+        # In queue mode, persist the raw delivery and acknowledge immediately;
+        # the worker pool does the rest outside Shopify's 5s timeout.
+        if settings.webhook_ingest_mode == "queue":
+            item = await enqueue_webhook(db, topic, shop_domain, request.headers, body)
+            return {"status": "queued", "queue_id": str(item.id)}
+        
+        shop = await self._get_shop(db, shop_domain)
+        payload = self._parse_payload(body)
         
         # Create webhook event record
-        webhook_event = await self._create_webhook_event(
-            db, shop, topic, payload
+        webhook_event, created = await self._create_webhook_event(
+            db, shop, topic, payload, body, webhook_id=webhook_id
         )
         
+        if webhook_id and not created and webhook_event.status in ("processing", "completed"):
+            return {"status": "duplicate", "webhook_id": str(webhook_event.id)}
+        
         # Process webhook based on topic
+        received_at = webhook_event.received_at
         try:
             await self._process_webhook_by_topic(db, shop, topic, payload)
-            webhook_event.status = "completed"
-            webhook_event.processed_at = datetime.utcnow()
         except Exception as e:
+            # Discard the failed work (the event row is already committed),
+            # then record the failure in a clean transaction
+            await db.rollback()
             webhook_event.status = "failed"
             webhook_event.error = str(e)
-            raise HTTPException(status_code=500, detail=f"Webhook processing failed: {str(e)}")
-        finally:
             await db.commit()
+            webhook_telemetry.observe(topic, shop_domain, received_at, "failed")
+            raise HTTPException(status_code=500, detail=f"Webhook processing failed: {str(e)}")
+        
+        webhook_event.status = "completed"
+        webhook_event.processed_at = datetime.utcnow()
+        await db.commit()
+        webhook_telemetry.observe(topic, shop_domain, received_at, "completed")
         
         return {"status": "success", "webhook_id": str(webhook_event.id)}
     
+    async def process_queued_webhooks(
+        self,
+        db: AsyncSession,
+        items: List[WebhookQueueItem]
+    ) -> Optional[WebhookEvent]:
+        """Process a group of deliveries accepted in queue ingest mode.
+        
+        Items in a group are coalesced deliveries for the same order; only the
+        newest payload is processed and the rest are recorded as merged. Moves
+        the WebhookEvents through processing -> completed/failed. Errors are
+        re-raised so the worker can decide whether to retry. Returns None when
+        every item was a duplicate of an already completed delivery.
+        """
+        shop = await self._get_shop(db, items[0].shop_domain)
+        
+        parsed = []
+        webhook_events = []
+        event_ids = set()
+        for item in items:
+            payload = self._parse_payload(item.body)
+            webhook_id = item.headers.get("x-shopify-webhook-id")
+            event, created = await self._create_webhook_event(
+                db, shop, item.topic, payload, item.body,
+                webhook_id=webhook_id, received_at=item.received_at
+            )
+            # Already handled by an earlier copy of this delivery, or another
+            # copy in this group claimed the same event
+            if webhook_id and not created and event.status == "completed":
+                continue
+            if event.id in event_ids:
+                continue
+            event_ids.add(event.id)
+            parsed.append((item, payload))
+            webhook_events.append(event)
+        
+        if not parsed:
+            return None
+        
+        newest_item, newest_payload = select_newest(parsed)
+        webhook_event = webhook_events[parsed.index((newest_item, newest_payload))]
+        
+        for event in webhook_events:
+            event.status = "processing"
+            event.error = None
+        await db.commit()
+        
+        try:
+            await self._process_webhook_by_topic(db, shop, newest_item.topic, newest_payload)
+        except Exception as e:
+            await db.rollback()
+            for event in webhook_events:
+                event.status = "failed"
+                event.error = str(e)
+            await db.commit()
+            for item, _ in parsed:
+                webhook_telemetry.observe(item.topic, item.shop_domain, item.received_at, "failed")
+            raise
+        
+        processed_at = datetime.utcnow()
+        for event in webhook_events:
+            event.status = "completed"
+            event.processed_at = processed_at
+        await db.commit()
+        
+        coalesce_stats.record([item.topic for item, _ in parsed], newest_item.topic)
+        for item, _ in parsed:
+            webhook_telemetry.observe(item.topic, item.shop_domain, item.received_at)
+        
+        return webhook_event
+    
+    async def process_queued_batch(
+        self,
+        db: AsyncSession,
+        items: List[WebhookQueueItem]
+    ) -> int:
+        """Process a micro-batch of queued deliveries in one transaction.
+        
+        Items are grouped by shop; each coalesced group contributes its newest
+        payload and the processor applies all of a shop's changes with bulk
+        upserts. WebhookEvents are created and completed in the same
+        transaction, so a failure leaves nothing behind and the caller can fall
+        back to per-group processing. Returns the number of payloads applied.
+        """
+        items_by_shop: Dict[str, List[WebhookQueueItem]] = {}
+        for item in items:
+            items_by_shop.setdefault(item.shop_domain, []).append(item)
+        
+        processed_groups = []
+        processed_items = []
+        event_ids = []
+        for shop_domain, shop_items in items_by_shop.items():
+            shop = await self._get_shop(db, shop_domain)
+            
+            parsed = [(item, self._parse_payload(item.body)) for item in shop_items]
+            events = await self._create_webhook_events(db, shop, parsed)
+            
+            entries = []
+            for group in group_coalesced(shop_items):
+                group_ids = {item.id for item in group}
+                # Copies of a delivery share an event; keep one item per event
+                pending = []
+                group_event_ids = set()
+                for item, payload in parsed:
+                    event_id = events[item.id]
+                    if item.id not in group_ids or event_id is None or event_id in group_event_ids:
+                        continue
+                    group_event_ids.add(event_id)
+                    pending.append((item, payload))
+                if not pending:
+                    continue
+                newest_item, newest_payload = select_newest(pending)
+                entries.append((newest_item.topic, newest_payload))
+                processed_groups.append(
+                    ([item.topic for item, _ in pending], newest_item.topic)
+                )
+                processed_items.extend(item for item, _ in pending)
+                event_ids.extend(events[item.id] for item, _ in pending)
+            
+            if entries:
+                await self.processor.process_batch(db, shop, entries)
+        
+        if event_ids:
+            await db.execute(
+                update(WebhookEvent)
+                .where(WebhookEvent.id.in_(event_ids))
+                .values(status="completed", error=None, processed_at=datetime.utcnow())
+            )
+        await db.commit()
+        
+        for topics, processed_topic in processed_groups:
+            coalesce_stats.record(topics, processed_topic)
+        for item in processed_items:
+            webhook_telemetry.observe(item.topic, item.shop_domain, item.received_at)
+        
+        return len(processed_groups)
+    
+    async def replay_webhook_event(
+        self,
+        db: AsyncSession,
+        shop: Shop,
+        webhook_event: WebhookEvent
+    ) -> None:
+        """Reprocess a stored event from its saved payload.
+        
+        Processing goes through the same idempotent, versioned upserts as live
+        deliveries, so replaying an event that already applied (or was
+        superseded by a newer order snapshot) is harmless. Errors are recorded
+        on the event and re-raised.
+        """
+        payload = self._parse_payload(zlib.decompress(webhook_event.payload))
+        
+        webhook_event.status = "processing"
+        webhook_event.error = None
+        await db.commit()
+        
+        try:
+            await self._process_webhook_by_topic(db, shop, webhook_event.topic, payload)
+        except Exception as e:
+            await db.rollback()
+            webhook_event.status = "failed"
+            webhook_event.error = str(e)
+            await db.commit()
+            webhook_telemetry.observe(webhook_event.topic, shop.shop_domain, None, "failed")
+            raise
+        
+        webhook_event.status = "completed"
+        webhook_event.processed_at = datetime.utcnow()
+        await db.commit()
+        
+        # Replays are counted but kept out of the live lag histograms
+        webhook_telemetry.observe(webhook_event.topic, shop.shop_domain, None)
+    
+    async def _get_shop(self, db: AsyncSession, shop_domain: str) -> Shop:
+        """Get shop by domain or raise 404."""
+        shop = await shop_cache.get_by_domain(db, shop_domain)
+        
+        if not shop:
+            raise HTTPException(status_code=404, detail="Shop not found")
+        
+        return shop
+    
+    def _parse_payload(self, body: bytes) -> Dict[str, Any]:
+        """Parse webhook JSON body."""
+        try:
+            return json.loads(body.decode('utf-8'))
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    
     async def _create_webhook_event(
         self,
         db: AsyncSession,
         shop: Shop,
         topic: str,
-        payload: Dict[str, Any]
-    ) -> WebhookEvent:
-        """Create webhook event record."""
-        # Generate dedup key
+        payload: Dict[str, Any],
+        body: bytes,
+        webhook_id: Optional[str] = None,
+        received_at: Optional[datetime] = None
+    ) -> Tuple[WebhookEvent, bool]:
+        """Create webhook event record, returning (event, created).
+        
+        webhook_events is partitioned by received_at, so dedup_key has no
+        unique index; an advisory lock on the key serializes concurrent copies
+        of a delivery between the lookup and the insert.
+        """
         resource_id = str(payload.get('id', ''))
         timestamp = payload.get('created_at', datetime.utcnow().isoformat())
-        dedup_key = f"{topic}:{shop.shop_domain}:{resource_id}:{timestamp}"
+        dedup_key = build_webhook_event_dedup_key(
+            topic, shop.shop_domain, resource_id, timestamp, webhook_id
+        )
+        
+        values = {
+            'shop_id': shop.id,
+            'topic': topic,
+            'shop_resource_id': resource_id,
+            'dedup_key': dedup_key,
+            'status': "pending",
+            'payload': zlib.compress(body),
+        }
+        if received_at is not None:
+            values['received_at'] = received_at
         
-        # Check for duplicate
+        await self._lock_dedup_keys(db, [dedup_key])
         result = await db.execute(
-            select(WebhookEvent).where(WebhookEvent.dedup_key == dedup_key)
+            select(WebhookEvent).where(WebhookEvent.dedup_key == dedup_key).limit(1)
         )
-        existing_event = result.scalar_one_or_none()
-        
-        if existing_event:
-            return existing_event
-        
-        # Create new event
-        webhook_event = WebhookEvent(
-            shop_id=shop.id,
-            topic=topic,
-            shop_resource_id=resource_id,
-            dedup_key=dedup_key,
-            status="pending"
+        existing = result.scalar_one_or_none()
+        if existing is not None:
+            return existing, False
+        
+        result = await db.execute(
+            insert(WebhookEvent).values(**values).returning(WebhookEvent)
         )
+        webhook_event = result.scalar_one()
         
-        db.add(webhook_event)
         await db.commit()
-        await db.refresh(webhook_event)
         
-        return webhook_event
+        return webhook_event, True
+    
+    async def _create_webhook_events(
+        self,
+        db: AsyncSession,
+        shop: Shop,
+        parsed: List[Tuple[WebhookQueueItem, Dict[str, Any]]]
+    ) -> Dict[Any, Optional[Any]]:
+        """Bulk create webhook event records for queued deliveries.
+        
+        Returns ``{queue_item_id: event_id}``; the event id is None for a
+        redelivery whose earlier copy already completed. Does not commit.
+        """
+        rows = {}
+        for item, payload in parsed:
+            webhook_id = item.headers.get("x-shopify-webhook-id")
+            resource_id = str(payload.get('id', ''))
+            timestamp = payload.get('created_at', datetime.utcnow().isoformat())
+            rows[item.id] = {
+                'shop_id': shop.id,
+                'topic': item.topic,
+                'shop_resource_id': resource_id,
+                'dedup_key': build_webhook_event_dedup_key(
+                    item.topic, shop.shop_domain, resource_id, timestamp, webhook_id
+                ),
+                'status': "processing",
+                'received_at': item.received_at,
+                'payload': zlib.compress(item.body),
+            }
+        
+        dedup_keys = {row['dedup_key'] for row in rows.values()}
+        await self._lock_dedup_keys(db, dedup_keys)
+        result = await db.execute(
+            select(WebhookEvent.id, WebhookEvent.dedup_key, WebhookEvent.status)
+            .where(WebhookEvent.dedup_key.in_(dedup_keys))
+        )
+        existing = {row.dedup_key: row for row in result}
+        
+        # One new event per key, even if the batch holds several copies
+        new_rows = {
+            row['dedup_key']: row for row in rows.values()
+            if row['dedup_key'] not in existing
+        }
+        created = {}
+        if new_rows:
+            result = await db.execute(
+                insert(WebhookEvent)
+                .values(list(new_rows.values()))
+                .returning(WebhookEvent.id, WebhookEvent.dedup_key)
+            )
+            created = {row.dedup_key: row.id for row in result}
+        
+        events = {}
+        for item, _ in parsed:
+            dedup_key = rows[item.id]['dedup_key']
+            if dedup_key in created:
+                events[item.id] = created[dedup_key]
+            elif item.headers.get("x-shopify-webhook-id") and existing[dedup_key].status == "completed":
+                # Already handled by an earlier copy of this delivery
+                events[item.id] = None
+            else:
+                events[item.id] = existing[dedup_key].id
+        
+        return events
+    
+    async def _lock_dedup_keys(self, db: AsyncSession, dedup_keys) -> None:
+        """Take transaction-scoped advisory locks on dedup keys, in a stable order."""
+        await db.execute(
+            text(
+                "SELECT pg_advisory_xact_lock(hashtext(dedup_key)) "
+                "FROM unnest(CAST(:dedup_keys AS text[])) AS dedup_key"
+            ),
+            {"dedup_keys": sorted(dedup_keys)}
+        )
     
     async def _process_webhook_by_topic(
         self,
@@ -0,0 +1,182 @@
+"""Durable Postgres-backed queue for incoming webhooks."""
+
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Mapping, Optional
+
+from sqlalchemy import delete, func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.models import WebhookQueueItem
+from .coalescer import get_coalesce_key, get_order_id
+
+settings = get_settings()
+
+
+def extract_shopify_headers(headers: Mapping[str, str]) -> dict:
+    """Keep only the X-Shopify-* headers needed to process a delivery later."""
+    return {
+        key.lower(): value
+        for key, value in headers.items()
+        if key.lower().startswith("x-shopify-")
+    }
+
+
+def get_partition(shop_domain: str, order_id: Optional[str] = None) -> int:
+    """Map a delivery to a worker partition.
+    
+    All deliveries for a shop (or, with ``webhook_partition_key=order``, for an
+    order) land in the same partition and are processed sequentially. Uses a
+    stable hash so every process agrees on the mapping.
+    """
+    key = shop_domain
+    if settings.webhook_partition_key == "order" and order_id:
+        key = f"{shop_domain}:{order_id}"
+    return zlib.crc32(key.encode('utf-8')) % settings.webhook_partitions
+
+
+async def enqueue_webhook(
+    db: AsyncSession,
+    topic: str,
+    shop_domain: str,
+    headers: Mapping[str, str],
+    body: bytes
+) -> WebhookQueueItem:
+    """Persist a verified webhook delivery for asynchronous processing."""
+    order_id = get_order_id(topic, body)
+    item = WebhookQueueItem(
+        topic=topic,
+        shop_domain=shop_domain,
+        coalesce_key=get_coalesce_key(topic, order_id),
+        partition=get_partition(shop_domain, order_id),
+        headers=extract_shopify_headers(headers),
+        body=body,
+    )
+
+    db.add(item)
+    await db.commit()
+
+    return item
+
+
+def _claimable(now: datetime):
+    """Condition for items that are not leased by a live worker."""
+    lease_expired_before = now - timedelta(seconds=settings.webhook_queue_lease_seconds)
+    return or_(
+        WebhookQueueItem.locked_at.is_(None),
+        WebhookQueueItem.locked_at < lease_expired_before
+    )
+
+
+async def claim_webhooks(
+    db: AsyncSession,
+    limit: int = 1,
+    partition: Optional[int] = None
+) -> List[WebhookQueueItem]:
+    """Claim up to ``limit`` available queue items for this worker.
+
+    Rows are locked with ``FOR UPDATE SKIP LOCKED`` so concurrent workers never
+    claim the same delivery. A claim is a lease: items whose lease expired
+    (e.g. a worker crashed mid-processing) become claimable again.
+
+    Deliveries are debounced by ``webhook_coalesce_window_ms`` (all topics, so
+    receive order is kept within a partition) and order snapshots are claimed
+    together with every other queued snapshot for the same order, so the
+    caller can process the group once.
+    """
+    now = datetime.now(timezone.utc)
+    debounce_before = now - timedelta(milliseconds=settings.webhook_coalesce_window_ms)
+
+    query = (
+        select(WebhookQueueItem)
+        .where(
+            WebhookQueueItem.available_at <= now,
+            _claimable(now),
+            WebhookQueueItem.received_at <= debounce_before
+        )
+        .order_by(WebhookQueueItem.received_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if partition is not None:
+        query = query.where(WebhookQueueItem.partition == partition)
+
+    result = await db.execute(query)
+    items = list(result.scalars().all())
+
+    coalesce_keys = {
+        (item.shop_domain, item.coalesce_key) for item in items if item.coalesce_key
+    }
+    if coalesce_keys:
+        siblings = await db.execute(
+            select(WebhookQueueItem)
+            .where(
+                tuple_(WebhookQueueItem.shop_domain, WebhookQueueItem.coalesce_key).in_(coalesce_keys),
+                WebhookQueueItem.id.not_in([item.id for item in items]),
+                _claimable(now)
+            )
+            .with_for_update(skip_locked=True)
+        )
+        items.extend(siblings.scalars().all())
+
+    for item in items:
+        item.locked_at = now
+        item.attempts += 1
+
+    await db.commit()
+
+    return items
+
+
+async def complete_webhooks(db: AsyncSession, items: List[WebhookQueueItem]) -> None:
+    """Remove processed (or permanently failed) items from the queue."""
+    await db.execute(
+        delete(WebhookQueueItem).where(WebhookQueueItem.id.in_([item.id for item in items]))
+    )
+    await db.commit()
+
+
+async def retry_webhooks(
+    db: AsyncSession,
+    items: List[WebhookQueueItem],
+    error: str
+) -> None:
+    """Release items back to the queue after a failed attempt."""
+    await db.execute(
+        update(WebhookQueueItem)
+        .where(WebhookQueueItem.id.in_([item.id for item in items]))
+        .values(
+            locked_at=None,
+            last_error=error,
+            available_at=datetime.now(timezone.utc) + timedelta(seconds=settings.worker_retry_delay),
+        )
+    )
+    await db.commit()
+
+
+async def get_queue_depth(db: AsyncSession) -> int:
+    """Get number of deliveries waiting in the queue."""
+    result = await db.execute(select(func.count(WebhookQueueItem.id)))
+    return result.scalar() or 0
+
+
+async def get_partition_stats(db: AsyncSession) -> Dict[int, Dict[str, Any]]:
+    """Get queue depth and lag (age of the oldest waiting delivery) per partition."""
+    result = await db.execute(
+        select(
+            WebhookQueueItem.partition,
+            func.count(WebhookQueueItem.id),
+            func.min(WebhookQueueItem.received_at)
+        )
+        .group_by(WebhookQueueItem.partition)
+    )
+
+    now = datetime.now(timezone.utc)
+    return {
+        partition: {
+            "depth": depth,
+            "lag_ms": int((now - oldest).total_seconds() * 1000) if oldest else 0,
+        }
+        for partition, depth, oldest in result.all()
+    }
@@ -0,0 +1,156 @@
+"""Webhook processing lag and throughput telemetry.
+
+Receive-to-complete latency is recorded in Prometheus histograms per topic and
+shop, alongside outcome counters and queue depth. Each process (API or worker)
+keeps its own registry; workers expose theirs with ``--metrics-port``.
+
+The per-shop status used by ``/dashboard/health`` is computed from
+``webhook_events`` and ``webhook_queue`` instead, so it reflects every process.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config.settings import get_settings
+from ..db.models import Shop, WebhookEvent, WebhookQueueItem
+from .queue import get_partition_stats
+
+settings = get_settings()
+
+# Seconds; spans inline processing up to well past the critical lag threshold
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STATUS_WINDOW_MINUTES = 60
+
+
+def classify_lag(lag_ms: Optional[int]) -> str:
+    """Map a lag to ok/warning/critical using the configured thresholds."""
+    if lag_ms is None or lag_ms < settings.webhook_lag_warning_ms:
+        return "ok"
+    if lag_ms < settings.webhook_lag_critical_ms:
+        return "warning"
+    return "critical"
+
+
+class WebhookTelemetry:
+    """Prometheus metrics for the webhook path."""
+
+    def __init__(self):
+        self.lag = Histogram(
+            "profitpeek_webhook_lag_seconds",
+            "Time from webhook receipt to processing completion",
+            ["topic", "shop"],
+            buckets=LAG_BUCKETS,
+        )
+        self.events = Counter(
+            "profitpeek_webhook_events",
+            "Processed webhook deliveries by outcome",
+            ["topic", "shop", "status"],
+        )
+        self.queue_depth = Gauge(
+            "profitpeek_webhook_queue_depth",
+            "Deliveries waiting in the webhook queue",
+            ["partition"],
+        )
+        self.queue_lag = Gauge(
+            "profitpeek_webhook_queue_lag_seconds",
+            "Age of the oldest delivery waiting in the webhook queue",
+            ["partition"],
+        )
+        self.admission = Counter(
+            "profitpeek_webhook_admission",
+            "Webhook requests by admission outcome (process, spill, rejected)",
+            ["outcome"],
+        )
+        self.inflight = Gauge(
+            "profitpeek_webhook_inflight",
+            "Webhook requests currently holding a DB connection",
+        )
+
+    def observe(
+        self,
+        topic: str,
+        shop_domain: str,
+        received_at: Optional[datetime],
+        status: str = "completed"
+    ) -> None:
+        """Record one delivery's outcome and receive-to-complete latency."""
+        self.events.labels(topic=topic, shop=shop_domain, status=status).inc()
+        if received_at is None or status != "completed":
+            return
+        if received_at.tzinfo is None:
+            received_at = received_at.replace(tzinfo=timezone.utc)
+        lag = (datetime.now(timezone.utc) - received_at).total_seconds()
+        self.lag.labels(topic=topic, shop=shop_domain).observe(max(lag, 0))
+
+    async def refresh_queue_metrics(self, db: AsyncSession) -> Dict[int, Dict[str, Any]]:
+        """Update the queue depth/lag gauges from the queue table."""
+        partition_stats = await get_partition_stats(db)
+        for partition in range(settings.webhook_partitions):
+            stats = partition_stats.get(partition, {"depth": 0, "lag_ms": 0})
+            self.queue_depth.labels(partition=str(partition)).set(stats["depth"])
+            self.queue_lag.labels(partition=str(partition)).set(stats["lag_ms"] / 1000)
+        return partition_stats
+
+
+async def get_shop_webhook_status(db: AsyncSession, shop: Shop) -> Dict[str, Any]:
+    """Get a shop's recent webhook lag, failure rate and queue backlog.
+
+    Lag is the worse of the p95 receive-to-complete time over the last hour
+    and the age of the shop's oldest queued delivery, so a stalled queue shows
+    up before anything completes.
+    """
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(minutes=STATUS_WINDOW_MINUTES)
+    lag_seconds = func.extract('epoch', WebhookEvent.processed_at - WebhookEvent.received_at)
+
+    result = await db.execute(
+        select(
+            func.count(WebhookEvent.id),
+            func.count(WebhookEvent.id).filter(WebhookEvent.status == "failed"),
+            func.percentile_cont(0.5).within_group(lag_seconds).filter(
+                WebhookEvent.status == "completed"
+            ),
+            func.percentile_cont(0.95).within_group(lag_seconds).filter(
+                WebhookEvent.status == "completed"
+            ),
+        )
+        .where(
+            WebhookEvent.shop_id == shop.id,
+            WebhookEvent.received_at >= since
+        )
+    )
+    total, failed, p50, p95 = result.one()
+
+    result = await db.execute(
+        select(func.count(WebhookQueueItem.id), func.min(WebhookQueueItem.received_at))
+        .where(WebhookQueueItem.shop_domain == shop.shop_domain)
+    )
+    queue_depth, oldest_queued = result.one()
+
+    p50_ms = int(p50 * 1000) if p50 is not None else None
+    p95_ms = int(p95 * 1000) if p95 is not None else None
+    queue_lag_ms = int((now - oldest_queued).total_seconds() * 1000) if oldest_queued else 0
+    lag_ms = max(p95_ms or 0, queue_lag_ms)
+
+    return {
+        "status": classify_lag(lag_ms),
+        "lag_ms": lag_ms,
+        "lag_p50_ms": p50_ms,
+        "lag_p95_ms": p95_ms,
+        "queue_depth": queue_depth,
+        "queue_lag_ms": queue_lag_ms,
+        "events_last_hour": total,
+        "failed_last_hour": failed,
+        "failure_rate": round(failed / total, 4) if total else 0.0,
+        "warning_ms": settings.webhook_lag_warning_ms,
+        "critical_ms": settings.webhook_lag_critical_ms,
+    }
+
+
+# Global instance
+webhook_telemetry = WebhookTelemetry()
@@ -0,0 +1,282 @@
+"""Partitioned async worker pool that drains the webhook ingest queue.
+
+Deliveries are hashed into ``webhook_partitions`` partitions by shop (or shop
+and order). Each partition is drained sequentially by one asyncio task, so
+events for the same shop/order are applied in receive order, while partitions
+run concurrently. Partitions can be spread across several processes.
+
+Each partition claims up to ``webhook_batch_size`` deliveries, waiting at most
+``webhook_batch_flush_ms`` to fill a batch, and applies them in a single
+transaction with bulk upserts. If a batch fails it is retried group by group
+so one bad delivery cannot hold back the rest.
+
+Run with ``python -m src.webhooks.worker [--processes N] [--metrics-port PORT]``
+alongside the API when ``WEBHOOK_INGEST_MODE=queue``.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from prometheus_client import start_http_server
+
+from ..config.settings import get_settings
+from ..db.database import AsyncSessionLocal, close_db
+from ..db.partitions import maintain_webhook_event_partitions
+from ..db.models import WebhookQueueItem
+from .handlers import webhook_handler
+from .coalescer import group_coalesced
+from .queue import claim_webhooks, complete_webhooks, retry_webhooks
+from .telemetry import webhook_telemetry
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+STATS_LOG_INTERVAL_SECONDS = 60
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = 3600
+
+
+class WebhookWorkerPool:
+    """Pool of per-partition asyncio workers processing queued webhooks.
+
+    ``concurrency`` bounds how many partitions process a delivery at the same
+    time (and so how many DB connections the pool holds); waiting partitions
+    are admitted in FIFO order so a busy partition cannot starve the others.
+    """
+
+    def __init__(
+        self,
+        partitions: Optional[Iterable[int]] = None,
+        concurrency: Optional[int] = None,
+        poll_interval_ms: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval_ms: Optional[int] = None
+    ):
+        self.partitions = (
+            list(partitions) if partitions is not None
+            else list(range(settings.webhook_partitions))
+        )
+        self.concurrency = concurrency or settings.worker_concurrency
+        self.poll_interval = (poll_interval_ms or settings.webhook_queue_poll_interval_ms) / 1000
+        self.batch_size = max(1, batch_size or settings.webhook_batch_size)
+        self.flush_interval = (
+            flush_interval_ms if flush_interval_ms is not None
+            else settings.webhook_batch_flush_ms
+        ) / 1000
+        self.max_retries = settings.worker_max_retries
+        self.partition_stats: Dict[int, Counter] = {
+            partition: Counter() for partition in self.partitions
+        }
+        self._stopping = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks: List[asyncio.Task] = []
+
+    async def run(self) -> None:
+        """Start one task per partition and wait until the pool is stopped."""
+        self._tasks = [
+            asyncio.create_task(self._partition_loop(partition))
+            for partition in self.partitions
+        ]
+        self._tasks.append(asyncio.create_task(self._stats_loop()))
+        self._tasks.append(asyncio.create_task(self._maintenance_loop()))
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await close_db()
+
+    def stop(self) -> None:
+        """Ask workers to exit after their current item."""
+        self._stopping.set()
+
+    def snapshot(self) -> Dict[int, Dict[str, Any]]:
+        """Get processed/failed counters and last observed lag per partition."""
+        return {
+            partition: dict(stats) for partition, stats in self.partition_stats.items()
+        }
+
+    async def _partition_loop(self, partition: int) -> None:
+        """Claim and process a partition's items in order until stopped."""
+        while not self._stopping.is_set():
+            async with self._slots:
+                items = await self._claim_batch(partition)
+                if items:
+                    await self._process_batch(partition, items)
+
+            if not items:
+                await self._idle()
+
+    async def _claim_batch(self, partition: int) -> List[WebhookQueueItem]:
+        """Claim up to ``batch_size`` items, waiting at most the flush interval."""
+        items: List[WebhookQueueItem] = []
+        deadline = time.monotonic() + self.flush_interval
+
+        async with AsyncSessionLocal() as db:
+            while len(items) < self.batch_size:
+                claimed = await claim_webhooks(
+                    db, limit=self.batch_size - len(items), partition=partition
+                )
+                items.extend(claimed)
+
+                remaining = deadline - time.monotonic()
+                if not items or remaining <= 0 or len(items) >= self.batch_size:
+                    break
+                if not claimed:
+                    await asyncio.sleep(min(remaining, self.poll_interval))
+
+        return items
+
+    async def _process_batch(self, partition: int, items: List[WebhookQueueItem]) -> None:
+        """Apply a batch in one transaction, falling back to one group at a time."""
+        groups = group_coalesced(items)
+        if len(groups) > 1:
+            async with AsyncSessionLocal() as db:
+                try:
+                    await webhook_handler.process_queued_batch(db, items)
+                except Exception as e:
+                    await db.rollback()
+                    logger.warning(
+                        "Webhook batch of %d in partition %d failed, retrying per group: %s",
+                        len(items), partition, e
+                    )
+                else:
+                    await complete_webhooks(db, items)
+                    self._record_processed(partition, items)
+                    return
+
+        for group in groups:
+            await self._process_group(partition, group)
+
+    async def _process_group(self, partition: int, items: List[WebhookQueueItem]) -> None:
+        """Process one delivery (or coalesced group) and dequeue or reschedule it."""
+        stats = self.partition_stats[partition]
+
+        async with AsyncSessionLocal() as db:
+            try:
+                await webhook_handler.process_queued_webhooks(db, items)
+            except Exception as e:
+                await db.rollback()
+                stats['failed'] += 1
+                attempts = max(item.attempts for item in items)
+                logger.warning(
+                    "Webhook %s (%s) in partition %d failed on attempt %d: %s",
+                    items[0].id, items[0].topic, partition, attempts, e
+                )
+                if attempts < self.max_retries:
+                    await retry_webhooks(db, items, str(e))
+                    return
+
+            await complete_webhooks(db, items)
+
+        self._record_processed(partition, items)
+
+    def _record_processed(self, partition: int, items: List[WebhookQueueItem]) -> None:
+        """Update processed count and lag for a partition."""
+        stats = self.partition_stats[partition]
+        stats['processed'] += len(items)
+        oldest = min(item.received_at for item in items)
+        stats['lag_ms'] = int((datetime.now(timezone.utc) - oldest).total_seconds() * 1000)
+
+    async def _stats_loop(self) -> None:
+        """Periodically log queue depth and lag for this pool's partitions."""
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=STATS_LOG_INTERVAL_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                async with AsyncSessionLocal() as db:
+                    queue_stats = await webhook_telemetry.refresh_queue_metrics(db)
+            except Exception as e:
+                logger.warning("Failed to read webhook queue stats: %s", e)
+                continue
+
+            for partition in self.partitions:
+                if partition in queue_stats:
+                    logger.info(
+                        "Webhook partition %d: depth=%d lag_ms=%d processed=%d failed=%d",
+                        partition,
+                        queue_stats[partition]['depth'],
+                        queue_stats[partition]['lag_ms'],
+                        self.partition_stats[partition]['processed'],
+                        self.partition_stats[partition]['failed'],
+                    )
+
+    async def _maintenance_loop(self) -> None:
+        """Keep webhook_events partitions created ahead and expired ones dropped."""
+        while not self._stopping.is_set():
+            try:
+                async with AsyncSessionLocal() as db:
+                    await maintain_webhook_event_partitions(db)
+            except Exception as e:
+                logger.warning("webhook_events partition maintenance failed: %s", e)
+
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=PARTITION_MAINTENANCE_INTERVAL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _idle(self) -> None:
+        """Sleep for the poll interval or until stopped."""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _run_pool(partitions: List[int], metrics_port: Optional[int] = None) -> None:
+    """Run a worker pool for the given partitions in this process."""
+    logging.basicConfig(level=settings.log_level)
+    if metrics_port:
+        start_http_server(metrics_port)
+    pool = WebhookWorkerPool(partitions=partitions)
+    try:
+        asyncio.run(pool.run())
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    """Run the webhook worker pool, optionally across several processes."""
+    parser = argparse.ArgumentParser(description="Drain the webhook ingest queue.")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+    parser.add_argument(
+        "--metrics-port", type=int, default=None,
+        help="Expose Prometheus metrics; process N listens on port + N"
+    )
+    args = parser.parse_args()
+
+    processes = max(1, min(args.processes, settings.webhook_partitions))
+    if processes == 1:
+        _run_pool(list(range(settings.webhook_partitions)), args.metrics_port)
+        return
+
+    # Each process owns a disjoint set of partitions, so per-partition ordering
+    # holds across processes. Spawn (not fork) so no engine state is inherited.
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=_run_pool,
+            args=(
+                list(range(index, settings.webhook_partitions, processes)),
+                args.metrics_port + index if args.metrics_port else None,
+            )
+        )
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
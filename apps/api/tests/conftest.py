@@ -0,0 +1,134 @@
+"""Shared fixtures.
+
+Settings are read from the environment at import time, so placeholders are
+set before anything from ``src`` is imported. Database tests run against
+``TEST_DATABASE_URL`` (a throwaway Postgres database whose tables are
+recreated) and are skipped when it is unset. Redis is replaced by fakeredis.
+"""
+
+import os
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+for name, value in {
+    "DATABASE_URL": "postgresql+asyncpg://localhost/profitpeek_test",
+    "REDIS_URL": "redis://localhost:6379/0",
+    "S3_ENDPOINT": "http://localhost:9000",
+    "S3_ACCESS_KEY_ID": "test",
+    "S3_SECRET_ACCESS_KEY": "test",
+    "S3_BUCKET": "test",
+    "SHOPIFY_API_KEY": "test",
+    "SHOPIFY_API_SECRET": "test",
+    "SHOPIFY_WEBHOOK_SECRET": "test",
+    "SHOPIFY_APP_URL": "http://localhost",
+    "SHOPIFY_REDIRECT_URI": "http://localhost/auth/callback",
+    "SMTP_HOST": "localhost",
+    "SMTP_USER": "test",
+    "SMTP_PASSWORD": "test",
+    "FROM_EMAIL": "test@example.com",
+    "JWT_SECRET": "test",
+    "ENCRYPTION_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+from fakeredis import aioredis as fake_aioredis
+from sqlalchemy import text
+
+from src.db import redis as redis_module
+from src.db.database import AsyncSessionLocal, engine
+from src.db.models import Base, Order, Settings, Shop
+from src.services.cost_resolver import cost_resolver
+from src.services.settings_cache import settings_cache
+from src.services.shop_cache import shop_cache
+
+_schema_ready = False
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """Point get_redis at an in-memory Redis and reset the process caches after each test."""
+    client = fake_aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_module, "_redis", client)
+    yield client
+    for cache in (shop_cache, settings_cache, cost_resolver):
+        cache.clear()
+        cache._listener = None
+
+
+@pytest.fixture
+async def db():
+    """A session on the test database; every table is emptied afterwards."""
+    global _schema_ready
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    if not _schema_ready:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        _schema_ready = True
+
+    async with AsyncSessionLocal() as session:
+        yield session
+
+    async with engine.begin() as conn:
+        tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+        await conn.execute(text(f"TRUNCATE {tables} CASCADE"))
+    # Connections belong to this test's event loop
+    await engine.dispose()
+
+
+async def create_shop(
+    db,
+    domain: str = "test-shop.myshopify.com",
+    currency: str = "USD",
+    **settings_values: Any
+) -> Shop:
+    """Add a shop, with a Settings row when any settings are given, and commit."""
+    shop = Shop(shop_domain=domain, access_token="token", currency=currency, scopes=[])
+    db.add(shop)
+    await db.flush()
+    if settings_values:
+        db.add(Settings(shop_id=shop.id, **settings_values))
+    await db.commit()
+    return shop
+
+
+async def create_order(
+    db,
+    shop: Shop,
+    shop_order_id: str,
+    total: str,
+    processed_at: Optional[datetime] = None,
+    presentment_currency: Optional[str] = None,
+    **values: Any
+) -> Order:
+    """Add an order (without committing) and flush it."""
+    processed_at = processed_at or datetime(2026, 10, 1, 12, tzinfo=timezone.utc)
+    order = Order(
+        shop_id=shop.id,
+        shop_order_id=shop_order_id,
+        created_at=processed_at,
+        processed_at=processed_at,
+        currency=shop.currency,
+        presentment_currency=presentment_currency or shop.currency,
+        current_total_price=Decimal(total),
+        financial_status="paid",
+        flags={},
+        **values
+    )
+    db.add(order)
+    await db.flush()
+    return order
+
+
+def money_set(amount: str, currency: str = "USD") -> Dict[str, Any]:
+    """A Shopify money set with the same shop and presentment amount."""
+    money = {"amount": amount, "currency_code": currency}
+    return {"shop_money": money, "presentment_money": money}
@@ -0,0 +1,54 @@
+"""Webhook delivery claims against the local LRU and Redis."""
+
+from src.utils import dedup as dedup_module
+from src.utils.dedup import WebhookDeduplicator
+
+
+class BrokenRedis:
+    async def set(self, *args, **kwargs):
+        raise ConnectionError("redis is down")
+
+
+async def test_repeat_claim_is_a_local_hit():
+    deduplicator = WebhookDeduplicator(max_size=10, ttl_seconds=60)
+
+    assert await deduplicator.claim("delivery-1")
+    assert not await deduplicator.claim("delivery-1")
+    assert deduplicator.stats['misses'] == 1
+    assert deduplicator.stats['local_hits'] == 1
+
+
+async def test_claim_seen_by_another_process_is_a_redis_hit():
+    first = WebhookDeduplicator(max_size=10, ttl_seconds=60)
+    second = WebhookDeduplicator(max_size=10, ttl_seconds=60)
+
+    assert await first.claim("delivery-1")
+    assert not await second.claim("delivery-1")
+    assert second.stats['redis_hits'] == 1
+
+
+async def test_evicted_claim_falls_back_to_redis():
+    deduplicator = WebhookDeduplicator(max_size=1, ttl_seconds=60)
+
+    assert await deduplicator.claim("delivery-1")
+    assert await deduplicator.claim("delivery-2")
+    assert not await deduplicator.claim("delivery-1")
+    assert deduplicator.stats['redis_hits'] == 1
+
+
+async def test_redis_error_lets_the_delivery_through(monkeypatch):
+    monkeypatch.setattr(dedup_module, "get_redis", lambda: BrokenRedis())
+    deduplicator = WebhookDeduplicator(max_size=10, ttl_seconds=60)
+
+    assert await deduplicator.claim("delivery-1")
+    assert deduplicator.stats['redis_errors'] == 1
+    # Still remembered locally
+    assert not await deduplicator.claim("delivery-1")
+
+
+async def test_released_delivery_can_be_claimed_again():
+    deduplicator = WebhookDeduplicator(max_size=10, ttl_seconds=60)
+
+    assert await deduplicator.claim("delivery-1")
+    await deduplicator.release("delivery-1")
+    assert await deduplicator.claim("delivery-1")
@@ -0,0 +1,134 @@
+"""Compiling fee_overrides and picking the rule for a transaction."""
+
+from decimal import Decimal
+
+import pytest
+
+from src.services.fee_rules import DEFAULT_RULE_NAME, FeeRules, get_fee_key
+
+DEFAULT_PCT = Decimal('0.029')
+DEFAULT_FIXED = Decimal('0.30')
+
+
+def compile_rules(fee_overrides) -> FeeRules:
+    return FeeRules.compile(fee_overrides, DEFAULT_PCT, DEFAULT_FIXED)
+
+
+def test_no_overrides_use_the_default():
+    rule = compile_rules(None).lookup('paypal', None, 'USD', False)
+
+    assert rule.name == DEFAULT_RULE_NAME
+    assert rule.pct == DEFAULT_PCT
+    assert rule.fixed == DEFAULT_FIXED
+
+
+def test_gateway_map_sets_the_percentage():
+    rules = compile_rules({'paypal': 3.49, 'stripe': '2.5'})
+
+    paypal = rules.lookup('paypal', 'Visa', 'USD', False)
+    assert paypal.pct == Decimal('0.0349')
+    assert paypal.fixed == DEFAULT_FIXED
+    assert rules.lookup('stripe', None, 'USD', False).pct == Decimal('0.025')
+    assert rules.lookup('manual', None, 'USD', False).name == DEFAULT_RULE_NAME
+
+
+def test_rule_with_more_fields_wins():
+    rules = compile_rules({
+        'shopify_payments': 2.9,
+        'rules': [
+            {'card_brand': 'American Express', 'pct': 3.9},
+            {'gateway': 'shopify_payments', 'card_brand': 'American Express', 'pct': 3.5},
+        ],
+    })
+
+    assert rules.lookup('shopify_payments', 'American Express', 'USD', False).pct == Decimal('0.035')
+    assert rules.lookup('stripe', 'American Express', 'USD', False).pct == Decimal('0.039')
+    assert rules.lookup('shopify_payments', 'Visa', 'USD', False).pct == Decimal('0.029')
+
+
+def test_ties_go_to_the_earlier_match_field():
+    rules = compile_rules({
+        'rules': [
+            {'currency_mismatch': True, 'pct': 4.4},
+            {'gateway': 'paypal', 'pct': 3.49},
+        ],
+    })
+
+    assert rules.lookup('paypal', None, 'EUR', True).pct == Decimal('0.0349')
+
+
+def test_later_rule_replaces_the_gateway_entry():
+    rules = compile_rules({'paypal': 3.49, 'rules': [{'gateway': 'paypal', 'pct': 3.0}]})
+
+    assert rules.lookup('paypal', None, 'USD', False).pct == Decimal('0.03')
+
+
+def test_rule_falls_back_to_its_gateway_entry():
+    rules = compile_rules({'paypal': 3.49, 'rules': [{'gateway': 'paypal', 'fixed': 0.49}]})
+
+    rule = rules.lookup('paypal', None, 'USD', False)
+    assert rule.pct == Decimal('0.0349')
+    assert rule.fixed == Decimal('0.49')
+
+
+def test_rule_without_gateway_falls_back_to_the_default():
+    rules = compile_rules({'rules': [{'currency': 'EUR', 'fixed': 0.25}]})
+
+    rule = rules.lookup('paypal', None, 'EUR', True)
+    assert rule.pct == DEFAULT_PCT
+    assert rule.fixed == Decimal('0.25')
+
+
+def test_currency_mismatch_rule():
+    rules = compile_rules({'rules': [{'currency_mismatch': True, 'pct': 4.4, 'name': 'international'}]})
+
+    assert rules.lookup(*get_fee_key('paypal', None, 'EUR', 'USD')).name == 'international'
+    assert rules.lookup(*get_fee_key('paypal', None, 'USD', 'USD')).name == DEFAULT_RULE_NAME
+
+
+def test_matching_ignores_case():
+    rules = compile_rules({
+        'PayPal': 3.49,
+        'rules': [{'gateway': 'Shopify_Payments', 'card_brand': 'AMERICAN EXPRESS', 'currency': 'usd', 'pct': 3.5}],
+    })
+
+    assert rules.lookup('paypal', None, 'USD', False).pct == Decimal('0.0349')
+    assert rules.lookup('shopify_payments', 'American Express', 'USD', False).pct == Decimal('0.035')
+
+
+def test_gateway_named_like_a_rule_field_is_a_gateway():
+    rules = compile_rules({'fixed': 1.5})
+
+    assert rules.lookup('fixed', None, 'USD', False).pct == Decimal('0.015')
+    assert rules.lookup('paypal', None, 'USD', False).name == DEFAULT_RULE_NAME
+
+
+def test_estimate_uses_the_matching_rule():
+    rules = compile_rules({'paypal': 3.49})
+
+    fee, rule = rules.estimate(Decimal('100.00'), 'paypal', None, 'USD', False)
+    assert fee == Decimal('3.79')
+    assert rule.name == 'gateway=paypal'
+
+
+def test_with_default_keeps_the_rules():
+    rules = compile_rules({'paypal': 3.49}).with_default(Decimal('0.026'), None)
+
+    assert rules.lookup('manual', None, 'USD', False).pct == Decimal('0.026')
+    assert rules.lookup('paypal', None, 'USD', False).pct == Decimal('0.0349')
+
+
+@pytest.mark.parametrize('fee_overrides', [
+    {'rules': [{'gateway': 'paypal', 'percent': 3.49}]},
+    {'rules': [{'pct': 3.49}]},
+    {'rules': [{'currency_mismatch': 'yes', 'pct': 4.4}]},
+    {'rules': {'gateway': 'paypal'}},
+    {'paypal': 'cheap'},
+    {'paypal': 101},
+    {'paypal': -1},
+    {'paypal': True},
+    ['paypal'],
+])
+def test_malformed_overrides_raise(fee_overrides):
+    with pytest.raises(ValueError):
+        compile_rules(fee_overrides)
@@ -0,0 +1,103 @@
+"""Picking the primary transaction of an order."""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Optional
+
+from src.db.models import Order, Transaction, TransactionFee
+from src.services.order_aggregate import OrderAggregate, load_order_aggregates
+
+from .conftest import create_order, create_shop, money_set
+
+
+def transaction(
+    shop_transaction_id: Optional[str],
+    gateway: str,
+    status: str = 'success',
+    processed_at: Optional[datetime] = None,
+    fee: Optional[str] = None
+) -> Transaction:
+    """A transient transaction, as built from a webhook payload (no created_at)."""
+    built = Transaction(
+        shop_transaction_id=shop_transaction_id,
+        gateway=gateway,
+        status=status,
+        amount_set=money_set('50.00'),
+        amount=Decimal('50.00'),
+        presentment_amount=Decimal('50.00'),
+        processed_at=processed_at
+    )
+    built.fees = [TransactionFee(fee_amount=Decimal(fee), estimated=False)] if fee else []
+    return built
+
+
+def transient_order(transactions) -> Order:
+    order = Order(
+        processed_at=datetime(2026, 10, 1, 12, tzinfo=timezone.utc),
+        currency='USD',
+        presentment_currency='USD',
+        current_total_price=Decimal('100.00')
+    )
+    order.lines = []
+    order.refunds = []
+    order.transactions = transactions
+    return order
+
+
+def at(hour: int) -> datetime:
+    return datetime(2026, 10, 1, hour, tzinfo=timezone.utc)
+
+
+def test_first_successful_transaction_by_processed_at_is_primary():
+    order = transient_order([
+        transaction('12', 'paypal', processed_at=at(13), fee='1.00'),
+        transaction('11', 'manual', status='failure', processed_at=at(11)),
+        transaction('10', 'shopify_payments', processed_at=at(12), fee='2.00'),
+    ])
+
+    aggregate = OrderAggregate.from_order(order)
+
+    assert aggregate.gateway == 'shopify_payments'
+    assert aggregate.fees == Decimal('3.00')
+
+
+def test_transactions_without_timestamps_sort_by_shopify_id():
+    order = transient_order([
+        transaction('100', 'paypal'),
+        transaction('99', 'shopify_payments'),
+        transaction(None, 'manual'),
+    ])
+
+    assert OrderAggregate.from_order(order).gateway == 'shopify_payments'
+
+
+def test_timestamped_transactions_come_before_untimed_ones():
+    order = transient_order([
+        transaction('1', 'manual'),
+        transaction('2', 'paypal', processed_at=at(12)),
+    ])
+
+    assert OrderAggregate.from_order(order).gateway == 'paypal'
+
+
+async def test_loaded_aggregate_picks_the_same_primary(db):
+    shop = await create_shop(db)
+    order = await create_order(db, shop, '1001', '100.00')
+    # One multi-row insert: every row gets the same created_at
+    for shop_transaction_id, gateway in (('100', 'paypal'), ('99', 'shopify_payments'), ('101', 'stripe')):
+        db.add(Transaction(
+            shop_id=shop.id,
+            order_id=order.id,
+            shop_transaction_id=shop_transaction_id,
+            gateway=gateway,
+            status='success',
+            amount_set=money_set('50.00'),
+            amount=Decimal('50.00'),
+            presentment_amount=Decimal('50.00'),
+            created_at=at(14)
+        ))
+    await db.commit()
+
+    [aggregate] = await load_order_aggregates(db, shop.id, order_ids=[order.id])
+
+    assert aggregate.gateway == 'shopify_payments'
@@ -0,0 +1,192 @@
+"""Re-costing stored lines, order profit and rollups after snapshots change."""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Optional
+
+import pytest
+from sqlalchemy import select
+
+from src.db.models import DailyRollup, InventoryItemCostSnapshot, OrderLine, OrderProfit, RefundLine
+from src.services.profit_calculator import ProfitCalculator
+from src.services.recosting import recosting_service
+from src.services.rollup_service import get_rollup_date, rollup_service
+
+from .conftest import create_order, create_shop, money_set
+
+ITEM = 'item-1'
+SEPTEMBER = datetime(2026, 9, 1, tzinfo=timezone.utc)
+OCTOBER_5 = datetime(2026, 10, 5, tzinfo=timezone.utc)
+EARLY_ORDER = datetime(2026, 10, 1, 12, tzinfo=timezone.utc)
+LATE_ORDER = datetime(2026, 10, 10, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    """Record the runs snapshot commits would start instead of running them."""
+    runs = []
+    monkeypatch.setattr(
+        recosting_service, "_schedule",
+        lambda shop_id, snapshots: runs.append((shop_id, sorted(snapshots)))
+    )
+    return runs
+
+
+def add_snapshot(db, shop, effective_date: datetime, unit_cost: str) -> InventoryItemCostSnapshot:
+    snapshot = InventoryItemCostSnapshot(
+        shop_id=shop.id,
+        inventory_item_id=ITEM,
+        effective_date=effective_date,
+        unit_cost=Decimal(unit_cost),
+        currency=shop.currency,
+        source='api'
+    )
+    db.add(snapshot)
+    return snapshot
+
+
+async def create_costed_order(db, shop, shop_order_id: str, processed_at: datetime, refunded: int = 0):
+    """An order of two units costed at 10.00, with its profit stored."""
+    order = await create_order(db, shop, shop_order_id, '100.00', processed_at=processed_at)
+    db.add(OrderLine(
+        shop_id=shop.id,
+        order_id=order.id,
+        line_id=shop_order_id,
+        product_id='product-1',
+        variant_id='variant-1',
+        inventory_item_id=ITEM,
+        quantity=2,
+        price_set=money_set('50.00'),
+        price=Decimal('50.00'),
+        presentment_price=Decimal('50.00'),
+        presentment_currency=shop.currency,
+        shop_currency=shop.currency,
+        effective_unit_cost=Decimal('10.00'),
+        cost_source='api'
+    ))
+    if refunded:
+        db.add(RefundLine(
+            shop_id=shop.id,
+            order_id=order.id,
+            line_id=shop_order_id,
+            refunded_quantity=refunded,
+            refunded_amount_set=money_set('50.00'),
+            refunded_amount=Decimal('50.00'),
+            presentment_refunded_amount=Decimal('50.00')
+        ))
+    await db.flush()
+
+    columns = await ProfitCalculator().calculate_orders_profit(db, shop.id, order_ids=[order.id])
+    await rollup_service.store_order_profits(db, shop.id, [(order.id, processed_at, columns.row(0))])
+    return order
+
+
+async def get_line(db, order) -> OrderLine:
+    result = await db.execute(
+        select(OrderLine)
+        .where(OrderLine.order_id == order.id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
+async def get_profit(db, order) -> OrderProfit:
+    result = await db.execute(
+        select(OrderProfit)
+        .where(OrderProfit.order_id == order.id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
+async def get_rollup_cogs(db, shop, processed_at: datetime) -> Optional[Decimal]:
+    result = await db.execute(
+        select(DailyRollup.cogs)
+        .where(DailyRollup.shop_id == shop.id, DailyRollup.date == get_rollup_date(processed_at))
+    )
+    return result.scalar_one()
+
+
+async def create_history(db):
+    """Two orders of one item, both governed by a September snapshot."""
+    shop = await create_shop(db)
+    snapshot = add_snapshot(db, shop, SEPTEMBER, '10.00')
+    early = await create_costed_order(db, shop, '1001', EARLY_ORDER)
+    late = await create_costed_order(db, shop, '1002', LATE_ORDER, refunded=1)
+    await db.commit()
+    return shop, snapshot, early, late
+
+
+async def test_new_snapshot_recosts_only_later_orders(db, scheduled):
+    shop, _, early, late = await create_history(db)
+    net_profit_before = (await get_profit(db, late)).net_profit
+
+    add_snapshot(db, shop, OCTOBER_5, '13.00')
+    await db.commit()
+    assert scheduled[-1] == (shop.id, [(ITEM, OCTOBER_5)])
+
+    counts = await recosting_service.recost_batch(db, shop.id, [(ITEM, OCTOBER_5)])
+    await db.commit()
+
+    assert counts == {'lines': 1, 'orders': 1, 'days': 1}
+    assert (await get_line(db, early)).effective_unit_cost == Decimal('10.00')
+    assert (await get_line(db, late)).effective_unit_cost == Decimal('13.00')
+    # One unit was refunded, so COGS moves by one unit's difference
+    profit = await get_profit(db, late)
+    assert profit.cogs == Decimal('13.00')
+    assert profit.net_profit == net_profit_before - Decimal('3.00')
+    assert await get_rollup_cogs(db, shop, LATE_ORDER) == Decimal('13.00')
+    assert await get_rollup_cogs(db, shop, EARLY_ORDER) == Decimal('20.00')
+
+
+async def test_recosting_again_changes_nothing(db, scheduled):
+    shop, _, _, _ = await create_history(db)
+    add_snapshot(db, shop, OCTOBER_5, '13.00')
+    await db.commit()
+
+    await recosting_service.recost_batch(db, shop.id, [(ITEM, OCTOBER_5)])
+    await db.commit()
+    counts = await recosting_service.recost_batch(db, shop.id, [(ITEM, OCTOBER_5)])
+
+    assert counts == {'lines': 0, 'orders': 0, 'days': 0}
+
+
+async def test_deleting_the_governing_snapshot_clears_the_cost(db, scheduled):
+    shop, snapshot, early, late = await create_history(db)
+
+    await db.delete(snapshot)
+    await db.commit()
+    assert scheduled[-1] == (shop.id, [(ITEM, SEPTEMBER)])
+
+    counts = await recosting_service.recost_batch(db, shop.id, [(ITEM, SEPTEMBER)])
+    await db.commit()
+
+    assert counts == {'lines': 2, 'orders': 2, 'days': 2}
+    for order, processed_at in ((early, EARLY_ORDER), (late, LATE_ORDER)):
+        line = await get_line(db, order)
+        assert line.effective_unit_cost is None
+        assert line.cost_source == 'null'
+        profit = await get_profit(db, order)
+        assert profit.cogs == Decimal('0.00')
+        assert profit.flags.get('no_unit_cost') is True
+        assert await get_rollup_cogs(db, shop, processed_at) == Decimal('0.00')
+
+
+async def test_deleting_a_later_snapshot_restores_the_earlier_cost(db, scheduled):
+    shop, _, early, late = await create_history(db)
+    october = add_snapshot(db, shop, OCTOBER_5, '13.00')
+    await db.commit()
+    await recosting_service.recost_batch(db, shop.id, [(ITEM, OCTOBER_5)])
+    await db.commit()
+
+    await db.delete(october)
+    await db.commit()
+    counts = await recosting_service.recost_batch(db, shop.id, [(ITEM, OCTOBER_5)])
+    await db.commit()
+
+    assert counts['lines'] == 1
+    line = await get_line(db, late)
+    assert line.effective_unit_cost == Decimal('10.00')
+    assert line.cost_source == 'api'
+    assert (await get_profit(db, late)).cogs == Decimal('10.00')
+    assert await get_rollup_cogs(db, shop, LATE_ORDER) == Decimal('10.00')
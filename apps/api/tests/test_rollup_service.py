@@ -0,0 +1,142 @@
+"""Daily rollups as the sum of stored order profits."""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict
+
+from sqlalchemy import select
+
+from src.db.models import DailyRollup
+from src.services.rollup_rebuild import rebuild_shop_rollups
+from src.services.rollup_service import get_rollup_date, rollup_service
+
+from .conftest import create_order, create_shop
+
+DAY_ONE = datetime(2026, 10, 1, 12, tzinfo=timezone.utc)
+DAY_TWO = datetime(2026, 10, 2, 12, tzinfo=timezone.utc)
+
+
+def profit(net_revenue: str, cogs: str, fees: str = '0', shipping_cost: str = '0') -> Dict[str, Any]:
+    net_profit = Decimal(net_revenue) - Decimal(cogs) - Decimal(fees) - Decimal(shipping_cost)
+    return {
+        'net_revenue': Decimal(net_revenue),
+        'cogs': Decimal(cogs),
+        'fees': Decimal(fees),
+        'shipping_cost': Decimal(shipping_cost),
+        'ad_spend': Decimal('0'),
+        'net_profit': net_profit,
+        'margin_pct': Decimal('0'),
+        'flags': {},
+    }
+
+
+async def get_rollup(db, shop, processed_at: datetime) -> DailyRollup:
+    result = await db.execute(
+        select(DailyRollup)
+        .where(DailyRollup.shop_id == shop.id, DailyRollup.date == get_rollup_date(processed_at))
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
+
+
+async def test_restoring_an_order_replaces_its_contribution(db):
+    shop = await create_shop(db)
+    order = await create_order(db, shop, '1001', '100.00', processed_at=DAY_ONE)
+    other = await create_order(db, shop, '1002', '50.00', processed_at=DAY_ONE)
+
+    await rollup_service.store_order_profits(db, shop.id, [
+        (order.id, DAY_ONE, profit('100.00', '40.00', fees='3.20')),
+        (other.id, DAY_ONE, profit('50.00', '20.00')),
+    ])
+    await db.commit()
+    # Recalculated after a refund
+    await rollup_service.store_order_profits(db, shop.id, [
+        (order.id, DAY_ONE, profit('80.00', '40.00', fees='3.20')),
+    ])
+    await db.commit()
+
+    rollup = await get_rollup(db, shop, DAY_ONE)
+    assert rollup.net_revenue == Decimal('130.00')
+    assert rollup.cogs == Decimal('60.00')
+    assert rollup.fees == Decimal('3.20')
+    assert rollup.net_profit == Decimal('66.80')
+    assert rollup.margin_pct == Decimal('51.38')
+
+
+async def test_restoring_the_same_profit_is_idempotent(db):
+    shop = await create_shop(db)
+    order = await create_order(db, shop, '1001', '100.00', processed_at=DAY_ONE)
+
+    for _ in range(3):
+        await rollup_service.store_order_profits(db, shop.id, [
+            (order.id, DAY_ONE, profit('100.00', '40.00')),
+        ])
+        await db.commit()
+
+    rollup = await get_rollup(db, shop, DAY_ONE)
+    assert rollup.net_revenue == Decimal('100.00')
+    assert rollup.net_profit == Decimal('60.00')
+
+
+async def test_moving_an_order_moves_its_contribution(db):
+    shop = await create_shop(db)
+    order = await create_order(db, shop, '1001', '100.00', processed_at=DAY_ONE)
+
+    await rollup_service.store_order_profits(db, shop.id, [
+        (order.id, DAY_ONE, profit('100.00', '40.00')),
+    ])
+    await db.commit()
+    await rollup_service.store_order_profits(db, shop.id, [
+        (order.id, DAY_TWO, profit('100.00', '40.00')),
+    ])
+    await db.commit()
+
+    old_day = await get_rollup(db, shop, DAY_ONE)
+    assert old_day.net_revenue == Decimal('0.00')
+    assert old_day.net_profit == Decimal('0.00')
+    new_day = await get_rollup(db, shop, DAY_TWO)
+    assert new_day.net_revenue == Decimal('100.00')
+    assert new_day.net_profit == Decimal('60.00')
+
+
+async def test_restoring_keeps_the_days_ad_spend(db):
+    shop = await create_shop(db)
+    order = await create_order(db, shop, '1001', '100.00', processed_at=DAY_ONE)
+
+    await rollup_service.store_order_profits(db, shop.id, [
+        (order.id, DAY_ONE, profit('100.00', '40.00')),
+    ])
+    await rollup_service.set_ad_spend(db, shop.id, {
+        get_rollup_date(DAY_ONE): {'meta': Decimal('15.00')},
+    })
+    await db.commit()
+    await rollup_service.store_order_profits(db, shop.id, [
+        (order.id, DAY_ONE, profit('90.00', '40.00')),
+    ])
+    await db.commit()
+
+    rollup = await get_rollup(db, shop, DAY_ONE)
+    assert rollup.ad_spend == {'meta': 15.0}
+    assert rollup.net_profit == Decimal('35.00')
+
+
+async def test_rebuild_sums_every_order_and_can_be_repeated(db):
+    shop = await create_shop(db, shipping_cost_rule={"type": "flat", "value": 5})
+    await create_order(db, shop, '1001', '100.00', processed_at=DAY_ONE)
+    await create_order(db, shop, '1002', '50.00', processed_at=DAY_ONE)
+    await create_order(db, shop, '1003', '20.00', processed_at=DAY_TWO)
+    await db.commit()
+
+    for _ in range(2):
+        summary = await rebuild_shop_rollups(shop.id, batch_size=2)
+        assert summary == {'orders': 3, 'batches': 2}
+
+    # 2.9% + 0.30 estimated fees and flat 5.00 shipping per order
+    rollup = await get_rollup(db, shop, DAY_ONE)
+    assert rollup.net_revenue == Decimal('150.00')
+    assert rollup.fees == Decimal('4.95')
+    assert rollup.shipping_cost == Decimal('10.00')
+    assert rollup.net_profit == Decimal('135.05')
+    rollup = await get_rollup(db, shop, DAY_TWO)
+    assert rollup.net_revenue == Decimal('20.00')
+    assert rollup.net_profit == Decimal('14.12')
@@ -0,0 +1,169 @@
+"""Scenario figures against ProfitCalculator's."""
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import select
+
+from src.db.models import OrderLine, RefundLine, Settings, Transaction, TransactionFee
+from src.services.profit_calculator import ProfitCalculator
+from src.services.scenario_engine import RESULT_FIELDS, ScenarioEngine
+
+from .conftest import create_order, create_shop, money_set
+
+START = datetime(2026, 10, 1, tzinfo=timezone.utc)
+END = datetime(2026, 10, 31, 23, 59, 59, tzinfo=timezone.utc)
+
+FEE_OVERRIDES = {
+    "paypal": 3.49,
+    "rules": [
+        {"gateway": "shopify_payments", "card_brand": "American Express", "pct": 3.5},
+        {"currency_mismatch": True, "pct": 4.4, "name": "international"},
+    ],
+}
+
+
+def add_line(db, order, line_id: str, quantity: int, price: str, unit_cost: Optional[str]) -> None:
+    db.add(OrderLine(
+        shop_id=order.shop_id,
+        order_id=order.id,
+        line_id=line_id,
+        product_id=f"product-{line_id}",
+        variant_id=f"variant-{line_id}",
+        inventory_item_id=f"item-{line_id}",
+        quantity=quantity,
+        price_set=money_set(price),
+        price=Decimal(price),
+        presentment_price=Decimal(price),
+        presentment_currency=order.presentment_currency,
+        shop_currency=order.currency,
+        effective_unit_cost=Decimal(unit_cost) if unit_cost else None,
+        cost_source='snapshot' if unit_cost else 'null'
+    ))
+
+
+def add_refund(db, order, line_id: str, quantity: int, amount: str) -> None:
+    db.add(RefundLine(
+        shop_id=order.shop_id,
+        order_id=order.id,
+        line_id=line_id,
+        refunded_quantity=quantity,
+        refunded_amount_set=money_set(amount),
+        refunded_amount=Decimal(amount),
+        presentment_refunded_amount=Decimal(amount)
+    ))
+
+
+async def add_transaction(
+    db,
+    order,
+    gateway: str,
+    status: str = 'success',
+    card_brand: Optional[str] = None,
+    fee: Optional[str] = None,
+    offset_minutes: int = 0
+) -> None:
+    transaction = Transaction(
+        shop_id=order.shop_id,
+        order_id=order.id,
+        gateway=gateway,
+        card_brand=card_brand,
+        status=status,
+        amount_set=money_set(str(order.current_total_price)),
+        amount=order.current_total_price,
+        presentment_amount=order.current_total_price,
+        created_at=order.processed_at + timedelta(minutes=offset_minutes)
+    )
+    db.add(transaction)
+    await db.flush()
+    if fee is not None:
+        db.add(TransactionFee(
+            shop_id=order.shop_id,
+            transaction_id=transaction.id,
+            fee_amount_set=money_set(fee),
+            fee_amount=Decimal(fee),
+            presentment_fee_amount=Decimal(fee),
+            currency=order.currency,
+            presentment_currency=order.presentment_currency
+        ))
+
+
+async def create_period(db):
+    """A shop whose orders exercise every profit input."""
+    shop = await create_shop(
+        db,
+        fee_default_pct=Decimal('2.9'),
+        fee_overrides=FEE_OVERRIDES,
+        shipping_cost_rule={"type": "percentage", "value": 5}
+    )
+
+    # Partly refunded, one line without a cost, fee from the gateway map
+    order = await create_order(db, shop, '1001', '120.00')
+    add_line(db, order, '1', 2, '40.00', '30.00')
+    add_line(db, order, '2', 1, '40.00', None)
+    add_refund(db, order, '1', 1, '40.00')
+    await add_transaction(db, order, 'paypal')
+
+    # Recorded fee
+    order = await create_order(db, shop, '1002', '80.00')
+    add_line(db, order, '3', 4, '20.00', '7.25')
+    await add_transaction(db, order, 'shopify_payments', card_brand='Visa', fee='2.62')
+
+    # Failed attempt first; the successful card payment picks the rule
+    order = await create_order(db, shop, '1003', '50.00')
+    add_line(db, order, '4', 1, '50.00', '18.00')
+    await add_transaction(db, order, 'manual', status='failure')
+    await add_transaction(db, order, 'shopify_payments', card_brand='American Express', offset_minutes=1)
+
+    # Paid in another currency
+    order = await create_order(db, shop, '1004', '64.10', presentment_currency='EUR')
+    add_line(db, order, '5', 1, '64.10', '25.00')
+    await add_transaction(db, order, 'shopify_payments', card_brand='Visa')
+
+    # No transactions at all, outside the period
+    order = await create_order(db, shop, '1005', '30.00')
+    await create_order(db, shop, '1006', '999.00', processed_at=END + timedelta(days=1))
+
+    await db.commit()
+    return shop
+
+
+async def calculator_totals(db, shop):
+    columns = await ProfitCalculator().calculate_orders_profit(
+        db, shop.id, date_range={'start': START, 'end': END}
+    )
+    return columns.totals(), len(columns)
+
+
+async def test_baseline_matches_profit_calculator(db):
+    shop = await create_period(db)
+
+    result = await ScenarioEngine().run(db, shop.id, START, END, [])
+    totals, orders_count = await calculator_totals(db, shop)
+
+    baseline = result['baseline']
+    assert baseline['orders_count'] == orders_count == 5
+    for field in RESULT_FIELDS:
+        assert abs(Decimal(str(baseline[field])) - totals[field]) <= Decimal('0.01'), field
+    # paypal 3.49%, recorded, amex 3.5%, international 4.4%, default 2.9%; 0.30 fixed each
+    assert baseline['fees'] == 13.45
+
+
+async def test_scenario_matches_calculator_with_the_same_settings(db):
+    shop = await create_period(db)
+    scenario = {'fee_pct': 2.6, 'shipping': {'type': 'flat', 'value': 7}}
+
+    result = await ScenarioEngine().run(db, shop.id, START, END, [scenario])
+
+    settings_row = (await db.execute(
+        select(Settings).where(Settings.shop_id == shop.id)
+    )).scalar_one()
+    settings_row.fee_default_pct = Decimal('2.6')
+    settings_row.shipping_cost_rule = {"type": "flat", "value": 7}
+    await db.commit()
+    totals, _ = await calculator_totals(db, shop)
+
+    figures = result['scenarios'][0]
+    for field in RESULT_FIELDS:
+        assert abs(Decimal(str(figures[field])) - totals[field]) <= Decimal('0.01'), field
@@ -0,0 +1,115 @@
+"""Order graph upserts and their version checks."""
+
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from src.db.models import InventoryItemCostSnapshot, Order, OrderLine
+from src.services import webhook_processor as webhook_processor_module
+from src.services.recosting import recosting_service
+from src.services.webhook_processor import WebhookProcessor
+
+from .conftest import create_shop, money_set
+
+
+@pytest.fixture
+def processor(monkeypatch) -> WebhookProcessor:
+    # Payloads below have no line items, so Shopify is never called
+    monkeypatch.setattr(webhook_processor_module, "ShopifyClient", lambda: None)
+    return WebhookProcessor()
+
+
+class FakeShopifyClient:
+    def __init__(self, costs):
+        self.costs = costs
+        self.requested = []
+
+    async def get_inventory_item_costs(self, shop, inventory_item_ids):
+        self.requested.append(list(inventory_item_ids))
+        return {item_id: self.costs[item_id] for item_id in inventory_item_ids if item_id in self.costs}
+
+
+def order_payload(updated_at: str, total: str, order_id: int = 1001) -> dict:
+    return {
+        'id': order_id,
+        'order_number': 1,
+        'created_at': '2026-10-01T12:00:00Z',
+        'updated_at': updated_at,
+        'currency': 'USD',
+        'total_price': total,
+        'financial_status': 'paid',
+        'line_items': [],
+        'transactions': [],
+    }
+
+
+async def get_order(db, shop) -> Order:
+    result = await db.execute(
+        select(Order)
+        .where(Order.shop_id == shop.id, Order.shop_order_id == '1001')
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
+async def test_newer_delivery_updates_order(db, processor):
+    shop = await create_shop(db)
+
+    assert await processor.process_order_create(db, shop, order_payload('2026-10-01T12:00:00Z', '100.00'))
+    assert await processor.process_order_update(db, shop, order_payload('2026-10-01T13:00:00Z', '80.00'))
+
+    order = await get_order(db, shop)
+    assert order.current_total_price == Decimal('80.00')
+    assert processor.stale_skips['orders/updated'] == 0
+
+
+async def test_older_delivery_is_skipped(db, processor):
+    shop = await create_shop(db)
+
+    assert await processor.process_order_update(db, shop, order_payload('2026-10-01T13:00:00Z', '80.00'))
+    # Arrives late, after the newer version was stored
+    assert not await processor.process_order_create(db, shop, order_payload('2026-10-01T12:00:00Z', '100.00'))
+
+    order = await get_order(db, shop)
+    assert order.current_total_price == Decimal('80.00')
+    assert processor.stale_skips['orders/create'] == 1
+
+
+async def test_redelivered_version_is_skipped(db, processor):
+    shop = await create_shop(db)
+    payload = order_payload('2026-10-01T12:00:00Z', '100.00')
+
+    assert await processor.process_order_create(db, shop, payload)
+    assert not await processor.process_order_create(db, shop, payload)
+
+    order = await get_order(db, shop)
+    assert order.current_total_price == Decimal('100.00')
+    assert processor.stale_skips['orders/create'] == 1
+
+
+async def test_zero_unit_cost_from_shopify_is_a_real_cost(db, processor, monkeypatch):
+    monkeypatch.setattr(recosting_service, "_schedule", lambda shop_id, snapshots: None)
+    processor.shopify_client = FakeShopifyClient({'501': Decimal('0')})
+    shop = await create_shop(db)
+
+    for order_id in (1001, 1002):
+        payload = order_payload('2026-10-01T12:00:00Z', '25.00', order_id=order_id)
+        payload['line_items'] = [{
+            'id': order_id * 10,
+            'product_id': 7,
+            'variant_id': 8,
+            'inventory_item_id': 501,
+            'quantity': 1,
+            'price_set': money_set('25.00'),
+        }]
+        assert await processor.process_order_create(db, shop, payload)
+
+    # Stored as a snapshot, so the second order needs no fetch
+    assert processor.shopify_client.requested == [['501']]
+    snapshots = (await db.execute(select(InventoryItemCostSnapshot))).scalars().all()
+    assert [snapshot.unit_cost for snapshot in snapshots] == [Decimal('0.00')]
+    lines = (await db.execute(select(OrderLine))).scalars().all()
+    assert {(line.effective_unit_cost, line.cost_source) for line in lines} == {(Decimal('0.00'), 'api')}
+    order = await get_order(db, shop)
+    assert 'no_unit_cost' not in order.flags
@@ -187,9 +187,31 @@ export const DashboardSummaryRequestSchema = z.object({
   shop_id: z.string().optional(),
 });
 
+export const FeeOverrideRuleSchema = z.object({
+  gateway: z.string().optional(),
+  card_brand: z.string().optional(),
+  currency: z.string().length(3).optional(),
+  currency_mismatch: z.boolean().optional(),
+  pct: z.number().min(0).max(100).optional(),
+  fixed: z.number().min(0).optional(),
+  name: z.string().optional(),
+}).strict().refine(
+  (rule) => [rule.gateway, rule.card_brand, rule.currency, rule.currency_mismatch].some((value) => value !== undefined),
+  { message: 'Fee rule must match on gateway, card_brand, currency or currency_mismatch' }
+);
+
+// Gateway name -> percentage; only the reserved `rules` key holds a rule list
+export const FeeOverridesSchema = z.record(
+  z.string(),
+  z.union([z.number().min(0).max(100), z.array(FeeOverrideRuleSchema)])
+).refine(
+  (overrides) => Object.entries(overrides).every(([key, value]) => (key === 'rules') === Array.isArray(value)),
+  { message: 'fee_overrides maps gateways to percentages, plus an optional "rules" list' }
+);
+
 export const SettingsUpdateSchema = z.object({
   fee_default_pct: z.number().min(0).max(100).optional(),
-  fee_overrides: z.record(z.string(), z.number().min(0).max(100)).optional(),
+  fee_overrides: FeeOverridesSchema.optional(),
   shipping_cost_rule: z.object({
     type: z.enum(['flat', 'percentage']),
     value: z.number().min(0),
@@ -133,7 +133,7 @@ export interface Settings {
   id: string;
   shop_id: string;
   fee_default_pct: number;
-  fee_overrides: Record<string, number>;
+  fee_overrides: FeeOverrides;
   shipping_cost_rule: ShippingCostRule;
   digest_local_time: string;
   ad_spend_channels: string[];
@@ -167,6 +167,24 @@ export interface ShippingCostRule {
   currency?: string;
 }
 
+// Processing fee rule; omitted match fields match anything, and pct (0-100)
+// and fixed default to the gateway's percentage, then the shop default
+export interface FeeOverrideRule {
+  gateway?: string;
+  card_brand?: string;
+  currency?: string;
+  currency_mismatch?: boolean;
+  pct?: number;
+  fixed?: number;
+  name?: string;
+}
+
+// Gateway name -> fee percentage (0-100), plus optional finer-grained rules
+// under the reserved `rules` key
+export type FeeOverrides = Record<string, number | FeeOverrideRule[]> & {
+  rules?: FeeOverrideRule[];
+};
+
 export interface OrderFlags {
   fees_estimated?: boolean;
   no_unit_cost?: boolean;